@@ -0,0 +1,54 @@
+import collections
+import typing
+
+if typing.TYPE_CHECKING:
+    from .mesh.mesh import MeshBuffers
+
+
+# Converted buffers of deformed meshes (shape keys, armatures, ...) per (mesh cache key, frame).
+# Frame changes move the invalidated buffers here instead of dropping them, so looping playback and scrubbing
+# reuse already converted (and uploaded) frames. Least recently used frames are dropped past the memory budget.
+class AnimationCache:
+    def __init__(self):
+        self.frames: collections.OrderedDict[tuple[str, float], "MeshBuffers"] = collections.OrderedDict()
+        self.size = 0
+        self.budget = 0  # bytes, 0 disables the cache
+
+    @staticmethod
+    def get_entry_size(render_obj: "MeshBuffers") -> int:
+        return render_obj.get_gpu_size() * 2  # CPU copies and GPU buffers
+
+    def store(self, mesh_id: str, render_obj: "MeshBuffers"):
+        if self.budget <= 0 or render_obj.frame is None:
+            return
+        key = (mesh_id, render_obj.frame)
+        if key in self.frames:
+            self.frames.move_to_end(key)
+            return
+        self.frames[key] = render_obj
+        self.size += self.get_entry_size(render_obj)
+        self.trim()
+
+    def trim(self):
+        while self.size > self.budget and self.frames:
+            _, dropped = self.frames.popitem(last=False)
+            self.size -= self.get_entry_size(dropped)
+
+    def get(self, mesh_id: str, frame: float) -> "MeshBuffers | None":
+        render_obj = self.frames.get((mesh_id, frame))
+        if render_obj is not None:
+            self.frames.move_to_end((mesh_id, frame))
+        return render_obj
+
+    def discard_mesh(self, mesh_name: str):  # the mesh itself was edited, all its frames are outdated
+        for key in [key for key, render_obj in self.frames.items() if render_obj.mesh_name == mesh_name]:
+            self.size -= self.get_entry_size(self.frames.pop(key))
+
+    def set_budget(self, budget: int):
+        if budget != self.budget:
+            self.budget = budget
+            self.trim()
+
+    def clear(self):
+        self.frames.clear()
+        self.size = 0
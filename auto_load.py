@@ -1,6 +1,7 @@
 import os
 import bpy
 import sys
+import time
 import typing
 import inspect
 import pkgutil
@@ -17,25 +18,62 @@ blender_version = bpy.app.version
 
 modules = None
 ordered_classes = None
+timings: dict[str, float] = {}  # startup stage or module name -> ms
+PRINT_TIMINGS = False  # print a startup report after registering, for profiling the addon load
+
+REGISTER_BASE_TYPE_NAMES = [
+    "Panel",
+    "Operator",
+    "PropertyGroup",
+    "AddonPreferences",
+    "Header",
+    "Menu",
+    "Node",
+    "NodeSocket",
+    "NodeTree",
+    "UIList",
+    "RenderEngine",
+    "Gizmo",
+    "GizmoGroup",
+]
 
 
 def init():
     global modules
     global ordered_classes
 
+    timings.clear()
+    t = time.perf_counter()
     modules = get_all_submodules(Path(__file__).parent)
+    timings["import"] = (time.perf_counter() - t) * 1000
+    t = time.perf_counter()
     ordered_classes = get_ordered_classes_to_register(modules)
+    timings["class order"] = (time.perf_counter() - t) * 1000
 
 
 def register():
+    t = time.perf_counter()
     for cls in ordered_classes:
         bpy.utils.register_class(cls)
+    timings["register classes"] = (time.perf_counter() - t) * 1000
 
     for module in modules:
         if module.__name__ == __name__:
             continue
         if hasattr(module, "register"):
+            t = time.perf_counter()
             module.register()
+            timings[f"register {module.__name__}"] = (time.perf_counter() - t) * 1000
+
+    if PRINT_TIMINGS:
+        print_timings()
+
+
+def print_timings():
+    total = sum(value for name, value in timings.items() if not name.startswith("import "))
+    slowest = sorted(((value, name) for name, value in timings.items() if name != "import"), reverse=True)[:3]
+    details = ", ".join(f"{name} {value:.1f}" for value, name in slowest)
+    print(f"f64render: startup {total:.1f} ms (slowest: {details})")
 
 
 def unregister():
@@ -59,7 +97,10 @@ def get_all_submodules(directory):
 
 def iter_submodules(path, package_name):
     for name in sorted(iter_submodule_names(path)):
-        yield importlib.import_module("." + name, package_name)
+        t = time.perf_counter()
+        module = importlib.import_module("." + name, package_name)
+        timings[f"import {name}"] = (time.perf_counter() - t) * 1000  # includes modules imported by it
+        yield module
 
 
 def iter_submodule_names(path, root=""):
@@ -146,24 +187,7 @@ def iter_classes_in_module(module):
 
 
 def get_register_base_types():
-    return set(
-        getattr(bpy.types, name)
-        for name in [
-            "Panel",
-            "Operator",
-            "PropertyGroup",
-            "AddonPreferences",
-            "Header",
-            "Menu",
-            "Node",
-            "NodeSocket",
-            "NodeTree",
-            "UIList",
-            "RenderEngine",
-            "Gizmo",
-            "GizmoGroup",
-        ]
-    )
+    return set(getattr(bpy.types, name) for name in REGISTER_BASE_TYPE_NAMES)
 
 
 # Find order to register to solve dependencies
@@ -0,0 +1,196 @@
+import colorsys
+import dataclasses
+import functools
+import typing
+import zlib
+import numpy as np
+
+import bpy
+import gpu
+import mathutils
+
+from .properties import F64RenderSettings
+from .globals import F64_GLOBALS
+from .utils.bounds import is_box_visible
+from .sm64 import get_sm64_area_childrens
+from .oot import get_oot_room_childrens
+
+if typing.TYPE_CHECKING:
+    from .renderer import Fast64RenderEngine
+
+NO_COLLISION_COLOR = (0.5, 0.5, 0.5)
+OOT_COLLISION_ATTRS = ("floorProperty", "floorSetting", "wallSetting", "sound", "eponaBlock", "conveyorOption")
+
+
+# Lightweight buffers for the collision view, positions and flat per-face attributes only
+@dataclasses.dataclass
+class CollisionBuffers:
+    batch: gpu.types.GPUBatch
+    bounding_box: np.ndarray
+    mesh_name: str = ""
+    attributes: dict[str, np.ndarray] = None  # vertex data of the batch, for command recordings
+
+
+def get_collision_type(material: bpy.types.Material | None, game_mode: str) -> str:
+    if material is None:
+        return ""
+    if game_mode == "SM64":
+        col_type = material.collision_type if material.collision_all_options else material.collision_type_simple
+        return material.collision_custom if col_type == "Custom" else col_type
+    if game_mode == "OOT":
+        props = material.ootCollisionProperty
+        return "|".join(str(getattr(props, attr, "")) for attr in OOT_COLLISION_ATTRS)
+    return material.name
+
+
+@functools.cache
+def get_collision_color(col_type: str) -> tuple[float, float, float]:
+    if not col_type:
+        return NO_COLLISION_COLOR
+    hue = (zlib.crc32(col_type.encode()) & 0xFFFF) / 0xFFFF  # stable between sessions, unlike hash()
+    return colorsys.hsv_to_rgb(hue, 0.6, 0.9)
+
+
+def mesh_to_collision_buffers(
+    mesh: bpy.types.Mesh, obj: bpy.types.Object, vbo_format: gpu.types.GPUVertFormat, game_mode: str
+) -> CollisionBuffers:
+    mesh.calc_loop_triangles()
+    tri_count = len(mesh.loop_triangles)
+
+    vert_indices = np.empty(tri_count * 3, dtype=np.int32)
+    mesh.loop_triangles.foreach_get("vertices", vert_indices)
+    co = np.empty((len(mesh.vertices), 3), dtype=np.float32)
+    mesh.vertices.foreach_get("co", co.ravel())
+    positions = co[vert_indices].reshape(-1, 3, 3)
+
+    poly_hidden = np.empty(len(mesh.polygons), dtype=np.int32)
+    mesh.polygons.foreach_get("hide", poly_hidden)
+    tri_polys = np.empty(tri_count, dtype=np.int32)
+    mesh.loop_triangles.foreach_get("polygon_index", tri_polys)
+    mat_indices = np.empty(tri_count, dtype=np.int32)
+    mesh.loop_triangles.foreach_get("material_index", mat_indices)
+
+    visible = poly_hidden[tri_polys] == 0
+    positions, mat_indices = positions[visible], mat_indices[visible]
+
+    normals = np.cross(positions[:, 1] - positions[:, 0], positions[:, 2] - positions[:, 0])
+    normals /= np.maximum(np.linalg.norm(normals, axis=1, keepdims=True), 1e-12)
+
+    slot_colors = [get_collision_color(get_collision_type(slot.material, game_mode)) for slot in obj.material_slots]
+    slot_colors = np.array(slot_colors or [NO_COLLISION_COLOR], dtype=np.float32)
+    colors = slot_colors[np.minimum(mat_indices, len(slot_colors) - 1)]
+
+    attributes = {
+        "pos": positions.reshape(-1, 3),
+        "inNormal": np.repeat(normals, 3, axis=0),
+        "inColor": np.repeat(colors, 3, axis=0),
+    }
+    vbo = gpu.types.GPUVertBuf(vbo_format, len(positions) * 3)
+    for name, values in attributes.items():
+        vbo.attr_fill(name, values)
+
+    bounding_box = np.array([(*corner, 1) for corner in obj.bound_box], dtype=np.float32)
+    return CollisionBuffers(gpu.types.GPUBatch(type="TRIS", buf=vbo), bounding_box, obj.data.name, attributes)
+
+
+def create_collision_shader() -> gpu.types.GPUShader:
+    print("Compiling collision shader")
+    shader_info = gpu.types.GPUShaderCreateInfo()
+    vert_out = gpu.types.GPUStageInterfaceInfo("vert_collision")
+    vert_out.flat("VEC3", "shadedColor")
+
+    shader_info.push_constant("MAT4", "matMVP")
+    shader_info.push_constant("MAT3", "matNorm")
+    shader_info.vertex_in(0, "VEC3", "pos")
+    shader_info.vertex_in(1, "VEC3", "inNormal")
+    shader_info.vertex_in(2, "VEC3", "inColor")
+    shader_info.vertex_out(vert_out)
+    shader_info.fragment_out(0, "VEC4", "FragColor")
+
+    shader_info.vertex_source(
+        """
+    void main() {
+      gl_Position = matMVP * vec4(pos, 1.0);
+      // headlight shading, view space normals facing the camera are the brightest
+      vec3 normal = normalize(matNorm * inNormal);
+      shadedColor = inColor * (0.35 + 0.65 * abs(normal.z));
+    }"""
+    )
+    shader_info.fragment_source(
+        """
+    void main() {
+      FragColor = vec4(shadedColor, 1.0);
+    }"""
+    )
+    return gpu.shader.create_from_info(shader_info)
+
+
+def get_collision_shader() -> gpu.types.GPUShader:
+    return F64_GLOBALS.shared.get("shader_collision", create_collision_shader)
+
+
+def get_collision_buffers(
+    render_engine: "Fast64RenderEngine", obj: bpy.types.Object, depsgraph: bpy.types.Depsgraph
+) -> CollisionBuffers:
+    mesh_id = f"{obj.name}#{obj.data.name}"
+    col_obj = F64_GLOBALS.collision_cache.get(mesh_id)
+    if col_obj is None:
+        mesh = obj.evaluated_get(depsgraph).to_mesh()
+        col_obj = F64_GLOBALS.collision_cache[mesh_id] = mesh_to_collision_buffers(
+            mesh, obj, get_collision_shader().format_calc(), depsgraph.scene.gameEditorMode
+        )
+        obj.to_mesh_clear()
+    return col_obj
+
+
+# Collision view: no material parsing, textures or combiner, just flat-shaded geometry colored by collision type
+def draw_collision_scene(
+    render_engine: "Fast64RenderEngine",
+    depsgraph: bpy.types.Depsgraph,
+    hidden_objs_names: set[str],
+    space_view_3d: bpy.types.SpaceView3D,
+    projection_matrix: mathutils.Matrix,
+    view_matrix: mathutils.Matrix,
+):
+    f64render_rs: F64RenderSettings = depsgraph.scene.f64render.render_settings
+    if depsgraph.scene.gameEditorMode == "SM64":
+        group_lookup, specific_group = get_sm64_area_childrens(), f64render_rs.sm64_specific_area
+    else:
+        group_lookup, specific_group = get_oot_room_childrens(), f64render_rs.oot_specific_room
+    specific_name = specific_group.name if specific_group else None
+
+    objs: list[bpy.types.Object] = []
+    for obj in depsgraph.objects:
+        if (
+            obj.name in hidden_objs_names
+            or obj.type not in {"MESH", "CURVE", "SURFACE", "FONT"}
+            or obj.data is None
+            or obj.ignore_collision
+            or (space_view_3d.local_view and not obj.local_view_get(space_view_3d))
+        ):
+            continue
+        group = group_lookup.get(obj.name)
+        if specific_name and group is not None and group.name != specific_name:
+            continue
+        objs.append(obj)
+
+    matrices = render_engine.obj_matrices
+    rows = matrices.update(objs, projection_matrix, view_matrix)
+
+    backend = render_engine.gpu
+    backend.depth_test_set("LESS_EQUAL")
+    backend.depth_mask_set(True)
+    backend.blend_set("NONE")
+    backend.face_culling_set("NONE")
+
+    shader = get_collision_shader()
+    backend.bind(shader)
+    for obj, row in zip(objs, rows):
+        mvp, normal = matrices.mvp[row], matrices.normal[row]
+        col_obj = get_collision_buffers(render_engine, obj, depsgraph)
+        if not is_box_visible(col_obj.bounding_box, mvp):
+            continue
+        # numpy matrices are row-major, the shader expects them column-major
+        backend.uniform_float(shader, "matMVP", mvp.T.ravel())
+        backend.uniform_float(shader, "matNorm", normal.T.ravel())
+        backend.draw(col_obj.batch, shader)
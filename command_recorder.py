@@ -0,0 +1,717 @@
+import collections
+import contextlib
+import json
+import struct
+import time
+import types
+import numpy as np
+
+import bpy
+import gpu
+from bpy_extras.io_utils import ExportHelper, ImportHelper
+
+from .globals import F64_GLOBALS
+from .shader_cache import SHADER_CACHE, get_shader_key
+
+
+# gpu calls that only take keyword arguments, or don't map to a single method
+def texture_clear(texture: gpu.types.GPUTexture, format: str, value):
+    texture.clear(format=format, value=value)
+
+
+def framebuffer_bind(framebuffer: gpu.types.GPUFrameBuffer, _depth_texture, _color_texture):
+    return framebuffer.bind()  # attachments are only needed to describe the framebuffer in recordings
+
+
+def framebuffer_clear(framebuffer: gpu.types.GPUFrameBuffer, color=None, depth=None):
+    framebuffer.clear(color=color, depth=depth)
+
+
+# All gpu calls of the draw path go through a backend, 'DIRECT_BACKEND' calls the gpu module directly.
+# It holds the unbound gpu methods themselves, so the indirection doesn't add Python calls when not recording.
+DIRECT_BACKEND = types.SimpleNamespace(
+    bind=gpu.types.GPUShader.bind,
+    uniform_float=gpu.types.GPUShader.uniform_float,
+    uniform_int=gpu.types.GPUShader.uniform_int,
+    uniform_sampler=gpu.types.GPUShader.uniform_sampler,
+    uniform_block=gpu.types.GPUShader.uniform_block,
+    image=gpu.types.GPUShader.image,
+    ubo_update=gpu.types.GPUUniformBuf.update,
+    draw=gpu.types.GPUBatch.draw,
+    draw_range=getattr(gpu.types.GPUBatch, "draw_range", None),  # blender 3.6+
+    face_culling_set=gpu.state.face_culling_set,
+    blend_set=gpu.state.blend_set,
+    depth_test_set=gpu.state.depth_test_set,
+    depth_mask_set=gpu.state.depth_mask_set,
+    viewport_set=gpu.state.viewport_set,
+    texture_clear=texture_clear,
+    framebuffer_bind=framebuffer_bind,
+    framebuffer_clear=framebuffer_clear,
+)
+
+FILE_MAGIC = b"F64C"
+FILE_VERSION = 2
+
+OP_STRING = 0  # u16 id, u16 length, utf-8
+OP_FRAME = 1  # u32 frame, i32 * 4 viewport
+OP_BIND = 2  # u32 shader
+OP_UNIFORM_FLOAT = 3  # u32 shader, u16 name, u16 count, f32 * count
+OP_UNIFORM_INT = 4  # u32 shader, u16 name, i32
+OP_SAMPLER = 5  # u32 shader, u16 name, u32 texture
+OP_IMAGE = 6  # u32 shader, u16 name, u32 texture
+OP_BLOCK = 7  # u32 shader, u16 name, u32 ubo
+OP_UBO_UPDATE = 8  # u32 ubo, u32 size, bytes (the first update also creates the ubo)
+OP_STATE = 9  # u8 state, u8 value index, see STATE_VALUES
+OP_DRAW = 10  # u32 batch, u32 shader
+OP_DRAW_RANGE = 11  # u32 batch, u32 shader, u32 start, u32 count
+OP_SHADER = 12  # u32 shader, u16 descriptor (defines as JSON or shared resource name)
+OP_TEXTURE = 13  # u32 texture, u16 width, u16 height, u16 format, u8 data type, u32 size, bytes
+OP_BATCH = 14  # u32 batch, u16 attributes, per attribute: u16 name, u8 type, u8 size, u32 count, bytes; indices
+OP_VIEWPORT = 15  # i32 * 4
+OP_TEXTURE_CLEAR = 16  # u32 texture, u16 format, u8 count, 32-bit values
+OP_FRAMEBUFFER_BIND = 17  # u32 framebuffer, u32 depth texture, u32 color texture
+OP_FRAMEBUFFER_UNBIND = 18
+OP_FRAMEBUFFER_CLEAR = 19  # u32 framebuffer, u8 flags (1: color, 2: depth), f32 * 4 color, f32 depth
+
+NO_INDICES = 0xFFFFFFFF
+
+STATE_VALUES = {
+    "face_culling_set": ("NONE", "FRONT", "BACK"),
+    "blend_set": (
+        "NONE",
+        "ALPHA",
+        "ALPHA_PREMULT",
+        "ADDITIVE",
+        "ADDITIVE_PREMULT",
+        "MULTIPLY",
+        "SUBTRACT",
+        "INVERT",
+    ),
+    "depth_test_set": ("NONE", "ALWAYS", "LESS", "LESS_EQUAL", "EQUAL", "GREATER", "GREATER_EQUAL"),
+    "depth_mask_set": (False, True),
+}
+STATES = tuple(STATE_VALUES.keys())
+
+# texture contents and vertex attributes are stored raw, these are the gpu.types.Buffer / numpy types
+DATA_TYPES = ("", "FLOAT", "INT", "UINT", "UBYTE")
+NUMPY_DATA_TYPES = {"FLOAT": np.float32, "INT": np.int32, "UINT": np.uint32, "UBYTE": np.uint8}
+# render target formats, always cleared or fully drawn before use, so their contents aren't stored
+TARGET_FORMATS = {"R32UI", "R32I", "DEPTH_COMPONENT32F", "DEPTH24_STENCIL8"}
+
+OP_NAMES = {
+    OP_FRAME: "frame",
+    OP_BIND: "bind",
+    OP_UNIFORM_FLOAT: "uniform_float",
+    OP_UNIFORM_INT: "uniform_int",
+    OP_SAMPLER: "uniform_sampler",
+    OP_IMAGE: "image",
+    OP_BLOCK: "uniform_block",
+    OP_UBO_UPDATE: "ubo_update",
+    OP_DRAW: "draw",
+    OP_DRAW_RANGE: "draw_range",
+    OP_SHADER: "shader",
+    OP_TEXTURE: "texture",
+    OP_BATCH: "batch",
+    OP_VIEWPORT: "viewport_set",
+    OP_TEXTURE_CLEAR: "texture_clear",
+    OP_FRAMEBUFFER_BIND: "framebuffer_bind",
+    OP_FRAMEBUFFER_UNBIND: "framebuffer_unbind",
+    OP_FRAMEBUFFER_CLEAR: "framebuffer_clear",
+}
+REPLAY_CALLS = set(OP_NAMES.values()) | set(STATES)  # state changes are replayed by their own name
+
+
+# shader defines as JSON, or the name of a shader in F64_GLOBALS.shared
+def get_shader_descriptor(shader: gpu.types.GPUShader) -> str:
+    for key, cached in SHADER_CACHE.shaders.items():
+        if cached is shader:
+            return json.dumps(dict(key))
+    for name, resource in F64_GLOBALS.shared.resources.items():
+        if resource is shader or (isinstance(resource, tuple) and resource[0] is shader):
+            return str(name)
+    return ""
+
+
+def create_replay_shader(descriptor: str) -> gpu.types.GPUShader:
+    if descriptor.startswith("{"):
+        return SHADER_CACHE.get_or_compile(get_shader_key(json.loads(descriptor)))
+    if descriptor == "shader_2d":
+        from .renderer import create_shader_2d
+
+        return F64_GLOBALS.shared.get("shader_2d", create_shader_2d)[0]
+    if descriptor == "shader_collision":
+        from .collision import get_collision_shader
+
+        return get_collision_shader()
+    raise ValueError(f"Unknown shader in recording: {descriptor!r}")
+
+
+# vertex attributes and (triangle) indices of every batch f64render currently has uploaded, by id(batch)
+def get_batch_sources() -> dict[int, tuple[dict[str, np.ndarray], np.ndarray | None]]:
+    from .renderer import QUAD_2D_VERTICES
+
+    sources = {}
+    for render_obj in [*F64_GLOBALS.meshCache.values(), *F64_GLOBALS.anim_cache.frames.values()]:
+        if render_obj.batch is None:
+            continue
+        attributes = {
+            "pos": render_obj.vert,
+            "inNormal": render_obj.norm,
+            "inColor": render_obj.color,
+            "inUV": render_obj.uv,
+        }
+        if render_obj.skin is not None:
+            attributes["inBoneIndices"] = render_obj.skin.bone_indices
+            attributes["inBoneWeights"] = render_obj.skin.bone_weights
+        if not isinstance(render_obj.batch, list):
+            sources[id(render_obj.batch)] = (attributes, render_obj.indices)
+            continue
+        offsets = render_obj.index_offsets
+        for i, batch in enumerate(render_obj.batch):  # one per material, see upload_mesh_buffers
+            if batch is not None:
+                indices = render_obj.indices[offsets[i] : offsets[i + 1]] if i + 1 < len(offsets) else None
+                sources[id(batch)] = (attributes, render_obj.indices if indices is None else indices)
+    for col_obj in F64_GLOBALS.collision_cache.values():
+        sources[id(col_obj.batch)] = (col_obj.attributes, None)
+    shared_2d = F64_GLOBALS.shared.resources.get("shader_2d")
+    if shared_2d is not None:
+        sources[id(shared_2d[1])] = ({"pos": QUAD_2D_VERTICES}, None)
+    return sources
+
+
+# Backend that forwards to the gpu module and encodes every call into a compact binary command stream.
+# GPU objects are referenced by ids assigned on first use, together with a description to recreate them on replay:
+# shader defines, texture formats and contents, vertex and index data. Strings (uniform names) are interned.
+class RecordingBackend:
+    def __init__(self):
+        self.buffer = bytearray()
+        self.objects: dict[int, tuple[object, int]] = {}  # id(obj) -> (obj, object id), keeps objects alive
+        self.strings: dict[str, int] = {}
+        self.batch_sources: dict[int, tuple[dict[str, np.ndarray], np.ndarray | None]] | None = None
+        self.frame = 0
+
+    def obj_id(self, obj) -> tuple[int, bool]:  # object id, first use
+        entry = self.objects.get(id(obj))
+        if entry is not None:
+            return entry[1], False
+        entry = self.objects[id(obj)] = (obj, len(self.objects))
+        return entry[1], True
+
+    def string_id(self, value: str) -> int:
+        string_id = self.strings.get(value)
+        if string_id is None:
+            string_id = self.strings[value] = len(self.strings)
+            data = value.encode("utf-8")
+            self.buffer += struct.pack("<BHH", OP_STRING, string_id, len(data)) + data
+        return string_id
+
+    def shader_id(self, shader) -> int:
+        shader_id, is_new = self.obj_id(shader)
+        if is_new:
+            descriptor = self.string_id(get_shader_descriptor(shader))
+            self.buffer += struct.pack("<BIH", OP_SHADER, shader_id, descriptor)
+        return shader_id
+
+    def texture_id(self, texture) -> int:
+        texture_id, is_new = self.obj_id(texture)
+        if is_new:
+            data_type, data = 0, b""
+            if texture.format not in TARGET_FORMATS:
+                values = np.asarray(texture.read())
+                data_type = DATA_TYPES.index(
+                    next(name for name, dtype in NUMPY_DATA_TYPES.items() if values.dtype == dtype)
+                )
+                data = values.tobytes()
+            self.buffer += struct.pack(
+                "<BIHHHBI",
+                OP_TEXTURE,
+                texture_id,
+                texture.width,
+                texture.height,
+                self.string_id(texture.format),
+                data_type,
+                len(data),
+            )
+            self.buffer += data
+        return texture_id
+
+    def batch_id(self, batch) -> int:
+        batch_id, is_new = self.obj_id(batch)
+        if not is_new:
+            return batch_id
+        if self.batch_sources is None or id(batch) not in self.batch_sources:
+            self.batch_sources = get_batch_sources()
+        attributes, indices = self.batch_sources.get(id(batch), ({}, None))
+        self.buffer += struct.pack("<BIH", OP_BATCH, batch_id, len(attributes))
+        for name, values in attributes.items():
+            values = np.ascontiguousarray(values)
+            is_int = values.dtype.kind in "iu"
+            values = values.astype(np.int32 if is_int else np.float32, copy=False)
+            size = values.shape[1] if values.ndim > 1 else 1
+            self.buffer += struct.pack("<HBBI", self.string_id(name), int(is_int), size, len(values))
+            self.buffer += values.tobytes()
+        if indices is None:
+            self.buffer += struct.pack("<I", NO_INDICES)
+        else:
+            indices = np.ascontiguousarray(indices, dtype=np.uint32).ravel()
+            self.buffer += struct.pack("<I", len(indices)) + indices.tobytes()
+        return batch_id
+
+    def begin_frame(self, viewport):
+        self.buffer += struct.pack("<BIiiii", OP_FRAME, self.frame, *viewport)
+        self.frame += 1
+
+    def bind(self, shader):
+        self.buffer += struct.pack("<BI", OP_BIND, self.shader_id(shader))
+        DIRECT_BACKEND.bind(shader)
+
+    def uniform_float(self, shader, name: str, value):
+        values = np.asarray(value, dtype=np.float32).ravel()
+        self.buffer += struct.pack(
+            "<BIHH", OP_UNIFORM_FLOAT, self.shader_id(shader), self.string_id(name), len(values)
+        )
+        self.buffer += values.tobytes()
+        DIRECT_BACKEND.uniform_float(shader, name, value)
+
+    def uniform_int(self, shader, name: str, value: int):
+        self.buffer += struct.pack("<BIHi", OP_UNIFORM_INT, self.shader_id(shader), self.string_id(name), value)
+        DIRECT_BACKEND.uniform_int(shader, name, value)
+
+    def uniform_sampler(self, shader, name: str, texture):
+        self.buffer += struct.pack(
+            "<BIHI", OP_SAMPLER, self.shader_id(shader), self.string_id(name), self.texture_id(texture)
+        )
+        DIRECT_BACKEND.uniform_sampler(shader, name, texture)
+
+    def image(self, shader, name: str, texture):
+        self.buffer += struct.pack(
+            "<BIHI", OP_IMAGE, self.shader_id(shader), self.string_id(name), self.texture_id(texture)
+        )
+        DIRECT_BACKEND.image(shader, name, texture)
+
+    def uniform_block(self, shader, name: str, ubo):
+        self.buffer += struct.pack(
+            "<BIHI", OP_BLOCK, self.shader_id(shader), self.string_id(name), self.obj_id(ubo)[0]
+        )
+        DIRECT_BACKEND.uniform_block(shader, name, ubo)
+
+    def ubo_update(self, ubo, data):
+        payload = bytes(data)
+        self.buffer += struct.pack("<BII", OP_UBO_UPDATE, self.obj_id(ubo)[0], len(payload)) + payload
+        DIRECT_BACKEND.ubo_update(ubo, data)
+
+    def state(self, name: str, value):
+        self.buffer += struct.pack("<BBB", OP_STATE, STATES.index(name), STATE_VALUES[name].index(value))
+        getattr(DIRECT_BACKEND, name)(value)
+
+    def face_culling_set(self, value: str):
+        self.state("face_culling_set", value)
+
+    def blend_set(self, value: str):
+        self.state("blend_set", value)
+
+    def depth_test_set(self, value: str):
+        self.state("depth_test_set", value)
+
+    def depth_mask_set(self, value: bool):
+        self.state("depth_mask_set", bool(value))
+
+    def viewport_set(self, x: int, y: int, width: int, height: int):
+        self.buffer += struct.pack("<Biiii", OP_VIEWPORT, x, y, width, height)
+        DIRECT_BACKEND.viewport_set(x, y, width, height)
+
+    def texture_clear(self, texture, format: str, value):
+        values = np.asarray(value, dtype=np.float32 if format == "FLOAT" else np.int64).ravel()
+        values = values.astype(np.float32 if format == "FLOAT" else np.uint32)  # 32-bit patterns
+        self.buffer += struct.pack(
+            "<BIHB", OP_TEXTURE_CLEAR, self.texture_id(texture), self.string_id(format), len(values)
+        )
+        self.buffer += values.tobytes()
+        DIRECT_BACKEND.texture_clear(texture, format, value)
+
+    @contextlib.contextmanager
+    def framebuffer_bind(self, framebuffer, depth_texture, color_texture):
+        self.buffer += struct.pack(
+            "<BIII",
+            OP_FRAMEBUFFER_BIND,
+            self.obj_id(framebuffer)[0],
+            self.texture_id(depth_texture),
+            self.texture_id(color_texture),
+        )
+        with framebuffer.bind():
+            yield
+        self.buffer += struct.pack("<B", OP_FRAMEBUFFER_UNBIND)
+
+    def framebuffer_clear(self, framebuffer, color=None, depth=None):
+        flags = (1 if color is not None else 0) | (2 if depth is not None else 0)
+        color_values = tuple(color) if color is not None else (0.0, 0.0, 0.0, 0.0)
+        self.buffer += struct.pack(
+            "<BIB4ff",
+            OP_FRAMEBUFFER_CLEAR,
+            self.obj_id(framebuffer)[0],
+            flags,
+            *color_values,
+            depth if depth is not None else 0.0,
+        )
+        DIRECT_BACKEND.framebuffer_clear(framebuffer, color=color, depth=depth)
+
+    def draw(self, batch, shader):
+        self.buffer += struct.pack("<BII", OP_DRAW, self.batch_id(batch), self.shader_id(shader))
+        DIRECT_BACKEND.draw(batch, shader)
+
+    def draw_range(self, batch, shader, elem_start: int = 0, elem_count: int = 0):
+        self.buffer += struct.pack(
+            "<BIIII", OP_DRAW_RANGE, self.batch_id(batch), self.shader_id(shader), elem_start, elem_count
+        )
+        DIRECT_BACKEND.draw_range(batch, shader, elem_start=elem_start, elem_count=elem_count)
+
+
+# Records the next 'frame_count' drawn frames into a file, see Fast64RenderEngine.begin_gpu_frame
+class CommandRecorder:
+    def __init__(self):
+        self.backend: RecordingBackend | None = None
+        self.path = ""
+        self.frames_left = 0
+
+    @property
+    def recording(self) -> bool:
+        return self.backend is not None
+
+    def start(self, path: str, frame_count: int = 1):
+        self.backend, self.path, self.frames_left = RecordingBackend(), path, frame_count
+
+    def begin_frame(self, viewport) -> RecordingBackend:
+        self.backend.begin_frame(viewport)
+        return self.backend
+
+    def end_frame(self):
+        self.frames_left -= 1
+        if self.frames_left <= 0:
+            self.stop()
+
+    def stop(self):
+        if self.backend is None:
+            return
+        with open(self.path, "wb") as f:
+            f.write(FILE_MAGIC + struct.pack("<H", FILE_VERSION))
+            f.write(self.backend.buffer)
+        print(f"Recorded {self.backend.frame} frames ({len(self.backend.buffer)} bytes) to {self.path}")
+        self.backend = None
+
+
+RECORDER = CommandRecorder()
+
+
+# Decodes a recording and calls 'backend.<op name>(...)' for each command, objects are passed as ids.
+# Resource definitions ('shader', 'texture', 'batch') precede their first use.
+# Backends only need to implement the ops they care about.
+def replay(path: str, backend):
+    with open(path, "rb") as f:
+        data = f.read()
+    if data[:4] != FILE_MAGIC:
+        raise ValueError(f"Not a command recording: {path}")
+    (version,) = struct.unpack_from("<H", data, 4)
+    if version != FILE_VERSION:
+        raise ValueError(f"Unsupported recording version {version}")
+
+    strings: dict[int, str] = {}
+    offset, size = 6, len(data)
+
+    def call(name: str, *args):
+        func = getattr(backend, name, None)
+        if func is not None:
+            func(*args)
+
+    while offset < size:
+        op = data[offset]
+        offset += 1
+        if op == OP_STRING:
+            string_id, length = struct.unpack_from("<HH", data, offset)
+            offset += 4
+            strings[string_id] = data[offset : offset + length].decode("utf-8")
+            offset += length
+        elif op == OP_FRAME:
+            call("frame", *struct.unpack_from("<Iiiii", data, offset))
+            offset += 20
+        elif op == OP_BIND:
+            call("bind", *struct.unpack_from("<I", data, offset))
+            offset += 4
+        elif op == OP_UNIFORM_FLOAT:
+            shader, name, count = struct.unpack_from("<IHH", data, offset)
+            offset += 8
+            values = np.frombuffer(data, dtype=np.float32, count=count, offset=offset)
+            offset += count * 4
+            call("uniform_float", shader, strings[name], values)
+        elif op == OP_UNIFORM_INT:
+            shader, name, value = struct.unpack_from("<IHi", data, offset)
+            offset += 10
+            call("uniform_int", shader, strings[name], value)
+        elif op in {OP_SAMPLER, OP_IMAGE, OP_BLOCK}:
+            shader, name, obj = struct.unpack_from("<IHI", data, offset)
+            offset += 10
+            call(OP_NAMES[op], shader, strings[name], obj)
+        elif op == OP_UBO_UPDATE:
+            ubo, length = struct.unpack_from("<II", data, offset)
+            offset += 8
+            call("ubo_update", ubo, data[offset : offset + length])
+            offset += length
+        elif op == OP_STATE:
+            state_idx, value = struct.unpack_from("<BB", data, offset)
+            offset += 2
+            state = STATES[state_idx]
+            call(state, STATE_VALUES[state][value])
+        elif op == OP_DRAW:
+            call("draw", *struct.unpack_from("<II", data, offset))
+            offset += 8
+        elif op == OP_DRAW_RANGE:
+            call("draw_range", *struct.unpack_from("<IIII", data, offset))
+            offset += 16
+        elif op == OP_SHADER:
+            shader, descriptor = struct.unpack_from("<IH", data, offset)
+            offset += 6
+            call("shader", shader, strings[descriptor])
+        elif op == OP_TEXTURE:
+            texture, width, height, format, data_type, length = struct.unpack_from("<IHHHBI", data, offset)
+            offset += 15
+            texture_data = data[offset : offset + length]
+            call("texture", texture, width, height, strings[format], DATA_TYPES[data_type], texture_data)
+            offset += length
+        elif op == OP_BATCH:
+            batch, attribute_count = struct.unpack_from("<IH", data, offset)
+            offset += 6
+            attributes = {}
+            for _ in range(attribute_count):
+                name, is_int, attr_size, count = struct.unpack_from("<HBBI", data, offset)
+                offset += 8
+                values = np.frombuffer(data, np.int32 if is_int else np.float32, count * attr_size, offset)
+                attributes[strings[name]] = values.reshape(count, attr_size) if attr_size > 1 else values
+                offset += count * attr_size * 4
+            (count,) = struct.unpack_from("<I", data, offset)
+            offset += 4
+            indices = None
+            if count != NO_INDICES:
+                indices = np.frombuffer(data, dtype=np.uint32, count=count, offset=offset)
+                offset += count * 4
+            call("batch", batch, attributes, indices)
+        elif op == OP_VIEWPORT:
+            call("viewport_set", *struct.unpack_from("<iiii", data, offset))
+            offset += 16
+        elif op == OP_TEXTURE_CLEAR:
+            texture, format, count = struct.unpack_from("<IHB", data, offset)
+            offset += 7
+            dtype = {"FLOAT": np.float32, "INT": np.int32}.get(strings[format], np.uint32)
+            values = np.frombuffer(data, dtype=dtype, count=count, offset=offset)
+            offset += count * 4
+            call("texture_clear", texture, strings[format], values.tolist())
+        elif op == OP_FRAMEBUFFER_BIND:
+            call("framebuffer_bind", *struct.unpack_from("<III", data, offset))
+            offset += 12
+        elif op == OP_FRAMEBUFFER_UNBIND:
+            call("framebuffer_unbind")
+        elif op == OP_FRAMEBUFFER_CLEAR:
+            framebuffer, flags, *values = struct.unpack_from("<IB4ff", data, offset)
+            offset += 25
+            color, depth = tuple(values[:4]) if flags & 1 else None, values[4] if flags & 2 else None
+            call("framebuffer_clear", framebuffer, color, depth)
+        else:
+            raise ValueError(f"Unknown command {op} at offset {offset - 1}")
+
+
+# Replay backend without a GPU, counts commands and submitted work (e.g. to diff two recordings)
+class CountingBackend:
+    def __init__(self):
+        self.counts: collections.Counter[str] = collections.Counter()
+        self.frames = 0
+        self.elements = 0
+        self.ubo_bytes = 0
+
+    def frame(self, _frame: int, *_viewport: int):
+        self.frames += 1
+
+    def __getattr__(self, name: str):
+        if name not in REPLAY_CALLS:
+            raise AttributeError(name)
+
+        def count(*args):
+            self.counts[name] += 1
+            if name == "draw_range":
+                self.elements += args[3]
+            elif name == "ubo_update":
+                self.ubo_bytes += len(args[1])
+
+        return count
+
+
+# Replays a recording on the GPU, into an offscreen buffer of the recorded viewport size.
+# Resources are recreated from their recorded descriptions, shaders come from the shader cache.
+class GPUReplayBackend:
+    def __init__(self):
+        self.objects: dict[int, object] = {}  # recorded id -> shader, texture, ubo, framebuffer
+        self.batch_sources: dict[int, tuple[dict[str, np.ndarray], np.ndarray | None]] = {}
+        self.batches: dict[int, gpu.types.GPUBatch] = {}  # created on first draw, with the drawing shader's format
+        self.framebuffer_binds: list = []
+        self.offscreen: gpu.types.GPUOffScreen | None = None
+        self.offscreen_bind = None
+        self.origin = (0, 0)  # recorded viewports are relative to the region
+        self.frames = 0
+
+    def frame(self, _frame: int, x: int, y: int, width: int, height: int):
+        self.frames += 1
+        self.origin = (x, y)
+        if self.offscreen is None or (self.offscreen.width, self.offscreen.height) != (width, height):
+            self.free()
+            self.offscreen = gpu.types.GPUOffScreen(width, height)
+            self.offscreen_bind = self.offscreen.bind()
+            self.offscreen_bind.__enter__()
+        gpu.state.viewport_set(0, 0, width, height)
+
+    def free(self):
+        while self.framebuffer_binds:
+            self.framebuffer_unbind()
+        if self.offscreen is not None:
+            self.offscreen_bind.__exit__(None, None, None)
+            self.offscreen.free()
+            self.offscreen = self.offscreen_bind = None
+
+    def shader(self, shader: int, descriptor: str):
+        self.objects[shader] = create_replay_shader(descriptor)
+
+    def texture(self, texture: int, width: int, height: int, format: str, data_type: str, data: bytes):
+        buffer = None
+        if data_type:  # textures can only be created from float data
+            values = np.frombuffer(data, dtype=NUMPY_DATA_TYPES[data_type]).astype(np.float32)
+            if data_type == "UBYTE":
+                values /= 255
+            buffer = gpu.types.Buffer("FLOAT", len(values), values.tolist())
+        self.objects[texture] = gpu.types.GPUTexture((width, height), format=format, data=buffer)
+
+    def batch(self, batch: int, attributes: dict[str, np.ndarray], indices: np.ndarray | None):
+        self.batch_sources[batch] = (attributes, indices)
+
+    def get_batch(self, batch: int, shader: gpu.types.GPUShader) -> gpu.types.GPUBatch:
+        gpu_batch = self.batches.get(batch)
+        if gpu_batch is None:
+            attributes, indices = self.batch_sources[batch]
+            vbo = gpu.types.GPUVertBuf(shader.format_calc(), len(next(iter(attributes.values()))))
+            for name, values in attributes.items():
+                vbo.attr_fill(name, values)
+            ibo = None if indices is None else gpu.types.GPUIndexBuf(type="TRIS", seq=indices.reshape(-1, 3))
+            gpu_batch = self.batches[batch] = gpu.types.GPUBatch(type="TRIS", buf=vbo, elem=ibo)
+        return gpu_batch
+
+    def bind(self, shader: int):
+        self.objects[shader].bind()
+
+    def uniform_float(self, shader: int, name: str, values: np.ndarray):
+        self.objects[shader].uniform_float(name, values)
+
+    def uniform_int(self, shader: int, name: str, value: int):
+        self.objects[shader].uniform_int(name, value)
+
+    def uniform_sampler(self, shader: int, name: str, texture: int):
+        self.objects[shader].uniform_sampler(name, self.objects[texture])
+
+    def image(self, shader: int, name: str, texture: int):
+        self.objects[shader].image(name, self.objects[texture])
+
+    def uniform_block(self, shader: int, name: str, ubo: int):
+        self.objects[shader].uniform_block(name, self.objects[ubo])
+
+    def ubo_update(self, ubo: int, data: bytes):
+        if ubo in self.objects:
+            self.objects[ubo].update(data)
+        else:
+            self.objects[ubo] = gpu.types.GPUUniformBuf(data)
+
+    def face_culling_set(self, value: str):
+        gpu.state.face_culling_set(value)
+
+    def blend_set(self, value: str):
+        gpu.state.blend_set(value)
+
+    def depth_test_set(self, value: str):
+        gpu.state.depth_test_set(value)
+
+    def depth_mask_set(self, value: bool):
+        gpu.state.depth_mask_set(value)
+
+    def viewport_set(self, x: int, y: int, width: int, height: int):
+        gpu.state.viewport_set(x - self.origin[0], y - self.origin[1], width, height)
+
+    def texture_clear(self, texture: int, format: str, value: list):
+        self.objects[texture].clear(format=format, value=value)
+
+    def framebuffer_bind(self, framebuffer: int, depth_texture: int, color_texture: int):
+        if framebuffer not in self.objects:
+            self.objects[framebuffer] = gpu.types.GPUFrameBuffer(
+                depth_slot=self.objects[depth_texture], color_slots=self.objects[color_texture]
+            )
+        framebuffer_bind = self.objects[framebuffer].bind()
+        framebuffer_bind.__enter__()
+        self.framebuffer_binds.append(framebuffer_bind)
+
+    def framebuffer_unbind(self):
+        self.framebuffer_binds.pop().__exit__(None, None, None)
+
+    def framebuffer_clear(self, framebuffer: int, color, depth):
+        # framebuffers that were never bound are the active one at the time of recording
+        target = self.objects.get(framebuffer) or gpu.state.active_framebuffer_get()
+        target.clear(color=color, depth=depth)
+
+    def draw(self, batch: int, shader: int):
+        shader = self.objects[shader]
+        self.get_batch(batch, shader).draw(shader)
+
+    def draw_range(self, batch: int, shader: int, elem_start: int, elem_count: int):
+        shader = self.objects[shader]
+        self.get_batch(batch, shader).draw_range(shader, elem_start=elem_start, elem_count=elem_count)
+
+
+def replay_timed(path: str, backend=None) -> tuple[float, object]:  # time in ms, backend
+    backend = CountingBackend() if backend is None else backend
+    t = time.perf_counter()
+    replay(path, backend)
+    return (time.perf_counter() - t) * 1000, backend
+
+
+class F64RENDER_OT_record_commands(bpy.types.Operator, ExportHelper):
+    bl_idname = "f64render.record_commands"
+    bl_label = "Record GPU Commands"
+    bl_description = "Records the GPU commands of the next drawn frames into a binary file for replay and diffing"
+
+    filename_ext = ".f64cmd"
+    frame_count: bpy.props.IntProperty(name="Frames", default=1, min=1, max=1000)
+
+    def execute(self, context):
+        RECORDER.start(self.filepath, self.frame_count)
+        F64_GLOBALS.update_counter += 1  # don't reuse a retained frame
+        for area in context.screen.areas:
+            if area.type == "VIEW_3D":
+                area.tag_redraw()
+        return {"FINISHED"}
+
+
+class F64RENDER_OT_replay_commands(bpy.types.Operator, ImportHelper):
+    bl_idname = "f64render.replay_commands"
+    bl_label = "Replay GPU Commands"
+    bl_description = "Replays a command recording on the GPU (offscreen) and reports how long submitting it took"
+
+    filename_ext = ".f64cmd"
+    filter_glob: bpy.props.StringProperty(default="*.f64cmd", options={"HIDDEN"})
+
+    def execute(self, context):
+        backend = GPUReplayBackend()
+        try:
+            time_ms, _ = replay_timed(self.filepath, backend)
+        except (OSError, ValueError) as e:
+            self.report({"ERROR"}, str(e))
+            return {"CANCELLED"}
+        finally:
+            backend.free()
+        self.report({"INFO"}, f"Replayed {backend.frames} frames in {time_ms:.2f} ms")
+        return {"FINISHED"}
+
+
+def unregister():
+    RECORDER.stop()
+
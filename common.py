@@ -4,7 +4,6 @@ import typing
 import numpy as np
 
 import bpy
-import mathutils
 import gpu
 
 from .material.parser import (
@@ -18,18 +17,26 @@ from .material.parser import (
     F64Material,
     F64RenderState,
     F64Light,
+    F64Rendermode,
+    DRAW_FLAG_DECAL,
+    DRAW_FLAG_ALPHA_BLEND,
+    BLENDER_CC_OFFSET,
+    OTHERMODE_L_OFFSET,
 )
-from .material.cc import SOLID_CC
+from .material.blender import is_blender_passthrough
+from .material.cc import SOLID_CC, SOLID_CC_FLAGS
 from .material.tile import get_tile_conf
 from .mesh.mesh import MeshBuffers, mesh_to_buffers
 from .mesh.gpu_batch import batch_for_shader, create_vert_buf
+from .mesh.skinning import create_skin_data, get_skin_armature, skin_matches_armature, update_bone_texture
 from .properties import F64RenderSettings
 from .globals import F64_GLOBALS
+from .profiler import PROFILER
 
 if typing.TYPE_CHECKING:
     from .renderer import Fast64RenderEngine
 
-FALLBACK_MATERIAL = F64Material(state=F64RenderState(cc=SOLID_CC))
+FALLBACK_MATERIAL = F64Material(state=F64RenderState(cc=SOLID_CC, cc_flags=SOLID_CC_FLAGS))
 FALLBACK_MATERIAL.state.save_cache()
 
 
@@ -39,16 +46,63 @@ def get_struct_ubo_size(s: struct.Struct):
 
 UBO_SIZE = get_struct_ubo_size(UNIFORM_BUFFER_STRUCT)
 
+# materials with these flags need the atomic depth/color images, everything else can use the hardware depth test
+ATOMIC_DRAW_FLAGS = DRAW_FLAG_DECAL | DRAW_FLAG_ALPHA_BLEND
+G_ZS_PRIM = 1 << 2  # othermode_l, see shader/defines.glsl
+
+
+# The hardware depth pass writes the combiner color with per-fragment depth, anything else needs the atomic shader:
+# decals, blending, a primitive depth source or a blender that doesn't pass the color through (e.g. fog)
+def use_hardware_depth(render_state: F64RenderState) -> bool:
+    if render_state.render_mode.flags & ATOMIC_DRAW_FLAGS:
+        return False
+    words = render_state.cached_values.view(np.int32)
+    if words[OTHERMODE_L_OFFSET] & G_ZS_PRIM:
+        return False
+    return is_blender_passthrough(tuple(words[BLENDER_CC_OFFSET : BLENDER_CC_OFFSET + 8].tolist()))
+
 
 @dataclasses.dataclass
 class ObjRenderInfo:
     obj: bpy.types.Object
-    mvp_matrix: mathutils.Matrix
-    normal_matrix: mathutils.Matrix
+    mvp_matrix: np.ndarray | None  # filled in for all objects at once by ObjMatrixCache
+    normal_matrix: np.ndarray | None
     render_obj: MeshBuffers
     mats: list[tuple[int, int, F64Material]]  # mat idx, indice count, material
 
 
+# Per-frame counters of the draw path, see Fast64RenderEngine.get_frame_stats
+@dataclasses.dataclass
+class FrameStats:
+    objects_drawn: int = 0
+    objects_culled: int = 0
+    draw_calls: int = 0
+    triangles: int = 0
+    shader_binds: int = 0
+    texture_binds: int = 0
+    ubo_updates: int = 0
+    cull_changes: int = 0
+    blend_changes: int = 0
+    depth_changes: int = 0
+
+
+# Draws are recorded during scene traversal (which resolves the inherited render state) and submitted afterwards,
+# this allows drawing them in a different order, e.g. opaque materials before decals and blended ones
+@dataclasses.dataclass(slots=True)
+class DrawCall:
+    info: ObjRenderInfo
+    mat_idx: int
+    indices_count: int
+    shader: gpu.types.GPUShader
+    mvp_uniform: np.ndarray
+    normal_uniform: np.ndarray
+    textures: tuple[gpu.types.GPUTexture, ...]
+    cull: str
+    render_mode: F64Rendermode
+    hardware_depth: bool  # drawn in the opaque pass of hybrid rendering
+    bone_texture: gpu.types.GPUTexture | None = None  # GPU skinned meshes, see mesh/skinning.py
+
+
 def get_scene_render_state(scene: bpy.types.Scene):
     fast64_rs = scene.fast64.renderSettings
     f64render_rs: F64RenderSettings = scene.f64render.render_settings
@@ -68,6 +122,7 @@ def get_scene_render_state(scene: bpy.types.Scene):
         ),
         convert=quantize_tuple(f64render_rs.default_convert, 9.0, -1.0, 1.0),
         cc=SOLID_CC,
+        cc_flags=SOLID_CC_FLAGS,
         tex_confs=([get_tile_conf(getattr(f64render_rs, f"default_tex{i}")) for i in range(0, 8)]),
         tex_size=(32, 32),
     )
@@ -82,64 +137,176 @@ def get_scene_render_state(scene: bpy.types.Scene):
     return state
 
 
+# scene defaults are only re-read after scene updates, see mesh_change_listener
+def get_cached_scene_render_state(scene: bpy.types.Scene) -> F64RenderState:
+    if F64_GLOBALS.scene_render_state is None:
+        F64_GLOBALS.scene_render_state = get_scene_render_state(scene)
+        F64_GLOBALS.layer_base_states = None
+    return F64_GLOBALS.scene_render_state
+
+
 def draw_f64_obj(render_engine: "Fast64RenderEngine", render_state: F64RenderState, info: ObjRenderInfo):
     mvp = info.mvp_matrix
     bbox = info.render_obj.bounding_box
 
     # we need to figure out where what the min max range is for all axis, but we need to do this after projection
     # would've been a neat optimization but it does not work :(
-    min_x = min_y = min_z = float("inf")
-    max_x = max_y = max_z = float("-inf")
-
-    for v in bbox:
-        v = mvp @ v
-        x, y, z = v.xyz / v.w
-
-        if x < min_x:
-            min_x = x
-        if x > max_x:
-            max_x = x
-        if y < min_y:
-            min_y = y
-        if y > max_y:
-            max_y = y
-        if z < min_z:
-            min_z = z
-        if z > max_z:
-            max_z = z
-
-    if (max_x < -1 or min_x > 1) or (max_y < -1 or min_y > 1) or (max_z < -1 or min_z > 1):
+    with PROFILER.stage("cull"):
+        clip = bbox @ mvp.T
+        ndc = clip[:, :3] / clip[:, 3:]
+        min_x, min_y, min_z = ndc.min(axis=0)
+        max_x, max_y, max_z = ndc.max(axis=0)
+        culled = (max_x < -1 or min_x > 1) or (max_y < -1 or min_y > 1) or (max_z < -1 or min_z > 1)
+
+    stats = render_engine.stats
+    if culled:
+        stats.objects_culled += 1
         if not info.obj.use_f3d_culling:
             for _, _, f64mat in info.mats:
                 render_state.set_values_from_cache(f64mat.state)
         return
 
-    render_engine.shader.uniform_float("matMVP", info.mvp_matrix)
-    render_engine.shader.uniform_float("matNorm", info.normal_matrix)
+    stats.objects_drawn += 1
+    stats.ubo_updates += len(info.mats)
+    # numpy matrices are row-major, the shader expects them column-major
+    mvp_uniform, normal_uniform = mvp.T.ravel(), info.normal_matrix.T.ravel()
+    skin = info.render_obj.skin
 
     for mat_idx, indices_count, f64mat in info.mats:
         render_state.set_values_from_cache(f64mat.state)
+        # the inherited state is only valid now, upload it before traversal continues
+        with PROFILER.stage("ubo upload"):
+            render_engine.gpu.ubo_update(info.render_obj.ubo_mat_data[mat_idx], render_state.cached_values)
 
-        gpu.state.face_culling_set(f64mat.cull)
-        if not render_engine.use_atomic_rendering:
-            gpu.state.blend_set(render_state.render_mode.blend)
-            gpu.state.depth_test_set(render_state.render_mode.depth_test)
-            gpu.state.depth_mask_set(render_state.render_mode.depth_write)
+        if skin is not None:  # a single skinned shader, no variants or hardware depth pass
+            hardware_depth, shader = False, render_engine.shader_skinned
+        else:
+            hardware_depth = render_engine.shader_opaque is not None and use_hardware_depth(render_state)
+            shader = render_engine.get_shader(render_state, hardware_depth)
+        render_engine.draw_calls.append(
+            DrawCall(
+                info,
+                mat_idx,
+                indices_count,
+                shader,
+                mvp_uniform,
+                normal_uniform,
+                tuple(tex_conf.buff for tex_conf in render_state.tex_confs),
+                f64mat.cull,
+                render_state.render_mode,
+                hardware_depth,
+                skin.texture if skin is not None else None,
+            )
+        )
 
-        for i in range(8):
-            if render_state.tex_confs[i].buff is not render_engine.last_used_textures.get(i):
-                render_engine.shader.uniform_sampler(f"tex{i}", render_state.tex_confs[i].buff)
-                render_engine.last_used_textures[i] = render_state.tex_confs[i].buff
 
-        info.render_obj.ubo_mat_data[mat_idx].update(render_state.cached_values)
-        render_engine.shader.uniform_block("material", info.render_obj.ubo_mat_data[mat_idx])
+# use_blend: the opaque pass of hybrid rendering writes packed colors to an integer attachment, blending stays off
+def submit_draw_calls(
+    render_engine: "Fast64RenderEngine", draw_calls: list[DrawCall], use_render_mode: bool, use_blend=True
+):
+    stats, backend = render_engine.stats, render_engine.gpu
+    # only forward actual state changes, the state is unknown at the start of a pass
+    cull, blend, depth = None, None, None
+    for call in draw_calls:
+        info = call.info
+        shader = render_engine.bind_shader(call.shader)
+        if render_engine.bound_obj is not info:
+            backend.uniform_float(shader, "matMVP", call.mvp_uniform)
+            backend.uniform_float(shader, "matNorm", call.normal_uniform)
+            if call.bone_texture is not None:
+                backend.uniform_sampler(shader, "boneMatrices", call.bone_texture)
+            render_engine.bound_obj = info
+
+        if call.cull != cull:
+            cull = call.cull
+            backend.face_culling_set(cull)
+            stats.cull_changes += 1
+        if use_render_mode:
+            render_mode = call.render_mode
+            if use_blend and render_mode.blend != blend:
+                blend = render_mode.blend
+                backend.blend_set(blend)
+                stats.blend_changes += 1
+            if (render_mode.depth_test, render_mode.depth_write) != depth:
+                depth = (render_mode.depth_test, render_mode.depth_write)
+                backend.depth_test_set(render_mode.depth_test)
+                backend.depth_mask_set(render_mode.depth_write)
+                stats.depth_changes += 1
+
+        for i, texture in enumerate(call.textures):
+            if texture is not render_engine.last_used_textures.get(i):
+                backend.uniform_sampler(shader, f"tex{i}", texture)
+                render_engine.last_used_textures[i] = texture
+                stats.texture_binds += 1
+
+        backend.uniform_block(shader, "material", info.render_obj.ubo_mat_data[call.mat_idx])
+        stats.draw_calls += 1
+        stats.triangles += call.indices_count // 3
 
         if render_engine.draw_range_impl:
-            info.render_obj.batch.draw_range(
-                render_engine.shader, elem_start=info.render_obj.index_offsets[mat_idx] * 3, elem_count=indices_count
+            backend.draw_range(
+                info.render_obj.batch,
+                shader,
+                elem_start=info.render_obj.index_offsets[call.mat_idx] * 3,
+                elem_count=call.indices_count,
             )
         else:
-            info.render_obj.batch[mat_idx].draw(render_engine.shader)
+            backend.draw(info.render_obj.batch[call.mat_idx], shader)
+
+
+def upload_mesh_buffers(render_engine: "Fast64RenderEngine", obj: bpy.types.Object, render_obj: MeshBuffers):
+    mat_count = max(len(obj.material_slots), 1)
+    if render_obj.skin is not None:
+        vert_buf = create_vert_buf(
+            render_engine.vbo_format_skinned,
+            render_obj.vert,
+            render_obj.norm,
+            render_obj.color,
+            render_obj.uv,
+            render_obj.skin.bone_indices,
+            render_obj.skin.bone_weights,
+        )
+    else:
+        vert_buf = create_vert_buf(
+            render_engine.vbo_format,
+            render_obj.vert,
+            render_obj.norm,
+            render_obj.color,
+            render_obj.uv,
+        )
+    if render_engine.draw_range_impl:
+        render_obj.batch = batch_for_shader(vert_buf, render_obj.indices)
+    else:  # we need to create batches for each material
+        if not obj.material_slots:  # if no material slot, we only have one batch for the whole geo
+            render_obj.batch = [batch_for_shader(vert_buf, render_obj.indices)]
+        else:
+            render_obj.batch = []
+        for i, slot in enumerate(obj.material_slots):
+            indices = render_obj.indices[render_obj.index_offsets[i] : render_obj.index_offsets[i + 1]]
+            if len(indices) == 0:  # ignore unused materials
+                render_obj.batch.append(None)
+            else:
+                render_obj.batch.append(batch_for_shader(vert_buf, indices))
+
+    render_obj.ubo_mat_data = [None] * mat_count
+
+    for i in range(mat_count):
+        render_obj.ubo_mat_data[i] = gpu.types.GPUUniformBuf(bytes(UBO_SIZE))
+
+
+FINAL_RENDER_MESH_SUFFIX = "#render"
+
+
+# final renders evaluate render modifier settings, their meshes are cached separately from the viewport's
+def get_mesh_id(obj: bpy.types.Object, depsgraph: bpy.types.Depsgraph) -> str:
+    mesh_id = f"{obj.name}#{obj.data.name}"
+    return mesh_id + FINAL_RENDER_MESH_SUFFIX if depsgraph.mode == "RENDER" else mesh_id
+
+
+# bone matrices only change if the armature or the skinned object were updated, or the frame changed
+def get_pose_update(obj: bpy.types.Object, armature: bpy.types.Object) -> int:
+    obj_updates = F64_GLOBALS.obj_updates
+    return max(obj_updates.get(obj.name, 0), obj_updates.get(armature.name, 0), F64_GLOBALS.frame_update)
 
 
 def collect_obj_info(
@@ -148,8 +315,6 @@ def collect_obj_info(
     depsgraph: bpy.types.Depsgraph,
     hidden_objs_names: set[str],
     space_view_3d: bpy.types.SpaceView3D,
-    projection_matrix: mathutils.Matrix,
-    view_matrix: mathutils.Matrix,
     always_set: bool,
     set_light_dir=True,
 ):
@@ -160,53 +325,56 @@ def collect_obj_info(
         or (space_view_3d.local_view and not obj.local_view_get(space_view_3d))
     ):
         return
-    mesh_id = f"{obj.name}#{obj.data.name}"
-    if mesh_id in F64_GLOBALS.meshCache:  # check for objects that transitioned from non-f3d to f3d materials
-        render_obj = F64_GLOBALS.meshCache[mesh_id]
+    mesh_id = get_mesh_id(obj, depsgraph)
+    armature = None
+    if render_engine.shader_skinned is not None:
+        armature = get_skin_armature(obj, use_render=depsgraph.mode == "RENDER")
+    render_obj = F64_GLOBALS.meshCache.get(mesh_id)
+    if render_obj is not None and (
+        (render_obj.skin is None) != (armature is None)
+        or (armature is not None and not skin_matches_armature(render_obj.skin, armature))
+    ):  # GPU skinning was toggled, the modifier or the bones changed, convert again
+        del F64_GLOBALS.meshCache[mesh_id]
+        render_obj = None
+    if render_obj is None and armature is None:  # deformed meshes may already be converted for this frame
+        render_obj = F64_GLOBALS.anim_cache.get(mesh_id, depsgraph.scene.frame_current_final)
+        if render_obj is not None:
+            F64_GLOBALS.meshCache[mesh_id] = render_obj
+    if render_obj is not None:  # check for objects that transitioned from non-f3d to f3d materials
+        if render_obj.batch is None:  # GPU buffers were evicted, see AreaResidency
+            if not F64_GLOBALS.area_residency.take_upload():
+                return
+            upload_mesh_buffers(render_engine, obj, render_obj)
     else:  # Mesh not cached: parse & convert mesh data, then prepare a GPU batch
-        if obj.mode == "EDIT":
-            mesh = obj.evaluated_get(depsgraph).to_mesh()
-        else:
-            mesh = obj.evaluated_get(depsgraph).to_mesh(preserve_all_data_layers=True, depsgraph=depsgraph)
-
-        render_obj = F64_GLOBALS.meshCache[mesh_id] = mesh_to_buffers(mesh)
-        render_obj.mesh_name = obj.data.name
-        render_obj.bounding_box = [mathutils.Vector((*corner, 1)) for corner in obj.bound_box]
-
-        mat_count = max(len(obj.material_slots), 1)
-        vert_buf = create_vert_buf(
-            render_engine.vbo_format,
-            render_obj.vert,
-            render_obj.norm,
-            render_obj.color,
-            render_obj.uv,
-        )
-        if render_engine.draw_range_impl:
-            render_obj.batch = batch_for_shader(vert_buf, render_obj.indices)
-        else:  # we need to create batches for each material
-            if not obj.material_slots:  # if no material slot, we only have one batch for the whole geo
-                render_obj.batch = [batch_for_shader(vert_buf, render_obj.indices)]
+        with PROFILER.stage("mesh conversion"):
+            if armature is not None:  # rest pose, deformed by the vertex shader
+                mesh = obj.original.data
+                render_obj = F64_GLOBALS.meshCache[mesh_id] = mesh_to_buffers(mesh)
+                render_obj.skin = create_skin_data(mesh, obj.original, armature)
             else:
-                render_obj.batch = []
-            for i, slot in enumerate(obj.material_slots):
-                indices = render_obj.indices[render_obj.index_offsets[i] : render_obj.index_offsets[i + 1]]
-                if len(indices) == 0:  # ignore unused materials
-                    render_obj.batch.append(None)
+                if obj.mode == "EDIT":
+                    mesh = obj.evaluated_get(depsgraph).to_mesh()
                 else:
-                    render_obj.batch.append(batch_for_shader(vert_buf, indices))
+                    mesh = obj.evaluated_get(depsgraph).to_mesh(preserve_all_data_layers=True, depsgraph=depsgraph)
+                render_obj = F64_GLOBALS.meshCache[mesh_id] = mesh_to_buffers(mesh)
 
-        render_obj.ubo_mat_data = [None] * mat_count
+            render_obj.mesh_name = obj.data.name
+            render_obj.frame = depsgraph.scene.frame_current_final
+            render_obj.bounding_box = np.array([(*corner, 1) for corner in obj.bound_box], dtype=np.float32)
 
-        for i in range(mat_count):
-            render_obj.ubo_mat_data[i] = gpu.types.GPUUniformBuf(bytes(UBO_SIZE))
+            upload_mesh_buffers(render_engine, obj, render_obj)
 
-        obj.to_mesh_clear()
+            if armature is None:
+                obj.to_mesh_clear()
 
-    modelview_matrix = obj.matrix_world
-    mvp_matrix = projection_matrix @ modelview_matrix  # could we use numpy?
-    normal_matrix = (view_matrix @ obj.matrix_world).to_3x3().inverted().transposed()
+    pose_update = get_pose_update(obj, armature) if render_obj.skin is not None else None
+    if pose_update is not None and (render_obj.skin.texture is None or render_obj.skin.pose_update != pose_update):
+        with PROFILER.stage("bone matrices"):  # the cached buffers stay, only the pose changes
+            update_bone_texture(render_obj.skin, obj, armature.evaluated_get(depsgraph), pose_update)
+            render_obj.bounding_box = np.array([(*corner, 1) for corner in obj.bound_box], dtype=np.float32)
 
-    info = ObjRenderInfo(obj, mvp_matrix, normal_matrix, render_obj, [])
+    # matrices are computed for all collected objects at once, see ObjMatrixCache
+    info = ObjRenderInfo(obj, None, None, render_obj, [])
 
     if len(obj.material_slots) == 0:  # fallback if no material, f3d or otherwise
         info.mats.append((0, len(render_obj.indices) * 3, FALLBACK_MATERIAL))
@@ -218,16 +386,17 @@ def collect_obj_info(
             continue
 
         if slot.material not in F64_GLOBALS.materials_cache:
-            try:
-                if slot.material.is_f3d:
-                    F64_GLOBALS.materials_cache[slot.material] = f64_material_parse(
-                        slot.material.f3d_mat, always_set, set_light_dir
-                    )
-                else:  # fallback
-                    F64_GLOBALS.materials_cache[slot.material] = node_material_parse(slot.material)
-            except Exception as e:
-                print(f'Error parsing material "{slot.material.name}": {e}')
-                F64_GLOBALS.materials_cache[slot.material] = FALLBACK_MATERIAL
+            with PROFILER.stage("material parse"):
+                try:
+                    if slot.material.is_f3d:
+                        F64_GLOBALS.materials_cache[slot.material] = f64_material_parse(
+                            slot.material.f3d_mat, always_set, set_light_dir
+                        )
+                    else:  # fallback
+                        F64_GLOBALS.materials_cache[slot.material] = node_material_parse(slot.material)
+                except Exception as e:
+                    print(f'Error parsing material "{slot.material.name}": {e}')
+                    F64_GLOBALS.materials_cache[slot.material] = FALLBACK_MATERIAL
 
         f64mat = F64_GLOBALS.materials_cache[slot.material]
         if f64mat.cull == "BOTH":
@@ -0,0 +1,125 @@
+import os
+import queue
+import struct
+import threading
+import types
+import zlib
+import numpy as np
+
+import bpy
+import gpu
+import mathutils
+
+BACKGROUND_COLOR = (8 / 255, 8 / 255, 8 / 255)  # same as the cleared atomic color texture
+FINAL_RENDER_VIEW = types.SimpleNamespace(local_view=None)  # stands in for the SpaceView3D, no local view
+FRAME_QUEUE_SIZE = 8  # frames waiting to be written before rendering blocks
+PNG_COMPRESSION = 6
+
+
+def get_render_size(scene: bpy.types.Scene) -> tuple[int, int]:
+    scale = scene.render.resolution_percentage / 100
+    return max(1, int(scene.render.resolution_x * scale)), max(1, int(scene.render.resolution_y * scale))
+
+
+def get_camera_matrices(
+    depsgraph: bpy.types.Depsgraph, width: int, height: int
+) -> tuple[mathutils.Matrix, mathutils.Matrix]:  # perspective (projection @ view), view
+    scene = depsgraph.scene
+    camera = scene.camera.evaluated_get(depsgraph)
+    projection = camera.calc_matrix_camera(
+        depsgraph, x=width, y=height, scale_x=scene.render.pixel_aspect_x, scale_y=scene.render.pixel_aspect_y
+    )
+    view = camera.matrix_world.inverted()
+    return projection @ view, view
+
+
+# atomic color texture, one packed RGBA8 value per pixel, rows bottom to top
+def unpack_color_texture(texture: gpu.types.GPUTexture, width: int, height: int) -> np.ndarray:
+    packed = np.array(texture.read(), dtype=np.uint32).reshape(height, width)
+    return packed.view(np.uint8).reshape(height, width, 4).copy()
+
+
+def read_color_texture(texture: gpu.types.GPUTexture, width: int, height: int) -> np.ndarray:
+    values = np.array(texture.read())
+    if values.dtype.kind == "f":
+        values = np.round(np.clip(values, 0.0, 1.0) * 255)
+    return values.astype(np.uint8).reshape(height, width, 4)
+
+
+# the shaders output display (sRGB) values, render results are scene linear
+def pixels_to_linear(pixels: np.ndarray) -> np.ndarray:
+    values = pixels.astype(np.float32) / 255
+    rgb = values[..., :3]
+    values[..., :3] = np.where(rgb <= 0.04045, rgb / 12.92, ((rgb + 0.055) / 1.055) ** 2.4)
+    return values
+
+
+def encode_png(pixels: np.ndarray) -> bytes:  # RGBA8, rows bottom to top
+    height, width = pixels.shape[:2]
+    rows = np.flipud(pixels).reshape(height, width * 4)
+    raw = np.hstack((np.zeros((height, 1), dtype=np.uint8), rows)).tobytes()  # filter type 0 per row
+
+    def chunk(tag: bytes, data: bytes) -> bytes:
+        return struct.pack(">I", len(data)) + tag + data + struct.pack(">I", zlib.crc32(tag + data))
+
+    header = struct.pack(">IIBBBBB", width, height, 8, 6, 0, 0, 0)
+    return (
+        b"\x89PNG\r\n\x1a\n"
+        + chunk(b"IHDR", header)
+        + chunk(b"IDAT", zlib.compress(raw, PNG_COMPRESSION))
+        + chunk(b"IEND", b"")
+    )
+
+
+# Encodes and writes rendered frames on a background thread, so the next frame can be drawn meanwhile
+# (zlib releases the GIL). The queue is bounded, rendering waits if writing falls behind.
+class FrameWriter:
+    def __init__(self):
+        self.queue: queue.Queue[tuple[str, np.ndarray]] = queue.Queue(maxsize=FRAME_QUEUE_SIZE)
+        self.thread: threading.Thread | None = None
+
+    def submit(self, path: str, pixels: np.ndarray):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.write_loop, name="f64render frame writer", daemon=True)
+            self.thread.start()
+        self.queue.put((path, pixels))
+
+    def flush(self):
+        self.queue.join()
+
+    def write_loop(self):
+        while True:
+            path, pixels = self.queue.get()
+            try:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                with open(path, "wb") as f:
+                    f.write(encode_png(pixels))
+            except Exception as e:
+                print(f"Error writing frame {path}: {e}")
+            finally:
+                self.queue.task_done()
+
+
+FRAME_WRITER = FrameWriter()
+
+
+# the writer thread is a daemon, frames still queued when Blender exits (e.g. 'blender -b -a') would be lost
+@bpy.app.handlers.persistent
+def flush_frame_writer(*_args):
+    FRAME_WRITER.flush()
+
+
+RENDER_HANDLERS = ("render_complete", "render_cancel")
+
+
+def register():
+    for handler_name in RENDER_HANDLERS:
+        getattr(bpy.app.handlers, handler_name).append(flush_frame_writer)
+
+
+def unregister():
+    for handler_name in RENDER_HANDLERS:
+        handler_list = getattr(bpy.app.handlers, handler_name)
+        while flush_frame_writer in handler_list:
+            handler_list.remove(flush_frame_writer)
+    FRAME_WRITER.flush()
@@ -0,0 +1,91 @@
+import typing
+import weakref
+
+import bpy
+
+from .profiler import PROFILER
+from .sampling_profiler import SAMPLING_PROFILER
+
+if typing.TYPE_CHECKING:
+    from .renderer import Fast64RenderEngine
+
+
+# Makes sure every region renders the scene at most once per redraw.
+# Scenes are drawn from 'view_draw', the POST_VIEW draw handler only acts as a fallback for regions where
+# 'view_draw' did not run during the current redraw. There is a single handler for all engine instances,
+# it gets removed once the last engine is freed. Regions are forgotten once they no longer use their engine.
+class FrameScheduler:
+    def __init__(self):
+        self.engines: weakref.WeakSet["Fast64RenderEngine"] = weakref.WeakSet()
+        self.region_engines: weakref.WeakValueDictionary[int, "Fast64RenderEngine"] = weakref.WeakValueDictionary()
+        self.pending_regions: set[int] = set()  # regions drawn by 'view_draw', waiting for their POST_VIEW callback
+        self.draw_handler = None
+        self.render_count = 0
+        self.redundant_count = 0
+
+    def add_engine(self, engine: "Fast64RenderEngine"):
+        self.engines.add(engine)
+        if self.draw_handler is None:
+            self.draw_handler = bpy.types.SpaceView3D.draw_handler_add(self.on_draw_handler, (), "WINDOW", "POST_VIEW")
+
+    def remove_engine(self, engine: "Fast64RenderEngine"):
+        self.engines.discard(engine)
+        for region, region_engine in list(self.region_engines.items()):
+            if region_engine is engine:
+                self.forget_region(region)
+        if len(self.engines) == 0:
+            self.remove_handler()
+
+    def forget_region(self, region: int):
+        self.region_engines.pop(region, None)
+        self.pending_regions.discard(region)
+
+    def remove_handler(self):
+        if self.draw_handler is not None:
+            bpy.types.SpaceView3D.draw_handler_remove(self.draw_handler, "WINDOW")
+            self.draw_handler = None
+        self.pending_regions.clear()
+
+    def view_draw(self, engine: "Fast64RenderEngine", context: bpy.types.Context, depsgraph: bpy.types.Depsgraph):
+        region = context.region.as_pointer()
+        self.region_engines[region] = engine
+        engine.last_depsgraph = depsgraph
+        self.render_count += 1
+        with PROFILER.frame(), SAMPLING_PROFILER.frame():
+            engine.draw_scene(context, depsgraph)
+        self.pending_regions.add(region)
+
+    def on_draw_handler(self):
+        context = bpy.context
+        region = context.region.as_pointer()
+        engine = self.region_engines.get(region)
+        if engine is None or not region_uses_engine(context, engine):  # engine freed or switched away from
+            self.forget_region(region)
+            return
+        if region in self.pending_regions:
+            self.pending_regions.discard(region)
+            self.redundant_count += 1
+            return
+        if engine.last_depsgraph is None:
+            return
+        self.render_count += 1
+        with PROFILER.frame(), SAMPLING_PROFILER.frame():
+            engine.draw_scene(context, engine.last_depsgraph)
+
+    def pop_counts(self) -> tuple[int, int]:
+        counts = (self.render_count, self.redundant_count)
+        self.render_count = self.redundant_count = 0
+        return counts
+
+
+def region_uses_engine(context: bpy.types.Context, engine: "Fast64RenderEngine") -> bool:
+    space_data = context.space_data
+    return (
+        space_data is not None
+        and space_data.type == "VIEW_3D"
+        and space_data.shading.type == "RENDERED"
+        and context.scene.render.engine == engine.bl_idname
+    )
+
+
+FRAME_SCHEDULER = FrameScheduler()
@@ -1,22 +1,52 @@
 import bpy
 
+from .render_target import RenderTargetPool
+from .utils.hierarchy import get_hierarchy_signature
+from .utils.bounds import GroupBoundsCache
+from .residency import AreaResidency
+from .anim_cache import AnimationCache
+from .shared_resources import SharedResources
+
 
 class F64Globals:
     def __init__(self):
+        self.shared = SharedResources()  # not cleared on file load
         self.clear()
 
     def clear(self):
         self.materials_cache: dict[bpy.types.Material, "F64Material"] = {}
         self.meshCache: dict["MeshBuffers"] = {}
+        self.collision_cache: dict[str, "CollisionBuffers"] = {}  # collision view, same keys as meshCache
+        self.anim_cache = AnimationCache()  # deformed meshCache entries of other frames
         self.obj_lights: dict[str, "F64Light"] = {}
         self.sm64_area_lookup: dict | None = None
         self.oot_room_lookup: dict | None = None  # oot
-        self.rebuild_shaders = True
-        self.current_ucode = self.world_lighting = self.current_gamemode = None
+        self.obj_hierarchy: dict[str, tuple] = {}  # obj name -> hierarchy signature the lookups were built with
+        self.sm64_area_bounds = GroupBoundsCache()
+        self.area_residency = AreaResidency()
+        self.oot_room_bounds = GroupBoundsCache()
+        self.oot_room_stats: dict[str, "RoomDrawStats"] = {}  # of the last drawn frame
+        self.scene_render_state: "F64RenderState | None" = None
+        self.layer_rendermodes: dict[int | str, "F64RenderState"] | None = None
+        self.layer_rendermodes_key: tuple | None = None  # game mode and world the layer rendermodes were read from
+        self.layer_base_states: dict[str, "F64RenderState"] | None = None  # oot, scene state + layer rendermode
+        self.render_targets = RenderTargetPool()
+        self.frame_stats: "FrameStats | None" = None  # of the last drawn frame, for the settings popover
+        self.update_counter = 0  # bumped on every depsgraph update
+        self.obj_updates: dict[str, int] = {}  # obj name -> update_counter of its last depsgraph update
+        self.frame_update = 0  # update_counter of the last frame change, animation may pose any armature
+        self.current_ucode = self.current_gamemode = None
 
     def clear_areas(self):
         self.sm64_area_lookup = None
         self.oot_room_lookup = None
 
+    # full rebuild of the area/room lookups only if the object is new or was reparented/changed its root type
+    def update_obj_hierarchy(self, obj: bpy.types.Object):
+        signature = get_hierarchy_signature(obj)
+        if self.obj_hierarchy.get(obj.name) != signature:
+            self.obj_hierarchy[obj.name] = signature
+            self.clear_areas()
+
 
 F64_GLOBALS = F64Globals()
@@ -18,3 +18,23 @@ BL_INP = {
 @functools.cache
 def get_blender_settings(blend_cycle1: tuple[str, str, str, str], blend_cycle2: tuple[str, str, str, str]) -> tuple:
     return tuple(BL_INP[x] for x in blend_cycle1 + blend_cycle2)
+
+
+# blender inputs that are always 0 in the shader's emulation, memory alpha is not stored (see blendColor)
+ZERO_INPUTS = {BL_INP["G_BL_0"], BL_INP["G_BL_A_MEM"]}
+
+
+# blender inputs that are always 1 as the B weight of a cycle with a zero A weight (1MA is 1 - A)
+ONE_WEIGHTS_ZERO_A = {BL_INP["G_BL_1"], BL_INP["G_BL_1MA"]}
+
+
+# whether both cycles output the combiner color unchanged, independent of the framebuffer (e.g. no fog)
+@functools.cache
+def is_blender_passthrough(blender: tuple[int, ...]) -> bool:
+    for p, a, m, b in (blender[:4], blender[4:]):
+        if a in ZERO_INPUTS:  # only M is weighted, e.g. (CLR_IN, 0, CLR_IN, 1) of the non-AA opaque rendermodes
+            if m != BL_INP["G_BL_CLR_IN"] or b not in ONE_WEIGHTS_ZERO_A:
+                return False
+        elif p != BL_INP["G_BL_CLR_IN"] or (m != BL_INP["G_BL_CLR_IN"] and b not in ZERO_INPUTS):
+            return False
+    return True
@@ -79,17 +79,72 @@ CC2_A = {  # TEX0 and TEX1 are swapped
 
 SOLID_CC = (0, 0, 0, 5, 0, 0, 0, 5, 0, 0, 0, 5, 0, 0, 0, 5)
 
+CC_FLAG_TEX0_UNUSED = 1 << 0
+CC_FLAG_TEX1_UNUSED = 1 << 1
+CC_FLAG_CYCLE2_PASSTHROUGH = 1 << 2
 
-# Fetches CC settings from a given fast64-material
-def get_cc_settings(f3d_mat) -> np.ndarray:
+# inputs as the shader sees them, in the second cycle TEXEL0/1 are already swapped by CC2_C/CC2_A
+TEX0_COLOR_INPUTS = {CC1_C["TEXEL0"], CC1_C["TEXEL0_ALPHA"]}
+TEX1_COLOR_INPUTS = {CC1_C["TEXEL1"], CC1_C["TEXEL1_ALPHA"]}
+TEX0_ALPHA_INPUTS, TEX1_ALPHA_INPUTS = {CC1_A["TEXEL0"]}, {CC1_A["TEXEL1"]}
+COMBINED_COLOR_INPUTS, COMBINED_ALPHA_INPUTS = {CC1_C["COMBINED"], CC1_C["COMBINED_ALPHA"]}, {CC1_A["COMBINED"]}
+PASSTHROUGH_CYCLE = (0, 0, 0, CC1_C["COMBINED"], 0, 0, 0, CC1_A["COMBINED"])
+
+
+def simplify_cc_term(a: int, b: int, c: int, d: int, zero_inputs: set[int]) -> tuple[int, int, int, int]:
+    a, b, c, d = (0 if x in zero_inputs else x for x in (a, b, c, d))
+    if c == 0 or a == b:  # (A - B) * C drops out, only D is left
+        return (0, 0, 0, d)
+    return (a, b, c, d)
+
+
+# Symbolically simplifies both cycles of the combiner (A - B) * C + D.
+# Returns the reduced encoding, with every input that can't affect the result set to 0, and CC_FLAG_* flags
+# that let the shader skip texture sampling or the second cycle.
+def simplify_cc(cc: tuple[int, ...] | np.ndarray, two_cycle: bool) -> tuple[np.ndarray, int]:
+    cc = [int(x) for x in cc]
+    # the first cycle has no combined input yet, the shader starts with 0
+    cycle1 = (
+        *simplify_cc_term(*cc[0:4], COMBINED_COLOR_INPUTS),
+        *simplify_cc_term(*cc[4:8], COMBINED_ALPHA_INPUTS),
+    )
+    cycle2 = (*simplify_cc_term(*cc[8:12], set()), *simplify_cc_term(*cc[12:16], set()))
+
+    if two_cycle:
+        if not (COMBINED_COLOR_INPUTS & set(cycle2[0:4]) or COMBINED_ALPHA_INPUTS & set(cycle2[4:8])):
+            cycle1 = (0,) * 8  # the result of the first cycle is never read
+        used_cycles = (cycle1, cycle2)
+    else:  # the second cycle is not evaluated
+        cycle2 = PASSTHROUGH_CYCLE
+        used_cycles = (cycle1,)
+
+    color_inputs = {x for cycle in used_cycles for x in cycle[0:4]}
+    alpha_inputs = {x for cycle in used_cycles for x in cycle[4:8]}
+    flags = 0
+    if not (TEX0_COLOR_INPUTS & color_inputs or TEX0_ALPHA_INPUTS & alpha_inputs):
+        flags |= CC_FLAG_TEX0_UNUSED
+    if not (TEX1_COLOR_INPUTS & color_inputs or TEX1_ALPHA_INPUTS & alpha_inputs):
+        flags |= CC_FLAG_TEX1_UNUSED
+    if cycle2 == PASSTHROUGH_CYCLE:
+        flags |= CC_FLAG_CYCLE2_PASSTHROUGH
+
+    return np.array(cycle1 + cycle2, dtype=np.int32), flags
+
+
+SOLID_CC_FLAGS = simplify_cc(SOLID_CC, False)[1]
+
+
+# Fetches CC settings from a given fast64-material, returns the simplified combiner and its flags
+def get_cc_settings(f3d_mat) -> tuple[np.ndarray, int]:
     c0 = f3d_mat.combiner1
     c1 = f3d_mat.combiner2
 
+    two_cycle = f3d_mat.rdp_settings.g_mdsft_cycletype == "G_CYC_2CYCLE"
     if f3d_mat.rdp_settings.g_mdsft_cycletype == "G_CYC_1CYCLE":
         c1 = c0
 
-    return np.array(
-        [
+    return simplify_cc(
+        (
             CC1_C[c0.A],
             CC1_C[c0.B],
             CC1_C[c0.C],
@@ -106,6 +161,6 @@ def get_cc_settings(f3d_mat) -> np.ndarray:
             CC2_A[c1.B_alpha],
             CC2_A[c1.C_alpha],
             CC2_A[c1.D_alpha],
-        ],
-        dtype=np.int32,
+        ),
+        two_cycle,
     )
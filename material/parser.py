@@ -8,7 +8,7 @@ import mathutils
 import numpy as np
 
 from .tile import get_tile_conf, F64Texture
-from .cc import SOLID_CC, get_cc_settings
+from .cc import SOLID_CC, SOLID_CC_FLAGS, CC_FLAG_TEX0_UNUSED, CC_FLAG_TEX1_UNUSED, get_cc_settings
 from .blender import get_blender_settings
 from ..globals import F64_GLOBALS
 
@@ -194,7 +194,12 @@ UNIFORM_BUFFER_STRUCT = struct.Struct(
     "4f 4f 4f 4f"  # prim, prim_lod, prim-depth, env, ambient
     "3f f 3f i 3f i"  # ck center, alpha clip, ck scale, light count, width, mipmap count
     "6f 2i"  # k0-k5, tex size
+    "i 12x"  # cc flags, padding
 )
+# position (in 32-bit words) of the blender and color-combiner settings, shader variants are keyed by these
+BLENDER_CC_OFFSET = struct.calcsize((TILE_STRUCT * 8) + (LIGHT_STRUCT * 8)) // 4
+BLENDER_CC_SIZE = 8 + 16
+OTHERMODE_L_OFFSET = BLENDER_CC_OFFSET + BLENDER_CC_SIZE + 1  # after geoMode
 # version of the uniform buffer with all ints
 UNIFORM_BUFFER_MASK_STRUCT = struct.Struct(UNIFORM_BUFFER_STRUCT.format.replace("f", "I").replace("i", "I"))
 
@@ -231,6 +236,7 @@ class F64RenderState:
     cc: tuple[
         float, float, float, float, float, float, float, float, float, float, float, float, float, float, float, float
     ] | None = None
+    cc_flags: int | None = None  # CC_FLAG_*, set together with cc
     render_mode: F64Rendermode | None = None
     flags: int = 0
     geo_mode: int = 0
@@ -322,6 +328,7 @@ class F64RenderState:
                 mask_single(self.mip_count),
                 *mask(self.convert, 6),
                 *mask(self.tex_size, 2),
+                mask_single(self.cc_flags),
             ),
             dtype=np.uint64,
         )
@@ -337,6 +344,7 @@ class F64RenderState:
     def copy(self):
         new = copy.copy(self)
         new.cached_values = new.cached_values.copy()
+        new.tex_confs = list(new.tex_confs)  # set_values_from_cache replaces entries in place
         return new
 
     def set_from_rendermode(self, rendermode: RenderMode):
@@ -391,7 +399,7 @@ def f64_material_parse(f3d_mat: "F3DMaterialProperty", always_set: bool, set_lig
     if always_set or rdp.set_rendermode:
         state.set_from_rendermode(parse_f3d_mat_rendermode(f3d_mat))
     if always_set or f3d_mat.set_combiner:
-        state.cc = get_cc_settings(f3d_mat)
+        state.cc, state.cc_flags = get_cc_settings(f3d_mat)
     if always_set or (f3d_mat.set_prim and cc_uses["Primitive"]):
         state.prim_color = quantize_srgb(f3d_mat.prim_color)
         state.prim_lod = quantize_tuple((f3d_mat.prim_lod_frac, f3d_mat.prim_lod_min), 8)
@@ -425,7 +433,10 @@ def f64_material_parse(f3d_mat: "F3DMaterialProperty", always_set: bool, set_lig
     if rdp.g_cull_front:
         f64mat.cull = "BOTH" if f64mat.cull == "BACK" else "FRONT"
 
-    use_tex0, use_tex1 = f3d_mat.tex0.tex_set and cc_uses["Texture 0"], f3d_mat.tex1.tex_set and cc_uses["Texture 1"]
+    # the simplified combiner may not read a texture even though it's referenced, skip binding those
+    cc_flags = state.cc_flags or 0
+    use_tex0 = f3d_mat.tex0.tex_set and cc_uses["Texture 0"] and not cc_flags & CC_FLAG_TEX0_UNUSED
+    use_tex1 = f3d_mat.tex1.tex_set and cc_uses["Texture 1"] and not cc_flags & CC_FLAG_TEX1_UNUSED
     if use_tex0:
         state.tex_confs[0] = get_tile_conf(f3d_mat.tex0)
     if use_tex1:
@@ -481,6 +492,6 @@ def node_material_parse(mat: bpy.types.Material) -> F64Material:
         if bsdf:
             color = quantize_srgb(bsdf.inputs["Base Color"].default_value)
 
-    state = F64RenderState(prim_color=color, cc=SOLID_CC)
+    state = F64RenderState(prim_color=color, cc=SOLID_CC, cc_flags=SOLID_CC_FLAGS)
     state.save_cache()
     return F64Material(state)
@@ -0,0 +1,161 @@
+import dataclasses
+
+import bpy
+import gpu
+
+from .common import UBO_SIZE
+from .globals import F64_GLOBALS
+from .material.parser import quantize, quantize_tuple_cached, quantize_srgb_cached, parse_f3d_rendermode_preset
+from .shader_cache import SHADER_CACHE
+
+TOP_COUNT = 5
+FUNCTION_CACHES = (quantize, quantize_tuple_cached, quantize_srgb_cached, parse_f3d_rendermode_preset)
+FUNCTION_CACHE_ENTRY_SIZE = 200  # rough estimate, key tuple + result + dict entry
+TEXTURE_FORMAT_SIZES = {"RGBA8": 4, "SRGB8_A8": 4, "RGBA16F": 8, "RGBA32F": 16, "R32I": 4, "R32UI": 4}
+
+PURGE_ITEMS = [
+    ("MESHES", "Meshes", "Mesh buffers, GPU batches, UBOs and collision buffers"),
+    ("ANIMATION", "Animation Frames", "Converted frames of deformed meshes"),
+    ("MATERIALS", "Materials", "Parsed materials and render states"),
+    ("FUNCTIONS", "Function Caches", "Memoized quantization and rendermode preset results"),
+    ("RENDER_TARGETS", "Render Targets", "Per viewport color/depth textures"),
+]
+
+
+@dataclasses.dataclass
+class CacheUsage:
+    name: str
+    entries: int = 0
+    cpu_bytes: int = 0
+    gpu_bytes: int = 0
+
+
+@dataclasses.dataclass
+class MemoryReport:
+    caches: list[CacheUsage]
+    top_meshes: list[tuple[str, int]]  # name, CPU + GPU bytes
+    top_textures: list[tuple[str, int]]  # image name, GPU bytes
+
+    @property
+    def total_cpu_bytes(self) -> int:
+        return sum(cache.cpu_bytes for cache in self.caches)
+
+    @property
+    def total_gpu_bytes(self) -> int:
+        return sum(cache.gpu_bytes for cache in self.caches)
+
+
+def get_texture_size(texture: gpu.types.GPUTexture) -> int:
+    return texture.width * texture.height * TEXTURE_FORMAT_SIZES.get(texture.format, 4)
+
+
+def get_mesh_usage(mesh_sizes: list[tuple[str, int]]) -> tuple[CacheUsage, CacheUsage]:
+    meshes, ubos = CacheUsage("Meshes"), CacheUsage("Material UBOs")
+    for mesh_id, render_obj in F64_GLOBALS.meshCache.items():
+        cpu_bytes = render_obj.get_gpu_size() + render_obj.index_offsets.nbytes  # CPU copies are kept
+        gpu_bytes = render_obj.get_gpu_size() if render_obj.batch is not None else 0  # evicted, see AreaResidency
+        meshes.entries += 1
+        meshes.cpu_bytes += cpu_bytes
+        meshes.gpu_bytes += gpu_bytes
+        if render_obj.ubo_mat_data is not None:
+            ubos.entries += len(render_obj.ubo_mat_data)
+            ubos.gpu_bytes += len(render_obj.ubo_mat_data) * UBO_SIZE
+        mesh_sizes.append((mesh_id, cpu_bytes + gpu_bytes))
+    return meshes, ubos
+
+
+def get_material_usage(textures: dict[str, gpu.types.GPUTexture]) -> CacheUsage:
+    usage = CacheUsage("Materials")
+    for material, f64mat in F64_GLOBALS.materials_cache.items():
+        usage.entries += 1
+        state = f64mat.state
+        if state.cached_values is not None:
+            usage.cpu_bytes += state.cached_values.nbytes + state.cached_mask.nbytes
+        try:
+            f3d_mat = material.f3d_mat if material.is_f3d else None
+        except (ReferenceError, AttributeError):  # removed material or fast64 not loaded
+            continue
+        if f3d_mat is None or state.tex_confs is None:
+            continue
+        for i, tex_prop in enumerate((f3d_mat.tex0, f3d_mat.tex1)):
+            if tex_prop.tex is not None and state.tex_confs[i] is not None:
+                textures[tex_prop.tex.name] = state.tex_confs[i].buff
+    return usage
+
+
+def get_memory_report(top_count=TOP_COUNT) -> MemoryReport:
+    mesh_sizes: list[tuple[str, int]] = []
+    textures: dict[str, gpu.types.GPUTexture] = {}
+    meshes, ubos = get_mesh_usage(mesh_sizes)
+    caches = [meshes, ubos, get_material_usage(textures)]
+
+    texture_sizes = [(name, get_texture_size(texture)) for name, texture in textures.items()]
+    # textures are owned by the images, listed to see what materials keep on the GPU
+    caches.append(CacheUsage("Textures", len(textures), 0, sum(size for _, size in texture_sizes)))
+    caches.append(CacheUsage("Collision Buffers", len(F64_GLOBALS.collision_cache)))
+    anim_cache = F64_GLOBALS.anim_cache  # entries may be shared with the mesh cache for the current frame
+    caches.append(CacheUsage("Animation Frames", len(anim_cache.frames), anim_cache.size // 2, anim_cache.size // 2))
+
+    targets = CacheUsage("Render Targets")
+    for target in F64_GLOBALS.render_targets.targets.values():
+        targets.entries += 1
+        for texture in (target.depth_texture, target.color_texture, target.hw_depth_texture):
+            if texture is not None:
+                targets.gpu_bytes += get_texture_size(texture)
+    caches.append(targets)
+    caches.append(CacheUsage("Shaders", len(SHADER_CACHE.shaders)))
+
+    function_entries = sum(func.cache_info().currsize for func in FUNCTION_CACHES)
+    caches.append(CacheUsage("Function Caches", function_entries, function_entries * FUNCTION_CACHE_ENTRY_SIZE))
+
+    def largest(sizes: list[tuple[str, int]]):
+        return sorted(sizes, key=lambda item: -item[1])[:top_count]
+
+    return MemoryReport(caches, largest(mesh_sizes), largest(texture_sizes))
+
+
+def purge_caches(caches: set[str]):
+    if "MESHES" in caches:
+        F64_GLOBALS.meshCache.clear()
+        F64_GLOBALS.collision_cache.clear()
+        F64_GLOBALS.area_residency.area_meshes.clear()
+    if "ANIMATION" in caches:
+        F64_GLOBALS.anim_cache.clear()
+    if "MATERIALS" in caches:
+        F64_GLOBALS.materials_cache.clear()
+        F64_GLOBALS.scene_render_state = None
+        F64_GLOBALS.layer_rendermodes = F64_GLOBALS.layer_base_states = None
+    if "FUNCTIONS" in caches:
+        for func in FUNCTION_CACHES:
+            func.cache_clear()
+    if "RENDER_TARGETS" in caches:
+        F64_GLOBALS.render_targets.clear()
+    F64_GLOBALS.update_counter += 1  # retained frames may reference purged data
+
+
+def format_bytes(size: int) -> str:
+    for unit in ("B", "KB", "MB"):
+        if size < 1024:
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.2f} GB"
+
+
+class F64RENDER_OT_purge_caches(bpy.types.Operator):
+    bl_idname = "f64render.purge_caches"
+    bl_label = "Purge Caches"
+    bl_description = "Frees the selected f64render caches, they are rebuilt on the next redraw"
+
+    caches: bpy.props.EnumProperty(
+        name="Caches", items=PURGE_ITEMS, options={"ENUM_FLAG"}, default={item[0] for item in PURGE_ITEMS}
+    )
+
+    def invoke(self, context, event):
+        return context.window_manager.invoke_props_dialog(self)
+
+    def execute(self, context):
+        purge_caches(set(self.caches))
+        for area in context.screen.areas:
+            if area.type == "VIEW_3D":
+                area.tag_redraw()
+        return {"FINISHED"}
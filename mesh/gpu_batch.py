@@ -3,7 +3,13 @@ import gpu
 
 
 def create_vert_buf(
-    vbo_format, buff_vert: np.ndarray, buff_norm: np.ndarray, buff_color: np.ndarray, buff_uv: np.ndarray
+    vbo_format,
+    buff_vert: np.ndarray,
+    buff_norm: np.ndarray,
+    buff_color: np.ndarray,
+    buff_uv: np.ndarray,
+    buff_bone_indices: np.ndarray | None = None,
+    buff_bone_weights: np.ndarray | None = None,
 ) -> list[gpu.types.GPUBatch]:
     vbo = gpu.types.GPUVertBuf(vbo_format, len(buff_vert))
 
@@ -11,6 +17,9 @@ def create_vert_buf(
     vbo.attr_fill("inNormal", buff_norm)
     vbo.attr_fill("inColor", buff_color)
     vbo.attr_fill("inUV", buff_uv)
+    if buff_bone_indices is not None:  # GPU skinning
+        vbo.attr_fill("inBoneIndices", buff_bone_indices)
+        vbo.attr_fill("inBoneWeights", buff_bone_weights)
 
     return vbo
 
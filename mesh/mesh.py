@@ -6,6 +6,7 @@ import bmesh
 import time
 import gpu
 from ..material.parser import F64Material
+from .skinning import SkinData
 
 
 # Container for all vertex attributes
@@ -23,6 +24,12 @@ class MeshBuffers:
     ubo_mat_data: list[gpu.types.GPUUniformBuf]
     materials: list[F64Material] = None
     mesh_name: str = ""  # multiple obj. can share the same mesh, store to allow deletion by name
+    frame: float | None = None  # scene frame the (possibly deformed) mesh was converted at
+    skin: SkinData | None = None  # rest pose buffers deformed by the vertex shader, see mesh/skinning.py
+
+    def get_gpu_size(self) -> int:  # approximate size of the vertex and index buffers
+        size = self.vert.nbytes + self.color.nbytes + self.uv.nbytes + self.norm.nbytes + self.indices.nbytes
+        return size + (self.skin.get_size() if self.skin is not None else 0)
 
 
 # Converts a blender mesh into buffers to be used by the GPU renderer
@@ -0,0 +1,108 @@
+import dataclasses
+import numpy as np
+
+import bpy
+import gpu
+
+MAX_INFLUENCES = 4  # bones per vertex, the vertex shader blends a fixed number of matrices
+IDENTITY_SLOT = 0  # bone matrix slot of vertices without (deforming) vertex groups
+
+
+# Rest pose skinning attributes of a mesh, per face-corner like the rest of MeshBuffers.
+# Bone matrices are uploaded as a RGBA32F texture, one row per slot with a matrix column per texel.
+@dataclasses.dataclass
+class SkinData:
+    armature_name: str
+    armature_data_name: str  # bone renames and rest pose edits update the Armature, see cache_del_by_armature
+    bone_names: list[str]  # bone of each slot, starting at slot 1
+    inv_rest_matrices: np.ndarray  # (bones, 4, 4), armature space
+    bone_indices: np.ndarray  # (corners, 4) int32
+    bone_weights: np.ndarray  # (corners, 4) float32
+    texture: gpu.types.GPUTexture | None = None
+    pose_update: int = -1  # pose update the texture was built at, see get_pose_update
+
+    def get_size(self) -> int:
+        return self.bone_indices.nbytes + self.bone_weights.nbytes
+
+
+# Only a single plain armature modifier can be moved to the GPU, anything else is deformed on the CPU.
+# The rest pose is read from the original mesh, so no other modifier may be active.
+def get_skin_armature(obj: bpy.types.Object, use_render=False) -> bpy.types.Object | None:
+    if obj.type != "MESH" or obj.mode == "EDIT" or obj.data.shape_keys is not None:
+        return None
+    active_mods = [mod for mod in obj.modifiers if (mod.show_render if use_render else mod.show_viewport)]
+    if len(active_mods) != 1:
+        return None
+    mod = active_mods[0]
+    if (
+        mod.type != "ARMATURE"
+        or mod.object is None
+        or not mod.use_vertex_groups
+        or mod.use_bone_envelopes
+        or mod.use_deform_preserve_volume
+        or mod.use_multi_modifier
+        or mod.vertex_group
+    ):
+        return None
+    return mod.object
+
+
+# bones can be renamed or removed after the skin was created
+def skin_matches_armature(skin: SkinData, armature: bpy.types.Object) -> bool:
+    pose_bones = armature.pose.bones
+    return skin.armature_name == armature.name and all(name in pose_bones for name in skin.bone_names)
+
+
+def create_skin_data(mesh: bpy.types.Mesh, obj: bpy.types.Object, armature: bpy.types.Object) -> SkinData:
+    bones = [bone for bone in armature.data.bones if bone.use_deform]
+    bone_slots = {bone.name: i + 1 for i, bone in enumerate(bones)}
+    group_slots = {group.index: bone_slots[group.name] for group in obj.vertex_groups if group.name in bone_slots}
+
+    vert_indices = np.zeros((len(mesh.vertices), MAX_INFLUENCES), dtype=np.int32)
+    vert_weights = np.zeros((len(mesh.vertices), MAX_INFLUENCES), dtype=np.float32)
+    vert_weights[:, 0] = 1.0  # IDENTITY_SLOT, like the armature modifier keeps unweighted vertices in place
+    for vert in mesh.vertices:
+        influences = [(g.weight, group_slots[g.group]) for g in vert.groups if g.group in group_slots and g.weight > 0]
+        if not influences:
+            continue
+        influences = sorted(influences, reverse=True)[:MAX_INFLUENCES]
+        total = sum(weight for weight, _ in influences)
+        for i, (weight, slot) in enumerate(influences):
+            vert_indices[vert.index, i] = slot
+            vert_weights[vert.index, i] = weight / total
+
+    mesh.calc_loop_triangles()
+    corner_verts = np.empty(len(mesh.loop_triangles) * 3, dtype=np.int32)
+    mesh.loop_triangles.foreach_get("vertices", corner_verts)
+
+    inv_rest_matrices = np.array([bone.matrix_local.inverted() for bone in bones], dtype=np.float32).reshape(-1, 4, 4)
+    return SkinData(
+        armature.name,
+        armature.data.name,
+        [bone.name for bone in bones],
+        inv_rest_matrices,
+        vert_indices[corner_verts],
+        vert_weights[corner_verts],
+    )
+
+
+def get_bone_matrices(skin: SkinData, obj: bpy.types.Object, armature: bpy.types.Object) -> np.ndarray:
+    # object space -> armature space, deformed by the pose, and back
+    to_armature = np.array(armature.matrix_world.inverted() @ obj.matrix_world, dtype=np.float32)
+    from_armature = np.linalg.inv(to_armature)
+    pose_bones = armature.pose.bones
+    pose_matrices = np.array([pose_bones[name].matrix for name in skin.bone_names], dtype=np.float32).reshape(-1, 4, 4)
+
+    matrices = np.empty((len(skin.bone_names) + 1, 4, 4), dtype=np.float32)
+    matrices[IDENTITY_SLOT] = np.identity(4, dtype=np.float32)
+    matrices[1:] = from_armature @ pose_matrices @ skin.inv_rest_matrices @ to_armature
+    return matrices
+
+
+# only the bone matrices change between frames, rebuilt once per pose update
+def update_bone_texture(skin: SkinData, obj: bpy.types.Object, armature: bpy.types.Object, pose_update: int):
+    matrices = get_bone_matrices(skin, obj, armature)
+    columns = np.ascontiguousarray(matrices.transpose(0, 2, 1)).ravel()  # numpy is row-major, one column per texel
+    data = gpu.types.Buffer("FLOAT", len(columns), columns.tolist())
+    skin.texture = gpu.types.GPUTexture((4, len(matrices)), format="RGBA32F", data=data)
+    skin.pose_update = pose_update
@@ -1,46 +1,55 @@
 import copy
+import dataclasses
 from typing import NamedTuple
 
 import bpy
 import mathutils
 
 from .material.parser import parse_f3d_rendermode_preset, F64RenderState
-from .common import ObjRenderInfo, draw_f64_obj, collect_obj_info, get_scene_render_state
+from .common import ObjRenderInfo, draw_f64_obj, collect_obj_info, get_cached_scene_render_state
+from .utils.hierarchy import get_children_map, get_hierarchy_signature
+from .utils.bounds import is_box_visible
+from .utils.matrix import matrix_to_np
+from .profiler import PROFILER
 from .properties import F64RenderSettings
 from .globals import F64_GLOBALS
 
 
 class RoomRenderInfo(NamedTuple):
-    render_state: F64RenderState
     name: str
 
-    def __hash__(self):
-        return hash(self.name)
 
+@dataclasses.dataclass
+class RoomDrawStats:
+    objects: int = 0
+    draw_calls: int = 0
+    triangles: int = 0
+    culled: bool = False  # whole room outside of the view
 
-def get_oot_room_childrens(scene: bpy.types.Scene):
+
+def get_oot_room_childrens():
     if F64_GLOBALS.oot_room_lookup is not None:
         return F64_GLOBALS.oot_room_lookup
 
     oot_room_lookup = {}
-    render_state = get_scene_render_state(scene)
+    children = get_children_map(bpy.data.objects)
     scene_objs: list[bpy.types.Object] = []
-    room_objs: list[bpy.types.Object] = []
+    room_names: set[str] = set()
 
     def get_room_children(obj: bpy.types.Object, name: str):
-        for child in sorted(obj.children, key=lambda item: item.name):
-            if child not in room_objs:
-                oot_room_lookup[child.name] = RoomRenderInfo(render_state, name)
+        for child in children.get(obj.name, ()):
+            if child.name not in room_names:
+                oot_room_lookup[child.name] = RoomRenderInfo(name)
                 get_room_children(child, name)
             else:
                 get_room_children(child, child.name)
 
     def get_scene_children(obj: bpy.types.Object, name: str):
-        for child in sorted(obj.children, key=lambda item: item.name):
-            if child in room_objs:
+        for child in children.get(obj.name, ()):
+            if child.name in room_names:
                 get_room_children(child, child.name)
             else:
-                oot_room_lookup[child.name] = RoomRenderInfo(render_state, name)
+                oot_room_lookup[child.name] = RoomRenderInfo(name)
                 get_scene_children(child, name)
 
     for obj in bpy.data.objects:
@@ -48,17 +57,19 @@ def get_oot_room_childrens(scene: bpy.types.Scene):
             if obj.ootEmptyType == "Scene":
                 scene_objs.append(obj)
             if obj.ootEmptyType == "Room":
-                room_objs.append(obj)
+                room_names.add(obj.name)
 
     for scene_obj in scene_objs:
         get_scene_children(scene_obj, scene_obj.name)
 
-    fake_room = RoomRenderInfo(render_state, "")
+    fake_room = RoomRenderInfo("")
     for obj in bpy.data.objects:
         if obj.name not in oot_room_lookup:
             oot_room_lookup[obj.name] = fake_room
 
     F64_GLOBALS.oot_room_lookup = oot_room_lookup
+    F64_GLOBALS.oot_room_bounds.clear_groups()  # room members may have changed
+    F64_GLOBALS.obj_hierarchy = {obj.name: get_hierarchy_signature(obj) for obj in bpy.data.objects}
     return oot_room_lookup
 
 
@@ -70,6 +81,39 @@ DEFAULT_LAYERS = {
 }
 
 
+# cached until the world changes, see mesh_change_listener
+def get_oot_layer_rendermodes(world: bpy.types.World | None) -> dict[str, F64RenderState]:
+    key = ("OOT", world.name if world else None)
+    if F64_GLOBALS.layer_rendermodes is not None and F64_GLOBALS.layer_rendermodes_key == key:
+        return F64_GLOBALS.layer_rendermodes
+
+    layer_rendermodes = {}
+    for layer, (cycle1, cycle2) in DEFAULT_LAYERS.items():
+        if world:
+            defaults = world.ootDefaultRenderModes
+            cycle1, cycle2 = (getattr(defaults, f"{layer.lower()}Cycle{cycle}") for cycle in (1, 2))
+        rm_state = F64RenderState()
+        rm_state.set_from_rendermode(parse_f3d_rendermode_preset(cycle1, cycle2))
+        rm_state.save_cache()
+        layer_rendermodes[layer] = rm_state
+
+    F64_GLOBALS.layer_rendermodes, F64_GLOBALS.layer_rendermodes_key = layer_rendermodes, key
+    F64_GLOBALS.layer_base_states = None
+    return layer_rendermodes
+
+
+# initial render state of all rooms in a layer, rooms only need a copy of it
+def get_oot_layer_base_states(scene: bpy.types.Scene) -> dict[str, F64RenderState]:
+    layer_rendermodes = get_oot_layer_rendermodes(scene.world)
+    scene_render_state = get_cached_scene_render_state(scene)
+    if F64_GLOBALS.layer_base_states is None:
+        F64_GLOBALS.layer_base_states = {}
+        for layer, rm_state in layer_rendermodes.items():
+            base_state = F64_GLOBALS.layer_base_states[layer] = scene_render_state.copy()
+            base_state.set_values_from_cache(rm_state)
+    return F64_GLOBALS.layer_base_states
+
+
 def draw_oot_scene(
     render_engine: "Fast64RenderEngine",
     depsgraph: bpy.types.Depsgraph,
@@ -81,37 +125,47 @@ def draw_oot_scene(
 ):
     f64render_rs: F64RenderSettings = depsgraph.scene.f64render.render_settings
 
-    layer_rendermodes = {}  # TODO: should this be cached globally?
-    world = depsgraph.scene.world
-    for layer, (cycle1, cycle2) in DEFAULT_LAYERS.items():
-        if world:
-            defaults = world.ootDefaultRenderModes
-            cycle1, cycle2 = (getattr(defaults, f"{layer.lower()}Cycle{cycle}") for cycle in (1, 2))
-        rm_state = F64RenderState()
-        rm_state.set_from_rendermode(parse_f3d_rendermode_preset(cycle1, cycle2))
-        rm_state.save_cache()
-        layer_rendermodes[layer] = rm_state
-
+    layer_base_states = get_oot_layer_base_states(depsgraph.scene)
     ignore, collision = f64render_rs.render_type == "IGNORE", f64render_rs.render_type == "COLLISION"
     specific_room = f64render_rs.oot_specific_room.name if f64render_rs.oot_specific_room else None
-    room_lookup = get_oot_room_childrens(depsgraph.scene)
+    with PROFILER.stage("room lookup"):
+        room_lookup = get_oot_room_childrens()
     layer_queue: dict[str, dict[RoomRenderInfo, dict[str, ObjRenderInfo]]] = {}
+    room_objs: dict[RoomRenderInfo, list[bpy.types.Object]] = {}
+    obj_infos: list[tuple[RoomRenderInfo, ObjRenderInfo]] = []
 
     for obj in depsgraph.objects:
         obj_name = obj.name
-        room = room_lookup[obj_name]
-        if (
-            (ignore and obj.ignore_render)
-            or (collision and obj.ignore_collision)
-            or (specific_room and room.name != specific_room)
-        ):
-            continue
-        obj_info = collect_obj_info(
-            render_engine, obj, depsgraph, hidden_objs_names, space_view_3d, projection_matrix, view_matrix, always_set
-        )
-        if obj_info is None:
-            continue
-
+        room = room_lookup.get(obj_name)
+        if room is None:  # added without an update we could track
+            F64_GLOBALS.clear_areas()
+            room_lookup = get_oot_room_childrens()
+            room = room_lookup[obj_name]
+        room_objs.setdefault(room, []).append(obj)
+
+    # skip whole rooms outside of the view before collecting their objects, bounds include all room members
+    view_projection = matrix_to_np(projection_matrix)
+    room_stats: dict[str, RoomDrawStats] = {}
+    with PROFILER.stage("collect"):
+        for room, objs in room_objs.items():
+            if specific_room and room.name != specific_room:
+                continue
+            stats = room_stats[room.name] = RoomDrawStats(objects=len(objs))
+            with PROFILER.stage("room cull"):
+                corners = F64_GLOBALS.oot_room_bounds.get(room.name, objs)
+                stats.culled = corners is not None and not is_box_visible(corners, view_projection)
+            if stats.culled:
+                continue
+            for obj in objs:
+                if (ignore and obj.ignore_render) or (collision and obj.ignore_collision):
+                    continue
+                obj_info = collect_obj_info(render_engine, obj, depsgraph, hidden_objs_names, space_view_3d, always_set)
+                if obj_info is not None:
+                    obj_infos.append((room, obj_info))
+    render_engine.obj_matrices.apply([info for _, info in obj_infos], projection_matrix, view_matrix)
+
+    for room, obj_info in obj_infos:
+        obj_name = obj_info.obj.name
         for mat_info in obj_info.mats:
             mat = mat_info[2]
             room_queue = layer_queue.setdefault(mat.layer or "Opaque", {})  # if layer has no room queue, create it
@@ -121,14 +175,20 @@ def draw_oot_scene(
                 obj_info.mats = []
             obj_queue[obj_name].mats.append(mat_info)
 
-    for layer in ("Opaque", "Transparent", "Overlay"):
-        room_queue = layer_queue.get(layer)
-        if room_queue is None:
-            continue
-        # sort by room name, this doesn't correspond to something the fast64 exporter or the game rendering does
-        # but it at least helps make the behavior reproducible
-        for room, obj_queue in sorted(room_queue.items(), key=lambda item: item[0].name):
-            render_state = room.render_state.copy()
-            render_state.set_values_from_cache(layer_rendermodes.get(layer, layer_rendermodes["Opaque"]))
-            for info in dict(sorted(obj_queue.items(), key=lambda item: item[0])):  # sort by obj name
-                draw_f64_obj(render_engine, render_state, obj_queue[info])
+    with PROFILER.stage("record"):
+        for layer in ("Opaque", "Transparent", "Overlay"):
+            room_queue = layer_queue.get(layer)
+            if room_queue is None:
+                continue
+            # sort by room name, this doesn't correspond to something the fast64 exporter or the game rendering does
+            # but it at least helps make the behavior reproducible
+            for room, obj_queue in sorted(room_queue.items(), key=lambda item: item[0].name):
+                render_state = layer_base_states[layer].copy()
+                call_start = len(render_engine.draw_calls)
+                for info in dict(sorted(obj_queue.items(), key=lambda item: item[0])):  # sort by obj name
+                    draw_f64_obj(render_engine, render_state, obj_queue[info])
+                stats = room_stats[room.name]
+                for call in render_engine.draw_calls[call_start:]:
+                    stats.draw_calls += 1
+                    stats.triangles += call.indices_count // 3
+    F64_GLOBALS.oot_room_stats = room_stats
@@ -0,0 +1,161 @@
+import collections
+import contextlib
+import csv
+import json
+import time
+import numpy as np
+
+import bpy
+import blf
+from bpy_extras.io_utils import ExportHelper
+
+RING_SIZE = 240  # frames kept for percentiles and export
+PERCENTILES = (50, 95, 99)
+NULL_STAGE = contextlib.nullcontext()
+
+
+class ProfilerStage:
+    __slots__ = ("profiler", "name", "path", "start")
+
+    def __init__(self, profiler: "FrameProfiler", name: str):
+        self.profiler, self.name = profiler, name
+
+    def __enter__(self):
+        stack = self.profiler.stack
+        self.path = f"{stack[-1]}/{self.name}" if stack else self.name
+        stack.append(self.path)
+        self.start = time.perf_counter()
+
+    def __exit__(self, *_args):
+        duration = (time.perf_counter() - self.start) * 1000
+        self.profiler.stack.pop()
+        current = self.profiler.current
+        current[self.path] = current.get(self.path, 0.0) + duration
+
+
+class ProfilerFrame:
+    __slots__ = ("profiler", "start")
+
+    def __init__(self, profiler: "FrameProfiler"):
+        self.profiler = profiler
+
+    def __enter__(self):
+        self.profiler.current, self.profiler.stack = {}, []
+        self.start = time.perf_counter()
+
+    def __exit__(self, *_args):
+        self.profiler.current["frame"] = (time.perf_counter() - self.start) * 1000
+        self.profiler.frames.append(self.profiler.current)
+
+
+# Named, nestable stage timers (in ms), nested stages are recorded as "parent/child".
+# Multiple entries of the same stage within a frame are summed up, the last RING_SIZE frames are kept.
+# When disabled, 'frame' and 'stage' return a shared no-op context manager.
+class FrameProfiler:
+    def __init__(self):
+        self.enabled = False
+        self.frames: collections.deque[dict[str, float]] = collections.deque(maxlen=RING_SIZE)
+        self.current: dict[str, float] = {}
+        self.stack: list[str] = []
+        self.overlay_handler = None
+
+    def frame(self):
+        return ProfilerFrame(self) if self.enabled else NULL_STAGE
+
+    def stage(self, name: str):
+        return ProfilerStage(self, name) if self.enabled else NULL_STAGE
+
+    def clear(self):
+        self.frames.clear()
+
+    def get_stage_names(self) -> list[str]:
+        names = {name for frame in self.frames for name in frame}
+        return sorted(names, key=lambda name: (name != "frame", name))
+
+    def get_percentiles(self) -> dict[str, tuple[float, ...]]:
+        names = self.get_stage_names()
+        if not names:
+            return {}
+        values = np.array([[frame.get(name, 0.0) for name in names] for frame in self.frames])
+        percentiles = np.percentile(values, PERCENTILES, axis=0)
+        return {name: tuple(percentiles[:, i]) for i, name in enumerate(names)}
+
+    def export_csv(self, path: str):
+        names = self.get_stage_names()
+        with open(path, "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow(names)
+            for frame in self.frames:
+                writer.writerow(frame.get(name, 0.0) for name in names)
+
+    def export_json(self, path: str):
+        data = {
+            "unit": "ms",
+            "percentiles": {
+                name: dict(zip((f"p{p}" for p in PERCENTILES), values))
+                for name, values in self.get_percentiles().items()
+            },
+            "frames": list(self.frames),
+        }
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=2)
+
+    def set_overlay(self, enabled: bool):
+        if enabled and self.overlay_handler is None:
+            self.overlay_handler = bpy.types.SpaceView3D.draw_handler_add(self.draw_overlay, (), "WINDOW", "POST_PIXEL")
+        elif not enabled and self.overlay_handler is not None:
+            bpy.types.SpaceView3D.draw_handler_remove(self.overlay_handler, "WINDOW")
+            self.overlay_handler = None
+
+    def draw_overlay(self):
+        region = bpy.context.region
+        if bpy.context.scene.render.engine != "FAST64_RENDER_ENGINE" or region is None:
+            return
+        font_id, line_height, column_width = 0, 14, 60
+        blf.size(font_id, 11)
+        blf.color(font_id, 1.0, 1.0, 1.0, 0.9)
+
+        rows = [("f64render (ms)", tuple(f"p{p}" for p in PERCENTILES))]
+        for name, values in self.get_percentiles().items():
+            label = "  " * name.count("/") + name.rsplit("/", 1)[-1]
+            rows.append((label, tuple(f"{value:.2f}" for value in values)))
+
+        y = region.height - 60
+        for label, columns in rows:
+            blf.position(font_id, 20, y, 0)
+            blf.draw(font_id, label)
+            for i, text in enumerate(columns):
+                blf.position(font_id, 200 + i * column_width, y, 0)
+                blf.draw(font_id, text)
+            y -= line_height
+
+
+PROFILER = FrameProfiler()
+
+
+class F64RENDER_OT_export_profile(bpy.types.Operator, ExportHelper):
+    bl_idname = "f64render.export_profile"
+    bl_label = "Export Frame Profile"
+    bl_description = "Exports the recorded stage timings of the last frames as CSV or JSON"
+
+    filename_ext = ".csv"
+    file_format: bpy.props.EnumProperty(
+        name="Format", items=[("CSV", "CSV", "One row per frame"), ("JSON", "JSON", "Percentiles and all frames")]
+    )
+
+    def check(self, context):
+        self.filename_ext = ".json" if self.file_format == "JSON" else ".csv"
+        return super().check(context)
+
+    def execute(self, context):
+        if self.file_format == "JSON":
+            PROFILER.export_json(self.filepath)
+        else:
+            PROFILER.export_csv(self.filepath)
+        self.report({"INFO"}, f"Exported {len(PROFILER.frames)} frames")
+        return {"FINISHED"}
+
+
+def unregister():
+    PROFILER.set_overlay(False)
+    PROFILER.enabled = False
@@ -1,7 +1,9 @@
+import dataclasses
 import bpy
 from bpy.types import PropertyGroup, Image
 
 from .globals import F64_GLOBALS
+from .sampling_profiler import SAMPLING_PROFILER
 
 # TODO: Some things are from fast64 but can´t be imported at runtime
 
@@ -158,17 +160,84 @@ def update_all_materials(_scene, _context):
     F64_GLOBALS.materials_cache = {}
 
 
-def rebuild_shaders(_scene, _context):
-    F64_GLOBALS.rebuild_shaders = True
-
-
 class F64RenderSettings(bpy.types.PropertyGroup):
     use_atomic_rendering: bpy.props.BoolProperty(
         name="Use Atomic Rendering",
         default=True,
         description="Atomic rendering will draw to a depth and color buffer seperately, which allows for proper blender and decal emulation.\n"
         "This may cause artifacts if your GPU does not support the interlock extension",
-        update=rebuild_shaders,
+    )
+    use_hybrid_rendering: bpy.props.BoolProperty(
+        name="Hybrid Rendering",
+        default=False,
+        description="Draws opaque materials with the regular depth test and only uses atomic rendering\n"
+        "for decals and blended materials. Faster in scenes that are mostly opaque",
+    )
+    use_shader_variants: bpy.props.BoolProperty(
+        name="Specialized Shaders",
+        default=True,
+        description="Compiles shader variants with the color combiner and blender baked in\n"
+        "for frequently drawn materials. Variants are compiled one per frame, until then the generic shader is used",
+    )
+    render_scale: bpy.props.EnumProperty(
+        name="Render Scale",
+        items=[
+            ("FULL", "Full", "Render at the viewport's resolution"),
+            ("HALF", "Half", "Render at half the viewport's resolution"),
+            ("QUARTER", "Quarter", "Render at a quarter of the viewport's resolution"),
+            ("N64", "N64 Native", "Render at 320x240, fitted to the viewport's aspect ratio"),
+        ],
+        default="FULL",
+        description="Resolution of the atomic render targets, lower resolutions are upscaled to the viewport.\n"
+        "Reduces the per-pixel cost of blending emulation on high resolution displays",
+    )
+    upscale_filter: bpy.props.EnumProperty(
+        name="Upscale Filter",
+        items=[
+            ("NEAREST", "Nearest", "Nearest neighbor upscaling"),
+            ("LINEAR", "Bilinear", "Bilinear upscaling"),
+        ],
+        default="NEAREST",
+    )
+    use_profiler: bpy.props.BoolProperty(
+        name="Frame Profiler",
+        description="Records per-stage timings of the last frames, they can be exported as CSV or JSON",
+    )
+    profiler_overlay: bpy.props.BoolProperty(
+        name="Overlay", default=True, description="Shows rolling percentiles of the stage timings in the viewport"
+    )
+    show_frame_stats: bpy.props.BoolProperty(name="Frame Statistics")
+    show_memory_report: bpy.props.BoolProperty(name="Memory Usage")
+    use_gpu_skinning: bpy.props.BoolProperty(
+        name="GPU Skinning",
+        default=False,
+        description="Deforms meshes with a single armature modifier in the vertex shader. "
+        "Playback only uploads bone matrices instead of converting the deformed mesh every frame",
+    )
+    anim_cache_size: bpy.props.IntProperty(
+        name="Animation Cache (MB)",
+        default=256,
+        min=0,
+        description="Memory for converted frames of deformed meshes, reused by looping playback and scrubbing. "
+        "0 disables the cache",
+    )
+    render_stream_dir: bpy.props.StringProperty(
+        name="Stream Frames",
+        subtype="DIR_PATH",
+        description="Also writes final render frames as exact 8-bit PNGs to this directory, on a background thread",
+    )
+    code_profile_dir: bpy.props.StringProperty(
+        name="Output", subtype="DIR_PATH", description="Directory the code profiler writes its results to"
+    )
+    code_profile_mode: bpy.props.EnumProperty(
+        name="Mode",
+        items=[
+            ("SAMPLING", "Sampling", "Samples the draw stacks with low overhead, writes collapsed stacks"),
+            ("DETERMINISTIC", "Deterministic", "Profiles every call with cProfile, writes a pstats dump"),
+        ],
+    )
+    code_profile_frames: bpy.props.IntProperty(
+        name="Frames", default=0, min=0, description="Frames to profile before stopping, 0 profiles until stopped"
     )
     sources_tab: bpy.props.BoolProperty(name="Default Sources")
     default_prim_color: bpy.props.FloatVectorProperty(
@@ -247,14 +316,63 @@ class F64RenderSettings(bpy.types.PropertyGroup):
             ("DEFAULT", "Always Draw", "Always Draw"),
             ("IGNORE", 'Respect "Ignore Render"', 'Respect "Ignore Render"'),
             ("COLLISION", "Only Collision", "Collision"),
+            ("COLLISION_VIEW", "Collision Types", "Flat-shaded collision geometry, colored by collision type"),
         ],
     )
     sm64_specific_area: bpy.props.PointerProperty(
         type=bpy.types.Object, poll=lambda self, obj: obj.type == "EMPTY" and obj.sm64_obj_type == "Area Root"
     )
+    use_area_residency: bpy.props.BoolProperty(
+        name="Area Residency",
+        description="Only keeps the GPU buffers of the area around the camera (and the specific area) resident.\n"
+        "Other areas are kept from nearest to farthest within the budget, areas past it are unloaded and hidden.\n"
+        "Reloaded areas are re-uploaded a few meshes per redraw, their geometry appears over several frames",
+    )
+    residency_budget: bpy.props.IntProperty(
+        name="Budget (MB)", default=512, min=16, description="GPU memory budget for area geometry"
+    )
     oot_specific_room: bpy.props.PointerProperty(
         type=bpy.types.Object, poll=lambda self, obj: obj.type == "EMPTY" and obj.ootEmptyType == "Room"
     )
+    show_room_stats: bpy.props.BoolProperty(name="Room Statistics")
+
+    def draw_frame_stats(self, layout: bpy.types.UILayout):
+        box = layout.box().column()
+        stats = F64_GLOBALS.frame_stats
+        if stats is None:
+            box.label(text="No frame drawn")
+            return
+        for field in dataclasses.fields(stats):
+            box.label(text=f"{field.name.replace('_', ' ').capitalize()}: {getattr(stats, field.name)}")
+
+    def draw_room_stats(self, layout: bpy.types.UILayout):
+        box = layout.box().column()
+        if not F64_GLOBALS.oot_room_stats:
+            box.label(text="No rooms drawn")
+            return
+        # most expensive rooms first
+        for name, stats in sorted(F64_GLOBALS.oot_room_stats.items(), key=lambda item: -item[1].triangles):
+            if stats.culled:
+                box.label(text=f"{name or '(No Room)'}: culled ({stats.objects} objects)")
+            else:
+                box.label(text=f"{name or '(No Room)'}: {stats.triangles} tris, {stats.draw_calls} draws")
+
+    def draw_memory_report(self, layout: bpy.types.UILayout):
+        from .memory_report import get_memory_report, format_bytes
+
+        box = layout.box().column()
+        report = get_memory_report()
+        for cache in report.caches:
+            row = box.row()
+            row.label(text=f"{cache.name}: {cache.entries}")
+            row.label(text=f"CPU {format_bytes(cache.cpu_bytes)}, GPU {format_bytes(cache.gpu_bytes)}")
+        box.label(text=f"Total: CPU {format_bytes(report.total_cpu_bytes)}, GPU {format_bytes(report.total_gpu_bytes)}")
+        for title, entries in (("Largest Meshes", report.top_meshes), ("Largest Textures", report.top_textures)):
+            if entries:
+                box.label(text=title)
+                for name, size in entries:
+                    box.label(text=f"  {name}: {format_bytes(size)}")
+        box.operator("f64render.purge_caches", icon="TRASH")
 
     def draw_props(self, layout: bpy.types.UILayout, gameEditorMode: str):
         from fast64_internal.utility import prop_split, multilineLabel
@@ -264,13 +382,53 @@ class F64RenderSettings(bpy.types.PropertyGroup):
             prop_split(layout, self, "render_type", "Render Type")
             if gameEditorMode == "SM64":
                 prop_split(layout, self, "sm64_specific_area", "Specific Area")
+                layout.prop(self, "use_area_residency")
+                if self.use_area_residency:
+                    prop_split(layout, self, "residency_budget", "Budget (MB)")
             if gameEditorMode == "OOT":
                 prop_split(layout, self, "oot_specific_room", "Specific Room")
+                layout.prop(self, "show_room_stats")
+                if self.show_room_stats:
+                    self.draw_room_stats(layout)
             layout.separator()
 
         if bpy.app.version >= (4, 1, 0):
             layout.prop(self, "use_atomic_rendering")
+            if self.use_atomic_rendering:
+                layout.prop(self, "use_hybrid_rendering")
+                prop_split(layout, self, "render_scale", "Render Scale")
+                if self.render_scale != "FULL":
+                    prop_split(layout, self, "upscale_filter", "Upscale Filter")
+        layout.prop(self, "use_shader_variants")
+        layout.prop(self, "use_gpu_skinning")
+        prop_split(layout, self, "anim_cache_size", "Animation Cache (MB)")
+        prop_split(layout, self, "render_stream_dir", "Stream Frames")
         layout.prop(self, "always_set")
+        layout.prop(self, "show_frame_stats")
+        if self.show_frame_stats:
+            self.draw_frame_stats(layout)
+        layout.prop(self, "show_memory_report")
+        if self.show_memory_report:
+            self.draw_memory_report(layout)
+        row = layout.row()
+        row.prop(self, "use_profiler")
+        if self.use_profiler:
+            row.prop(self, "profiler_overlay")
+            row.operator("f64render.export_profile", text="", icon="EXPORT")
+        row = layout.row()
+        row.operator("f64render.record_commands", icon="REC")
+        row.operator("f64render.replay_commands", icon="PLAY")
+        code_profile_box = layout.box().column()
+        prop_split(code_profile_box, self, "code_profile_dir", "Code Profile")
+        row = code_profile_box.row()
+        row.prop(self, "code_profile_mode", text="")
+        row.prop(self, "code_profile_frames")
+        running = SAMPLING_PROFILER.running
+        code_profile_box.operator(
+            "f64render.toggle_sampling_profiler",
+            text="Stop Code Profiler" if running else "Start Code Profiler",
+            icon="PAUSE" if running else "PLAY",
+        )
         layout.prop(self, "sources_tab", icon="TRIA_DOWN" if self.sources_tab else "TRIA_RIGHT")
         if self.sources_tab:
             sources_box = layout.box().column()
@@ -0,0 +1,86 @@
+import bpy
+import gpu
+
+
+class RenderTarget:
+    def __init__(self):
+        self.depth_texture: gpu.types.GPUTexture = None
+        self.color_texture: gpu.types.GPUTexture = None
+        self.frame_key: tuple | None = None  # inputs of the frame currently stored in the textures
+        self.hw_depth_texture: gpu.types.GPUTexture = None
+        self.opaque_framebuffer: gpu.types.GPUFrameBuffer = None
+
+    @property
+    def size(self) -> tuple[int, int]:
+        if self.depth_texture is None:
+            return (0, 0)
+        return (self.depth_texture.width, self.depth_texture.height)
+
+    def resize(self, size_x: int, size_y: int):
+        if self.size != (size_x, size_y):
+            self.depth_texture = gpu.types.GPUTexture((size_x, size_y), format="R32I")
+            self.color_texture = gpu.types.GPUTexture((size_x, size_y), format="R32UI")
+            self.frame_key = None
+            self.hw_depth_texture = self.opaque_framebuffer = None
+
+    def clear(self, backend):  # see command_recorder.py
+        backend.texture_clear(self.color_texture, "UINT", [0x080808])
+        backend.texture_clear(self.depth_texture, "INT", [0])
+
+    # hybrid rendering: opaque materials are rasterized with a regular depth test into the same color texture
+    def get_opaque_framebuffer(self) -> gpu.types.GPUFrameBuffer:
+        if self.opaque_framebuffer is None:
+            self.hw_depth_texture = gpu.types.GPUTexture(self.size, format="DEPTH_COMPONENT32F")
+            self.opaque_framebuffer = gpu.types.GPUFrameBuffer(
+                depth_slot=self.hw_depth_texture, color_slots=self.color_texture
+            )
+        return self.opaque_framebuffer
+
+
+N64_RESOLUTION = (320, 240)
+RENDER_SCALES = {"FULL": 1.0, "HALF": 0.5, "QUARTER": 0.25}
+
+
+def get_scaled_size(size_x: int, size_y: int, render_scale: str) -> tuple[int, int]:
+    if render_scale == "N64":  # keep the viewport's aspect ratio, while covering at least 320x240
+        scale = min(1.0, max(N64_RESOLUTION[0] / size_x, N64_RESOLUTION[1] / size_y))
+    else:
+        scale = RENDER_SCALES[render_scale]
+    return (max(1, round(size_x * scale)), max(1, round(size_y * scale)))
+
+
+def get_open_regions() -> set[int]:
+    regions = set()
+    for window in bpy.context.window_manager.windows:
+        for area in window.screen.areas:
+            if area.type == "VIEW_3D":
+                regions.update(region.as_pointer() for region in area.regions)
+    return regions
+
+
+# Keeps one set of depth/color textures per viewport region, so multiple viewports of different sizes
+# don't reallocate a shared pair on every redraw. Targets of closed regions are evicted lazily.
+class RenderTargetPool:
+    def __init__(self):
+        self.targets: dict[int, RenderTarget] = {}
+        self.evict_pending = False
+
+    def get(self, region: bpy.types.Region, render_scale: str = "FULL") -> RenderTarget:
+        key = region.as_pointer()
+        target = self.targets.get(key)
+        if target is None or self.evict_pending:
+            self.evict_closed_regions()
+            target = self.targets.setdefault(key, RenderTarget())
+        target.resize(*get_scaled_size(region.width, region.height, render_scale))
+        return target
+
+    def evict_closed_regions(self):
+        self.evict_pending = False
+        open_regions = get_open_regions()
+        for key in list(self.targets.keys()):
+            if key not in open_regions:
+                del self.targets[key]
+
+    def clear(self):
+        self.targets.clear()
+        self.evict_pending = False
@@ -1,6 +1,7 @@
-from io import StringIO
+import dataclasses
+import functools
 import math
-import pathlib
+import os
 import time
 
 import bpy
@@ -8,24 +9,79 @@ import mathutils
 import gpu
 
 from .utils.addon import addon_set_fast64_path
-from .material.parser import f64_parse_obj_light
-from .common import ObjRenderInfo, draw_f64_obj, get_scene_render_state, collect_obj_info
+from .utils.matrix import ObjMatrixCache
+from .material.parser import f64_parse_obj_light, F64RenderState
+from .common import (
+    ObjRenderInfo,
+    DrawCall,
+    FrameStats,
+    draw_f64_obj,
+    submit_draw_calls,
+    get_cached_scene_render_state,
+    collect_obj_info,
+    FINAL_RENDER_MESH_SUFFIX,
+)
 from .properties import F64RenderProperties, F64RenderSettings
 from .globals import F64_GLOBALS
+from .render_target import RenderTarget
+from .frame_scheduler import FRAME_SCHEDULER
+from .shader_variants import ShaderVariants
+from .shader_cache import SHADER_CACHE, ShaderKey, get_shader_key
+from .residency import RELOADS_PER_FRAME
+from .profiler import PROFILER
+from .command_recorder import RECORDER, DIRECT_BACKEND
+from .final_render import (
+    FINAL_RENDER_VIEW,
+    BACKGROUND_COLOR,
+    FRAME_WRITER,
+    get_render_size,
+    get_camera_matrices,
+    unpack_color_texture,
+    read_color_texture,
+    pixels_to_linear,
+)
 
 from .sm64 import draw_sm64_scene
 from .oot import draw_oot_scene
+from .collision import draw_collision_scene
 
 # N64 is y-up, blender is z-up
 yup_to_zup = mathutils.Quaternion((1, 0, 0), math.radians(90.0)).to_matrix().to_4x4()
 
 MISSING_TEXTURE_COLOR = (0, 0, 0, 1)
+QUAD_2D_VERTICES = ((-1, -1), (-1, 1), (1, 1), (1, 1), (1, -1), (-1, -1))  # full-screen, two triangles
 
 
-def cache_del_by_mesh(mesh_name):
+# keep_frames: the mesh was deformed by a frame change, its current buffers stay valid for that frame
+# keep_skinned: the mesh data itself is unchanged, GPU skinned buffers only need new bone matrices
+def cache_del_by_mesh(mesh_name, keep_frames=False, keep_skinned=False):
     for key in list(F64_GLOBALS.meshCache.keys()):
-        if F64_GLOBALS.meshCache[key].mesh_name == mesh_name:
+        render_obj = F64_GLOBALS.meshCache[key]
+        if render_obj.mesh_name == mesh_name:
+            if keep_skinned and render_obj.skin is not None:
+                continue
+            if keep_frames:
+                F64_GLOBALS.anim_cache.store(key, render_obj)
             del F64_GLOBALS.meshCache[key]
+    if not keep_frames:
+        F64_GLOBALS.anim_cache.discard_mesh(mesh_name)
+    for key in list(F64_GLOBALS.collision_cache.keys()):
+        if F64_GLOBALS.collision_cache[key].mesh_name == mesh_name:
+            del F64_GLOBALS.collision_cache[key]
+
+
+# GPU skinned meshes keep the bones and rest pose of their armature, see SkinData
+def cache_del_by_armature(armature_data_name: str):
+    for key in list(F64_GLOBALS.meshCache.keys()):
+        skin = F64_GLOBALS.meshCache[key].skin
+        if skin is not None and skin.armature_data_name == armature_data_name:
+            del F64_GLOBALS.meshCache[key]
+
+
+# meshes converted by final renders, with render modifier settings, see get_mesh_id
+def cache_del_final_render():
+    for key in [key for key in F64_GLOBALS.meshCache.keys() if key.endswith(FINAL_RENDER_MESH_SUFFIX)]:
+        del F64_GLOBALS.meshCache[key]
 
 
 def obj_has_f3d_materials(obj):
@@ -39,173 +95,191 @@ def materials_set_light_direction(scene):
     return not (scene.gameEditorMode == "SM64" and scene.fast64.sm64.matstack_fix)
 
 
+# the extension list is long and doesn't change during a session, check (and warn) once
+@functools.cache
+def get_shader_interlock_support() -> bool:
+    supported = "GL_ARB_fragment_shader_interlock" in gpu.capabilities.extensions_get()
+    if not supported:
+        print("\n\nWarning: GL_ARB_fragment_shader_interlock not supported!\n\n")
+    if bpy.app.version < (4, 1, 0):
+        print("\n\nWarning: Blender version too old! Expect limited blending emulation!\n\n")
+    return supported
+
+
+# offscreen color image to viewport blit, shared by all engines
+def create_shader_2d() -> tuple[gpu.types.GPUShader, gpu.types.GPUBatch]:
+    print("Compiling 2D shader")
+    # 2D shader (offscreen to viewport)
+    shader_info = gpu.types.GPUShaderCreateInfo()
+    vert_out = gpu.types.GPUStageInterfaceInfo("vert_2d")
+    vert_out.smooth("VEC2", "uv")
+
+    # Hacky workaround for blender forcing an early depth test ('layout(depth_unchanged) out float gl_FragDepth;')
+    shader_info.define("depth_unchanged", "depth_any")
+    shader_info.image(2, "R32UI", "UINT_2D_ATOMIC", "color_texture", qualifiers={"READ"})
+
+    shader_info.push_constant("INT", "linearFilter")  # used when upscaling lower resolution targets
+    shader_info.fragment_out(0, "VEC4", "FragColor")
+    shader_info.vertex_in(0, "VEC2", "pos")
+    shader_info.vertex_out(vert_out)
+
+    shader_info.vertex_source(
+        """
+    void main() {
+      gl_Position = vec4(pos, 0.0, 1.0);
+      uv = pos.xy * 0.5 + 0.5;
+    }"""
+    )
+
+    shader_info.fragment_source(
+        """
+    vec4 loadColor(ivec2 coord, ivec2 textureSize2d) {
+      return unpackUnorm4x8(imageLoad(color_texture, clamp(coord, ivec2(0), textureSize2d - 1)).r);
+    }
+
+    void main() {
+      ivec2 textureSize2d = imageSize(color_texture);
+      vec2 texelPos = uv.xy * vec2(textureSize2d);
+      if (linearFilter != 0) {
+        texelPos -= 0.5;
+        ivec2 coord = ivec2(floor(texelPos));
+        vec2 fracPart = texelPos - vec2(coord);
+        vec4 color00 = loadColor(coord, textureSize2d);
+        vec4 color10 = loadColor(coord + ivec2(1, 0), textureSize2d);
+        vec4 color01 = loadColor(coord + ivec2(0, 1), textureSize2d);
+        vec4 color11 = loadColor(coord + ivec2(1, 1), textureSize2d);
+        FragColor = mix(mix(color00, color10, fracPart.x), mix(color01, color11, fracPart.x), fracPart.y);
+      } else {
+        FragColor = loadColor(ivec2(texelPos), textureSize2d);
+      }
+      gl_FragDepth = 0.99999;
+    }"""
+    )
+
+    shader_2d = gpu.shader.create_from_info(shader_info)
+
+    # full-screen quad, only depends on the shader format so it can be kept around
+    vbo_2d = gpu.types.GPUVertBuf(shader_2d.format_calc(), 6)
+    vbo_2d.attr_fill("pos", QUAD_2D_VERTICES)
+    return shader_2d, gpu.types.GPUBatch(type="TRIS", buf=vbo_2d)
+
+
 class Fast64RenderEngine(bpy.types.RenderEngine):
     bl_idname = "FAST64_RENDER_ENGINE"
     bl_label = "Fast64 Renderer"
     bl_use_preview = False
+    bl_use_gpu_context = True  # final renders draw with the gpu module too
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         addon_set_fast64_path()
+        F64_GLOBALS.shared.acquire(ENGINE_HANDLERS)
 
         self.shader = None
-        self.shader_2d = None
-        self.shader_fallback = None
+        self.shader_key: ShaderKey = None
+        self.shader_opaque = None  # hardware depth test variant of the atomic shader, set if hybrid rendering is used
         self.vbo_format = None
-        self.draw_handler = None
+        self.shader_skinned = None  # GPU skinning variant of the shader, see mesh/skinning.py
+        self.vbo_format_skinned = None
+        self.last_depsgraph: bpy.types.Depsgraph = None
         self.use_atomic_rendering = True
+        self.use_shader_variants = True
+        self.shader_variants = ShaderVariants()
+        self.shader_variants_opaque = ShaderVariants()
+        self.bound_shader: gpu.types.GPUShader = None
+        self.bound_obj: ObjRenderInfo = None
+        self.draw_calls: list[DrawCall] = []
+        self.stats = FrameStats()  # frame in progress
+        self.frame_stats = FrameStats()  # last completed frame
+        self.gpu = DIRECT_BACKEND  # gpu calls of the draw path, replaced by a recording backend while recording
 
         self.last_used_textures: dict[int, gpu.types.GPUTexture] = {}
+        self.obj_matrices = ObjMatrixCache()
 
         self.time_count = 0
         self.time_total = 0
 
-        self.depth_texture: gpu.types.GPUTexture = None
-        self.color_texture: gpu.types.GPUTexture = None
-        self.update_render_size(128, 128)
-
-        bpy.app.handlers.depsgraph_update_post.append(Fast64RenderEngine.mesh_change_listener)
-        bpy.app.handlers.frame_change_post.append(Fast64RenderEngine.mesh_change_listener)
-        bpy.app.handlers.load_pre.append(Fast64RenderEngine.on_file_load)
+        self.render_target: RenderTarget = None
+        self.final_render_target = RenderTarget()  # textures are only allocated by F12 renders
 
         if "f64render_missing_texture" not in bpy.data.images:
             # Create a 1x1 image
             bpy.data.images.new("f64render_missing_texture", 1, 1).pixels = MISSING_TEXTURE_COLOR
 
-        ext_list = gpu.capabilities.extensions_get()
-        self.shader_interlock_support = "GL_ARB_fragment_shader_interlock" in ext_list
-        if not self.shader_interlock_support:
-            print("\n\nWarning: GL_ARB_fragment_shader_interlock not supported!\n\n")
-        if bpy.app.version < (4, 1, 0):
-            print("\n\nWarning: Blender version too old! Expect limited blending emulation!\n\n")
+        self.shader_interlock_support = get_shader_interlock_support()
         self.draw_range_impl = bpy.app.version >= (3, 6, 0)
 
     def __del__(self):
-        def remove_handler(handler, func):
-            while func in handler:
-                handler.remove(func)
-
-        remove_handler(bpy.app.handlers.depsgraph_update_post, Fast64RenderEngine.mesh_change_listener)
-        remove_handler(bpy.app.handlers.frame_change_post, Fast64RenderEngine.mesh_change_listener)
-        remove_handler(bpy.app.handlers.load_pre, Fast64RenderEngine.on_file_load)
-
-    def update_render_size(self, size_x, size_y):
-        if not self.depth_texture or size_x != self.depth_texture.width or size_y != self.depth_texture.height:
-            self.depth_texture = gpu.types.GPUTexture((size_x, size_y), format="R32I")
-            self.color_texture = gpu.types.GPUTexture((size_x, size_y), format="R32UI")
-
-    def init_shader(self, scene: bpy.types.Scene):
-        print("Compiling shader")
-
-        shaderPath = (pathlib.Path(__file__).parent / "shader").resolve()
-        shaderVert = StringIO()
-        shaderFrag = StringIO()
-
-        general_shaders = ("utils.glsl", "defines.glsl")
-        vertex_shaders = ("main3d.vert.glsl",)
-        frag_shaders = (
-            "textures.glsl",
-            "main3d.frag.glsl",
-        )
-
-        for shader in general_shaders + vertex_shaders:
-            with open(shaderPath / shader, "r", encoding="utf-8") as f:
-                shaderVert.write(f.read())
-                shaderVert.write("\n")
-        for shader in general_shaders + frag_shaders:
-            with open(shaderPath / shader, "r", encoding="utf-8") as f:
-                shaderFrag.write(f.read())
-                shaderFrag.write("\n")
-
-        shader_info = gpu.types.GPUShaderCreateInfo()
-
-        with open(shaderPath / "structs.glsl", "r", encoding="utf-8") as f:
-            shader_info.typedef_source(f.read())
-
-        # vertex -> fragment
-        vert_out = gpu.types.GPUStageInterfaceInfo("vert_interface")
-        vert_out.no_perspective("VEC4", "cc_shade")
-        vert_out.flat("VEC4", "cc_shade_flat")
-        vert_out.smooth("VEC2", "inputUV")
-        vert_out.no_perspective("VEC2", "posScreen")
-
-        if self.use_atomic_rendering:
-            shader_info.define("depth_unchanged", "depth_any")
+        F64_GLOBALS.shared.release()
+        FRAME_SCHEDULER.remove_engine(self)
+        F64_GLOBALS.render_targets.evict_pending = True  # our viewport may have been closed
+
+    # counters of the last drawn frame (draws, state changes, culled objects, ...)
+    def get_frame_stats(self) -> dict[str, int]:
+        return dataclasses.asdict(self.frame_stats)
+
+    def get_shader_key(self, scene: bpy.types.Scene, use_atomic_rendering: bool) -> ShaderKey:
+        defines = {}
+        if use_atomic_rendering:
+            defines["depth_unchanged"] = "depth_any"
             if self.shader_interlock_support:
-                shader_info.define("USE_SHADER_INTERLOCK", "1")
-            shader_info.define("BLEND_EMULATION", "1")
+                defines["USE_SHADER_INTERLOCK"] = "1"
+            defines["BLEND_EMULATION"] = "1"
         # Using the already calculated view space normals instead of transforming the light direction makes
         # for cleaner and faster code
-        shader_info.define("VIEWSPACE_LIGHTING", "0" if scene.fast64.renderSettings.useWorldSpaceLighting else "1")
-        shader_info.define("SIMULATE_LOW_PRECISION", "1")
-
-        shader_info.push_constant("MAT4", "matMVP")
-        shader_info.push_constant("MAT3", "matNorm")
-
-        shader_info.uniform_buf(0, "UBO_Material", "material")
+        defines["VIEWSPACE_LIGHTING"] = "0" if scene.fast64.renderSettings.useWorldSpaceLighting else "1"
+        defines["SIMULATE_LOW_PRECISION"] = "1"
+        return get_shader_key(defines)
 
-        shader_info.vertex_in(0, "VEC3", "pos")  # keep blenders name keep for better compat.
-        shader_info.vertex_in(1, "VEC3", "inNormal")
-        shader_info.vertex_in(2, "VEC4", "inColor")
-        shader_info.vertex_in(3, "VEC2", "inUV")
-        shader_info.vertex_out(vert_out)
-
-        for i in range(8):
-            shader_info.sampler(i, "FLOAT_2D", f"tex{i}")
-
-        if self.use_atomic_rendering:
-            shader_info.image(2, "R32UI", "UINT_2D_ATOMIC", "color_texture", qualifiers={"READ", "WRITE"})
-            shader_info.image(3, "R32I", "INT_2D_ATOMIC", "depth_texture", qualifiers={"READ", "WRITE"})
-        else:
-            shader_info.fragment_out(0, "VEC4", "FragColor")
-
-        shader_info.vertex_source(shaderVert.getvalue())
-        shader_info.fragment_source(shaderFrag.getvalue())
-
-        self.shader = gpu.shader.create_from_info(shader_info)
-        self.shader_fallback = gpu.shader.from_builtin(
-            "3D_UNIFORM_COLOR" if bpy.app.version < (3, 4, 0) else "UNIFORM_COLOR"
-        )
-        self.vbo_format = self.shader.format_calc()
-
-    def init_shader_2d(self):
-        if not self.shader_2d:
-            print("Compiling 2D shader")
-            # 2D shader (offscreen to viewport)
-            shader_info = gpu.types.GPUShaderCreateInfo()
-            vert_out = gpu.types.GPUStageInterfaceInfo("vert_2d")
-            vert_out.smooth("VEC2", "uv")
-
-            # Hacky workaround for blender forcing an early depth test ('layout(depth_unchanged) out float gl_FragDepth;')
-            shader_info.define("depth_unchanged", "depth_any")
-            shader_info.image(2, "R32UI", "UINT_2D_ATOMIC", "color_texture", qualifiers={"READ"})
-
-            shader_info.fragment_out(0, "VEC4", "FragColor")
-            shader_info.vertex_in(0, "VEC2", "pos")
-            shader_info.vertex_out(vert_out)
-
-            shader_info.vertex_source(
-                """
-        void main() {
-          gl_Position = vec4(pos, 0.0, 1.0);
-          uv = pos.xy * 0.5 + 0.5;
-        }"""
-            )
-
-            shader_info.fragment_source(
-                """
-        void main() {
-          ivec2 textureSize2d = imageSize(color_texture);
-          ivec2 coord = ivec2(uv.xy * vec2(textureSize2d)); 
-          FragColor =  unpackUnorm4x8(imageLoad(color_texture, coord).r);
-          gl_FragDepth = 0.99999;
-        }"""
-            )
-
-            self.shader_2d = gpu.shader.create_from_info(shader_info)
-
-    def mesh_change_listener(scene, depsgraph):
+    def update_shader(self, key: ShaderKey) -> bool:
+        if key == self.shader_key:
+            return True
+        # keep drawing with the previous shader until the new one is compiled
+        shader = SHADER_CACHE.get(key)
+        if shader is None:
+            return self.shader is not None
+        self.shader, self.shader_key = shader, key
+        self.vbo_format = F64_GLOBALS.shared.get(("vbo_format", key), self.shader.format_calc)
+        F64_GLOBALS.update_counter += 1
+        return True
+
+    def get_opaque_shader_key(self) -> ShaderKey:
+        defines = dict(self.shader_key)
+        # no interlock needed and early depth tests are welcome, the color is written as a regular fragment
+        defines.pop("USE_SHADER_INTERLOCK", None)
+        defines.pop("depth_unchanged", None)
+        defines["HARDWARE_DEPTH_PASS"] = "1"
+        return get_shader_key(defines)
+
+    def get_shader(self, render_state: F64RenderState, hardware_depth=False) -> gpu.types.GPUShader:
+        shader, variants = self.shader, self.shader_variants
+        if hardware_depth:
+            shader, variants = self.shader_opaque, self.shader_variants_opaque
+        if not self.use_shader_variants:
+            return shader
+        return variants.get(render_state, shader)
+
+    def bind_shader(self, shader: gpu.types.GPUShader) -> gpu.types.GPUShader:
+        if shader is not self.bound_shader:
+            self.gpu.bind(shader)
+            if self.use_atomic_rendering:
+                self.gpu.image(shader, "depth_texture", self.render_target.depth_texture)
+                self.gpu.image(shader, "color_texture", self.render_target.color_texture)
+            self.bound_shader = shader
+            self.stats.shader_binds += 1
+            self.bound_obj = None  # push constants are per shader
+            self.last_used_textures.clear()
+        return shader
+
+    # handlers are persistent, so engines that stay alive across a file load keep receiving updates
+    @bpy.app.handlers.persistent
+    def mesh_change_listener(scene, depsgraph, frame_change=False):
         # print("################ MESH CHANGE LISTENER ################")
+        F64_GLOBALS.update_counter += 1  # invalidates retained frames, see draw_scene
+        if frame_change:
+            F64_GLOBALS.frame_update = F64_GLOBALS.update_counter  # re-poses GPU skinned meshes
+            F64_GLOBALS.anim_cache.set_budget(scene.f64render.render_settings.anim_cache_size * 1024 * 1024)
+        edited_meshes = {update.id.name for update in depsgraph.updates if isinstance(update.id, bpy.types.Mesh)}
 
         for update in depsgraph.updates:
             if isinstance(update.id, bpy.types.Scene):
@@ -218,14 +292,15 @@ class Fast64RenderEngine(bpy.types.RenderEngine):
                         update.id.f3d_type,
                         update.id.gameEditorMode,
                     )
-                world_lighting = update.id.fast64.renderSettings.useWorldSpaceLighting
-                if world_lighting != F64_GLOBALS.world_lighting:
-                    F64_GLOBALS.world_lighting = world_lighting
-                    F64_GLOBALS.rebuild_shaders = True
-
-                F64_GLOBALS.clear_areas()  # reset area lookup to refresh initial render state, is this the best approach?
-            if isinstance(update.id, bpy.types.Material) and update.id in F64_GLOBALS.materials_cache:
-                F64_GLOBALS.materials_cache.pop(update.id)
+                F64_GLOBALS.scene_render_state = None  # refresh the initial render state of areas/rooms
+            if isinstance(update.id, bpy.types.Armature):  # bones renamed, removed or edited in rest pose
+                cache_del_by_armature(update.id.name)
+            if isinstance(update.id, bpy.types.World):
+                F64_GLOBALS.layer_rendermodes = None  # default draw layer rendermodes are stored in the world
+            if isinstance(update.id, bpy.types.Material):
+                if update.id in F64_GLOBALS.materials_cache:
+                    F64_GLOBALS.materials_cache.pop(update.id)
+                F64_GLOBALS.collision_cache.clear()  # collision types are material properties
             is_obj_update = isinstance(update.id, bpy.types.Object)
 
             # support animating lights without uncaching materials, check if a light object was updated
@@ -235,20 +310,27 @@ class Fast64RenderEngine(bpy.types.RenderEngine):
                 f64_parse_obj_light(
                     F64_GLOBALS.obj_lights[update.id.name], update.id, materials_set_light_direction(depsgraph.scene)
                 )
+            if is_obj_update:
+                F64_GLOBALS.obj_updates[update.id.name] = F64_GLOBALS.update_counter  # see get_pose_update
+                F64_GLOBALS.update_obj_hierarchy(update.id)
+                F64_GLOBALS.sm64_area_bounds.invalidate(update.id.name)
+                F64_GLOBALS.oot_room_bounds.invalidate(update.id.name)
             if is_obj_update and update.id.type in {"MESH", "CURVE", "SURFACE", "FONT"}:
-                F64_GLOBALS.clear_areas()
                 if update.is_updated_geometry:
-                    cache_del_by_mesh(update.id.data.name)
+                    mesh_name = update.id.data.name
+                    cache_del_by_mesh(mesh_name, frame_change, keep_skinned=mesh_name not in edited_meshes)
+
+    @bpy.app.handlers.persistent
+    def frame_change_listener(scene, depsgraph):
+        Fast64RenderEngine.mesh_change_listener(scene, depsgraph, frame_change=True)
 
     @bpy.app.handlers.persistent
     def on_file_load(_context):
         F64_GLOBALS.clear()
 
     def view_update(self, context, depsgraph):
-        if self.draw_handler is None:
-            self.draw_handler = bpy.types.SpaceView3D.draw_handler_add(
-                self.draw_scene, (context, depsgraph), "WINDOW", "POST_VIEW"
-            )
+        F64_GLOBALS.update_counter += 1
+        FRAME_SCHEDULER.add_engine(self)
 
         # this causes the mesh to update during edit-mode
         for obj in depsgraph.objects:
@@ -256,16 +338,10 @@ class Fast64RenderEngine(bpy.types.RenderEngine):
                 meshID = obj.name + "#" + obj.data.name
                 if meshID in F64_GLOBALS.meshCache:
                     del F64_GLOBALS.meshCache[meshID]
+                F64_GLOBALS.collision_cache.pop(meshID, None)
 
     def view_draw(self, context, depsgraph):
-        self.draw_scene(context, depsgraph)
-        return  # uncomment to profile individual functions
-        from cProfile import Profile
-        from pstats import SortKey, Stats
-
-        with Profile() as profile:
-            self.draw_scene(context, depsgraph)
-            Stats(profile).strip_dirs().sort_stats(SortKey.CUMULATIVE).print_stats()
+        FRAME_SCHEDULER.view_draw(self, context, depsgraph)  # profiling: see sampling_profiler.py
 
     def draw_scene(self, context, depsgraph):
         # TODO: fixme, after reloading this script during dev, something calls this function
@@ -277,50 +353,71 @@ class Fast64RenderEngine(bpy.types.RenderEngine):
 
         space_view_3d = context.space_data
         f64render_rs: F64RenderSettings = depsgraph.scene.f64render.render_settings
-        always_set = f64render_rs.always_set
         projection_matrix, view_matrix = context.region_data.perspective_matrix, context.region_data.view_matrix
-        self.use_atomic_rendering = bpy.app.version >= (4, 1, 0) and f64render_rs.use_atomic_rendering
-
-        if F64_GLOBALS.rebuild_shaders or self.shader is None:
-            F64_GLOBALS.rebuild_shaders = False
-            self.init_shader(context.scene)
-
-        if self.use_atomic_rendering:
-            self.update_render_size(context.region.width, context.region.height)
-            self.color_texture.clear(format="UINT", value=[0x080808])
-            self.depth_texture.clear(format="INT", value=[0])
-
-        self.shader.bind()
-
-        # Enable depth test
-        gpu.state.depth_test_set("LESS")
-        gpu.state.depth_mask_set(True)
+        use_atomic_rendering = bpy.app.version >= (4, 1, 0) and f64render_rs.use_atomic_rendering
+
+        if depsgraph.scene.gameEditorMode in {"SM64", "OOT"} and f64render_rs.render_type == "COLLISION_VIEW":
+            hidden_objs = {
+                ob.name for ob in bpy.context.view_layer.objects if not ob.visible_get() and ob.data is not None
+            }
+            self.begin_gpu_frame()
+            draw_collision_scene(self, depsgraph, hidden_objs, space_view_3d, projection_matrix, view_matrix)
+            self.end_gpu_frame()
+            return
+        self.use_shader_variants = f64render_rs.use_shader_variants
+        # takes effect with the next frame, see FrameScheduler
+        PROFILER.enabled = f64render_rs.use_profiler
+        PROFILER.set_overlay(f64render_rs.use_profiler and f64render_rs.profiler_overlay)
+
+        if not self.prepare_shaders(depsgraph.scene, f64render_rs, use_atomic_rendering):
+            # nothing to draw with yet, compile right away and draw again
+            if SHADER_CACHE.compile_queued() or SHADER_CACHE.queue:  # shaders behind a failed one still need a frame
+                self.tag_redraw()
+            return
 
+        self.begin_gpu_frame()
+        frame_key = None
         if self.use_atomic_rendering:
-            self.shader.image("depth_texture", self.depth_texture)
-            self.shader.image("color_texture", self.color_texture)
-
-        gpu.state.depth_test_set("NONE")
-        gpu.state.depth_mask_set(False)
-        gpu.state.blend_set("NONE")
+            self.render_target = F64_GLOBALS.render_targets.get(context.region, f64render_rs.render_scale)
+            # Blender redraws the viewport for lots of reasons that don't affect our output (hover, overlays, ...)
+            # if none of the inputs changed, the retained color texture is still valid and only needs to be drawn
+            frame_key = (
+                projection_matrix.copy(),
+                view_matrix.copy(),
+                F64_GLOBALS.update_counter,
+                depsgraph.scene.gameEditorMode,
+                space_view_3d.local_view is not None,
+            )
+            if self.render_target.frame_key == frame_key:
+                self.draw_composite(f64render_rs.upscale_filter == "LINEAR")
+                self.end_gpu_frame()
+                return
+            self.render_target.clear(self.gpu)
+            # render targets may be smaller than the region, restrict rasterization to their size
+            viewport = gpu.state.viewport_get()
+            self.gpu.viewport_set(viewport[0], viewport[1], *self.render_target.size)
 
         # get visible objects, this cannot be done in despgraph objects for whatever reason
-        hidden_objs = {ob.name for ob in bpy.context.view_layer.objects if not ob.visible_get() and ob.data is not None}
-
-        self.last_used_textures.clear()
-        match depsgraph.scene.gameEditorMode:  # game mode implementations
-            case "SM64":
-                draw_sm64_scene(self, depsgraph, hidden_objs, space_view_3d, projection_matrix, view_matrix, always_set)
-            case "OOT":
-                draw_oot_scene(self, depsgraph, hidden_objs, space_view_3d, projection_matrix, view_matrix, always_set)
-            case _:
-                render_state = get_scene_render_state(depsgraph.scene)
-                for obj in depsgraph.objects:
-                    obj_info = collect_obj_info(
-                        self, obj, depsgraph, hidden_objs, space_view_3d, projection_matrix, view_matrix, always_set
-                    )
-                    if obj_info is not None:
-                        draw_f64_obj(self, render_state, obj_info)
+        with PROFILER.stage("hidden set"):
+            hidden_objs = {
+                ob.name for ob in bpy.context.view_layer.objects if not ob.visible_get() and ob.data is not None
+            }
+
+        self.draw_objects(depsgraph, hidden_objs, space_view_3d, projection_matrix, view_matrix, f64render_rs)
+        self.frame_stats = F64_GLOBALS.frame_stats = self.stats
+
+        if F64_GLOBALS.area_residency.reload_pending:  # meshes of newly resident areas are still being uploaded
+            F64_GLOBALS.update_counter += 1
+            self.tag_redraw()
+
+        if self.use_shader_variants:
+            self.shader_variants.end_frame()
+            self.shader_variants_opaque.end_frame()
+        if SHADER_CACHE.compile_queued() or SHADER_CACHE.queue:
+            self.tag_redraw()  # switch to the new shader on the next redraw
+        elif self.use_shader_variants:
+            self.shader_variants.compile_queued()
+            self.shader_variants_opaque.compile_queued()
 
         draw_time = (time.process_time() - t) * 1000
         self.time_total += draw_time
@@ -328,31 +425,215 @@ class Fast64RenderEngine(bpy.types.RenderEngine):
         # print("Time F3D (ms)", draw_time)
 
         if self.time_count > 20:
-            print("Time F3D AVG (ms)", self.time_total / self.time_count, self.time_count)
+            render_count, redundant_count = FRAME_SCHEDULER.pop_counts()
+            print(
+                "Time F3D AVG (ms)",
+                self.time_total / self.time_count,
+                self.time_count,
+                f"(renders: {render_count}, skipped redundant: {redundant_count})",
+            )
             self.time_total = 0
             self.time_count = 0
 
         if not self.use_atomic_rendering:
+            self.end_gpu_frame()
             return  # when there's no access to color and depth aux images, we render directly, so skip final 2d draw
 
-        # t = time.process_time()
-        gpu.state.face_culling_set("NONE")
-        gpu.state.blend_set("ALPHA")
-        gpu.state.depth_test_set("LESS")
-        gpu.state.depth_mask_set(False)
+        self.gpu.viewport_set(*viewport)
+        self.render_target.frame_key = frame_key
+        self.draw_composite(f64render_rs.upscale_filter == "LINEAR")
+        self.end_gpu_frame()
+
+    # all gpu calls of a frame go through 'self.gpu', recorded if a recording is running, see command_recorder.py
+    def begin_gpu_frame(self):
+        self.gpu = RECORDER.begin_frame(gpu.state.viewport_get()) if RECORDER.recording else DIRECT_BACKEND
+
+    def end_gpu_frame(self):
+        if self.gpu is not DIRECT_BACKEND:
+            RECORDER.end_frame()
+            self.gpu = DIRECT_BACKEND
+
+    def prepare_shaders(self, scene: bpy.types.Scene, f64render_rs: F64RenderSettings, use_atomic_rendering: bool):
+        if not self.update_shader(self.get_shader_key(scene, use_atomic_rendering)):
+            return False
+        # follows the shader in use, which may still be the previous one
+        self.use_atomic_rendering = "BLEND_EMULATION" in dict(self.shader_key)
+        self.shader_variants.set_base_key(self.shader_key)
+        self.shader_opaque = None
+        if self.use_atomic_rendering and f64render_rs.use_hybrid_rendering:
+            opaque_key = self.get_opaque_shader_key()
+            self.shader_opaque = SHADER_CACHE.get(opaque_key)  # until compiled, everything goes through atomics
+            self.shader_variants_opaque.set_base_key(opaque_key)
+        self.shader_skinned = None
+        if f64render_rs.use_gpu_skinning:
+            skinned_key = get_shader_key(dict(self.shader_key) | {"GPU_SKINNING": "1"})
+            self.shader_skinned = SHADER_CACHE.get(skinned_key)  # until compiled, meshes are deformed on the CPU
+            if self.shader_skinned is not None:
+                self.vbo_format_skinned = F64_GLOBALS.shared.get(
+                    ("vbo_format", skinned_key), self.shader_skinned.format_calc
+                )
+        return True
+
+    # records and submits all draw calls of a frame, shared by viewport and final renders
+    def draw_objects(
+        self,
+        depsgraph: bpy.types.Depsgraph,
+        hidden_objs: set[str],
+        space_view_3d: bpy.types.SpaceView3D,
+        projection_matrix: mathutils.Matrix,
+        view_matrix: mathutils.Matrix,
+        f64render_rs: F64RenderSettings,
+        final_render=False,
+    ):
+        always_set = f64render_rs.always_set
+        self.stats = FrameStats()
+
+        # Enable depth test
+        self.gpu.depth_test_set("LESS")
+        self.gpu.depth_mask_set(True)
 
-        self.init_shader_2d()
-        self.shader_2d.bind()
+        self.gpu.depth_test_set("NONE")
+        self.gpu.depth_mask_set(False)
+        self.gpu.blend_set("NONE")
 
-        # @TODO: why can't i cache this?
-        vbo_2d = gpu.types.GPUVertBuf(self.shader_2d.format_calc(), 6)
-        vbo_2d.attr_fill("pos", [(-1, -1), (-1, 1), (1, 1), (1, 1), (1, -1), (-1, -1)])
-        batch_2d = gpu.types.GPUBatch(type="TRIS", buf=vbo_2d)
+        # final renders can't continue on a later redraw, upload everything at once
+        use_residency = (
+            depsgraph.scene.gameEditorMode == "SM64" and f64render_rs.use_area_residency and not final_render
+        )
+        F64_GLOBALS.area_residency.begin_frame(RELOADS_PER_FRAME if use_residency else None)
 
-        self.shader_2d.image("color_texture", self.color_texture)
-        batch_2d.draw(self.shader_2d)
+        match depsgraph.scene.gameEditorMode:  # game mode implementations
+            case "SM64":
+                draw_sm64_scene(
+                    self,
+                    depsgraph,
+                    hidden_objs,
+                    space_view_3d,
+                    projection_matrix,
+                    view_matrix,
+                    always_set,
+                    final_render,
+                )
+            case "OOT":
+                draw_oot_scene(self, depsgraph, hidden_objs, space_view_3d, projection_matrix, view_matrix, always_set)
+            case _:
+                render_state = get_cached_scene_render_state(depsgraph.scene).copy()
+                obj_infos = []
+                with PROFILER.stage("collect"):
+                    for obj in depsgraph.objects:
+                        obj_info = collect_obj_info(self, obj, depsgraph, hidden_objs, space_view_3d, always_set)
+                        if obj_info is not None:
+                            obj_infos.append(obj_info)
+                self.obj_matrices.apply(obj_infos, projection_matrix, view_matrix)
+                with PROFILER.stage("record"):
+                    for obj_info in obj_infos:
+                        draw_f64_obj(self, render_state, obj_info)
 
-        # print("Time 2D (ms)", (time.process_time() - t) * 1000)
+        with PROFILER.stage("submit"):
+            self.submit_draw_calls()
+
+    # Final render (F12) and animation renders, drawn offscreen at the output resolution with the viewport pipeline.
+    # Meshes are converted from the render depsgraph (render modifier settings) and cached apart from the viewport's,
+    # materials are shared. Both are kept between animation frames.
+    def render(self, depsgraph):
+        scene = depsgraph.scene
+        f64render_rs: F64RenderSettings = scene.f64render.render_settings
+        if scene.camera is None:
+            self.report({"ERROR"}, "No camera to render from")
+            return
+        width, height = get_render_size(scene)
+        projection_matrix, view_matrix = get_camera_matrices(depsgraph, width, height)
+        use_atomic_rendering = bpy.app.version >= (4, 1, 0) and f64render_rs.use_atomic_rendering
+
+        # final renders can block, compile everything needed right away
+        self.prepare_shaders(scene, f64render_rs, use_atomic_rendering)
+        while SHADER_CACHE.queue:  # failed shaders are not queued again, keep going past them
+            SHADER_CACHE.compile_queued()
+            self.prepare_shaders(scene, f64render_rs, use_atomic_rendering)
+        if self.shader is None:
+            self.report({"ERROR"}, "Failed to compile the f64render shader")
+            return
+
+        offscreen = gpu.types.GPUOffScreen(width, height)
+        with offscreen.bind():
+            self.begin_gpu_frame()
+            self.gpu.viewport_set(0, 0, width, height)
+            if self.use_atomic_rendering:
+                self.render_target = self.final_render_target
+                self.render_target.resize(width, height)
+                self.render_target.clear(self.gpu)
+            else:
+                framebuffer = gpu.state.active_framebuffer_get()
+                self.gpu.framebuffer_clear(framebuffer, color=(*BACKGROUND_COLOR, 0.0), depth=1.0)
+            self.draw_objects(depsgraph, set(), FINAL_RENDER_VIEW, projection_matrix, view_matrix, f64render_rs, True)
+            self.end_gpu_frame()
+            if self.use_atomic_rendering:
+                pixels = unpack_color_texture(self.render_target.color_texture, width, height)
+            else:
+                pixels = read_color_texture(offscreen.texture_color, width, height)
+        offscreen.free()
+
+        if not scene.render.film_transparent:
+            pixels[..., 3] = 255
+        result = self.begin_result(0, 0, width, height)
+        result.layers[0].passes["Combined"].rect = pixels_to_linear(pixels).reshape(-1, 4)
+        self.end_result(result)
+
+        if f64render_rs.render_stream_dir:  # exact 8-bit output, independent of the color management settings
+            directory = bpy.path.abspath(f64render_rs.render_stream_dir)
+            FRAME_WRITER.submit(os.path.join(directory, f"{scene.frame_current:04d}.png"), pixels)
+        # last frame of the job, also flushed by the render_complete/render_cancel handlers, see final_render.py
+        if not self.is_animation or scene.frame_current + scene.frame_step > scene.frame_end:
+            FRAME_WRITER.flush()
+            cache_del_final_render()
+
+    def submit_draw_calls(self):
+        draw_calls, self.draw_calls = self.draw_calls, []
+        self.bound_shader = None
+        if self.shader_opaque is None:
+            submit_draw_calls(self, draw_calls, not self.use_atomic_rendering)
+            return
+
+        # Hybrid rendering: opaque materials first, using the hardware depth test and writing colors directly.
+        # Decals and blended materials follow with the atomic shader, testing against the depth image
+        # the opaque pass filled in.
+        viewport = gpu.state.viewport_get()
+        render_target = self.render_target
+        framebuffer = render_target.get_opaque_framebuffer()
+        with self.gpu.framebuffer_bind(framebuffer, render_target.hw_depth_texture, render_target.color_texture):
+            self.gpu.framebuffer_clear(framebuffer, depth=1.0)
+            self.gpu.blend_set("NONE")
+            submit_draw_calls(self, [call for call in draw_calls if call.hardware_depth], True, use_blend=False)
+        self.gpu.viewport_set(*viewport)
+
+        self.gpu.depth_test_set("NONE")
+        self.gpu.depth_mask_set(False)
+        self.gpu.blend_set("NONE")
+        self.bound_shader = None
+        submit_draw_calls(self, [call for call in draw_calls if not call.hardware_depth], False)
+
+    def draw_composite(self, linear_filter: bool):
+        with PROFILER.stage("composite"):
+            backend = self.gpu
+            backend.face_culling_set("NONE")
+            backend.blend_set("ALPHA")
+            backend.depth_test_set("LESS")
+            backend.depth_mask_set(False)
+
+            shader_2d, batch_2d = F64_GLOBALS.shared.get("shader_2d", create_shader_2d)
+            backend.bind(shader_2d)
+            backend.image(shader_2d, "color_texture", self.render_target.color_texture)
+            backend.uniform_int(shader_2d, "linearFilter", int(linear_filter))
+            backend.draw(batch_2d, shader_2d)
+            self.bound_shader = None
+
+
+# added by the first engine instance, removed with the last one, see SharedResources
+ENGINE_HANDLERS = (
+    ("depsgraph_update_post", Fast64RenderEngine.mesh_change_listener),
+    ("frame_change_post", Fast64RenderEngine.frame_change_listener),
+    ("load_pre", Fast64RenderEngine.on_file_load),
+)
 
 
 class F64RenderSettingsPanel(bpy.types.Panel):
@@ -387,7 +668,7 @@ def get_panels():
     include_panels = {"EEVEE_MATERIAL_PT_context_material", "MATERIAL_PT_preview"}
 
     panels = []
-    for panel in bpy.types.Panel.__subclasses__():
+    for panel in bpy.types.Panel.__subclasses__():  # slow with many addons, see PATCHED_PANELS
         if hasattr(panel, "COMPAT_ENGINES"):
             if (
                 "BLENDER_RENDER" in panel.COMPAT_ENGINES and panel.__name__ not in exclude_panels
@@ -397,9 +678,13 @@ def get_panels():
     return panels
 
 
+PATCHED_PANELS: list[type[bpy.types.Panel]] = []  # found once on register, reverted on unregister
+
+
 def register():
     bpy.types.RenderEngine.f64_render_engine = bpy.props.PointerProperty(type=Fast64RenderEngine)
-    for panel in get_panels():
+    PATCHED_PANELS[:] = get_panels()
+    for panel in PATCHED_PANELS:
         panel.COMPAT_ENGINES.add("FAST64_RENDER_ENGINE")
 
     bpy.types.Scene.f64render = bpy.props.PointerProperty(type=F64RenderProperties)
@@ -411,11 +696,14 @@ def register():
 
 def unregister():
     bpy.types.VIEW3D_HT_header.remove(draw_render_settings)
+    FRAME_SCHEDULER.remove_handler()
+    F64_GLOBALS.shared.free()
+    SHADER_CACHE.clear()
 
     del bpy.types.RenderEngine.f64_render_engine
 
-    for panel in get_panels():
-        if "FAST64_RENDER_ENGINE" in panel.COMPAT_ENGINES:
-            panel.COMPAT_ENGINES.remove("FAST64_RENDER_ENGINE")
+    for panel in PATCHED_PANELS:
+        panel.COMPAT_ENGINES.discard("FAST64_RENDER_ENGINE")
+    PATCHED_PANELS.clear()
 
     del bpy.types.Scene.f64render
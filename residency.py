@@ -0,0 +1,65 @@
+import math
+import typing
+import numpy as np
+
+if typing.TYPE_CHECKING:
+    from .mesh.mesh import MeshBuffers
+
+RELOADS_PER_FRAME = 8  # evicted meshes re-uploaded per redraw, spreads reloading an area over multiple redraws
+
+
+def get_bounds_distance(corners: np.ndarray, position: np.ndarray) -> float:
+    bounds_min, bounds_max = corners[:, :3].min(axis=0), corners[:, :3].max(axis=0)
+    return float(np.linalg.norm(np.maximum(0, np.maximum(bounds_min - position, position - bounds_max))))
+
+
+# Keeps the GPU buffers of SM64 areas resident within a memory budget.
+# Areas containing the camera (and the specific area) always stay resident, other areas are kept from nearest to
+# farthest until the budget is used up. Areas past the budget are not drawn and their VBOs/UBOs are freed,
+# the CPU side buffers stay in the mesh cache so reloading only needs to re-upload them.
+# Reloading is throttled, not asynchronous: GPU uploads can only happen on the draw thread, so an area that becomes
+# resident again is re-uploaded a few meshes per redraw and its meshes are not drawn until their upload ran.
+class AreaResidency:
+    def __init__(self):
+        self.area_meshes: dict[str, set[str]] = {}  # area name -> mesh cache keys seen in that area
+        self.uploads_left = math.inf
+        self.reload_pending = False
+
+    def begin_frame(self, upload_limit: int | None):
+        self.uploads_left = math.inf if upload_limit is None else upload_limit
+        self.reload_pending = False
+
+    def take_upload(self) -> bool:
+        if self.uploads_left <= 0:
+            self.reload_pending = True  # continue on the next redraw
+            return False
+        self.uploads_left -= 1
+        return True
+
+    def track(self, area_name: str, mesh_id: str):
+        self.area_meshes.setdefault(area_name, set()).add(mesh_id)
+
+    def get_area_size(self, area_name: str, mesh_cache: dict[str, "MeshBuffers"]) -> int:
+        mesh_ids = self.area_meshes.get(area_name, ())
+        return sum(mesh_cache[mesh_id].get_gpu_size() for mesh_id in mesh_ids if mesh_id in mesh_cache)
+
+    def evict(self, area_name: str, mesh_cache: dict[str, "MeshBuffers"]):
+        for mesh_id in self.area_meshes.get(area_name, ()):
+            render_obj = mesh_cache.get(mesh_id)
+            if render_obj is not None and render_obj.batch is not None:
+                render_obj.batch = render_obj.ubo_mat_data = None
+
+    # areas: area name -> distance to the camera, returns the areas to draw
+    def update(
+        self, areas: dict[str, float], protected: set[str], budget: int, mesh_cache: dict[str, "MeshBuffers"]
+    ) -> set[str]:
+        resident, total_size = set(), 0
+        for name, _distance in sorted(areas.items(), key=lambda item: (item[0] not in protected, item[1])):
+            size = self.get_area_size(name, mesh_cache)
+            if name in protected or total_size + size <= budget:
+                resident.add(name)
+                total_size += size
+        for name in self.area_meshes:
+            if name not in resident:
+                self.evict(name, mesh_cache)
+        return resident
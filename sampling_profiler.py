@@ -0,0 +1,165 @@
+import collections
+import cProfile
+import contextlib
+import os
+import pstats
+import sys
+import threading
+import time
+
+import bpy
+
+SAMPLE_INTERVAL = 0.001  # seconds, the actual rate is limited by the GIL switch interval
+NULL_FRAME = contextlib.nullcontext()
+
+
+def get_frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def get_collapsed_stack(frame) -> str:
+    labels = []
+    while frame is not None:
+        labels.append(get_frame_label(frame))
+        frame = frame.f_back
+    return ";".join(reversed(labels))
+
+
+class SamplingFrame:
+    __slots__ = ("profiler",)
+
+    def __init__(self, profiler: "SamplingProfiler"):
+        self.profiler = profiler
+
+    def __enter__(self):
+        profiler = self.profiler
+        if profiler.mode == "DETERMINISTIC":
+            profiler.profile.enable()
+        else:
+            profiler.draw_thread = threading.get_ident()
+            profiler.in_frame = True
+
+    def __exit__(self, *_args):
+        profiler = self.profiler
+        if profiler.mode == "DETERMINISTIC":
+            profiler.profile.disable()
+        else:
+            profiler.in_frame = False
+        profiler.frames_done += 1
+        if profiler.frame_count and profiler.frames_done >= profiler.frame_count:
+            profiler.stop()
+
+
+# Profiles drawn frames, either by sampling the stacks of the draw thread from a background thread (low overhead,
+# usable over many frames) or deterministically with cProfile for a fixed number of frames.
+# Results are written on stop: collapsed stacks (flame graph input) for sampling, a pstats dump for cProfile,
+# and a sorted text report for both.
+# Usable from Python: SAMPLING_PROFILER.start("/tmp/f64prof", "SAMPLING", 600) ... SAMPLING_PROFILER.stop()
+class SamplingProfiler:
+    def __init__(self):
+        self.running = False
+        self.mode = "SAMPLING"
+        self.directory = ""
+        self.frame_count = 0  # 0: until stopped
+        self.frames_done = 0
+        self.in_frame = False
+        self.draw_thread: int | None = None
+        self.samples: collections.Counter[str] = collections.Counter()
+        self.profile: cProfile.Profile | None = None
+        self.thread: threading.Thread | None = None
+        self.start_time = 0.0
+
+    def frame(self):
+        return SamplingFrame(self) if self.running else NULL_FRAME
+
+    def start(self, directory: str, mode: str = "SAMPLING", frame_count: int = 0):
+        if self.running:
+            self.stop()
+        self.mode, self.directory, self.frame_count = mode, directory, frame_count
+        self.frames_done, self.in_frame = 0, False
+        self.samples.clear()
+        self.start_time = time.perf_counter()
+        if mode == "DETERMINISTIC":
+            self.profile = cProfile.Profile()
+        else:
+            self.thread = threading.Thread(target=self.sample_loop, name="f64render sampler", daemon=True)
+        self.running = True
+        if self.thread is not None:
+            self.thread.start()
+
+    def stop(self):
+        if not self.running:
+            return
+        self.running = False
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        os.makedirs(self.directory, exist_ok=True)
+        if self.mode == "DETERMINISTIC":
+            self.write_pstats()
+            self.profile = None
+        else:
+            self.write_samples()
+        print(f"Profiled {self.frames_done} frames into {self.directory}")
+
+    def sample_loop(self):
+        while self.running:
+            time.sleep(SAMPLE_INTERVAL)
+            if not self.in_frame:
+                continue
+            frame = sys._current_frames().get(self.draw_thread)
+            if frame is not None:
+                self.samples[get_collapsed_stack(frame)] += 1
+
+    def write_samples(self):
+        with open(os.path.join(self.directory, "f64render.collapsed"), "w", encoding="utf-8") as f:
+            for stack, count in self.samples.most_common():
+                f.write(f"{stack} {count}\n")
+
+        total, own = collections.Counter(), collections.Counter()
+        for stack, count in self.samples.items():
+            labels = stack.split(";")
+            own[labels[-1]] += count
+            for label in set(labels):
+                total[label] += count
+        sample_count = max(sum(self.samples.values()), 1)
+        with open(os.path.join(self.directory, "f64render_samples.txt"), "w", encoding="utf-8") as f:
+            f.write(f"{sample_count} samples over {self.frames_done} frames\n\n")
+            f.write(f"{'total %':>8} {'own %':>8}  function\n")
+            for label, count in total.most_common():
+                f.write(f"{count / sample_count * 100:8.2f} {own[label] / sample_count * 100:8.2f}  {label}\n")
+
+    def write_pstats(self):
+        self.profile.dump_stats(os.path.join(self.directory, "f64render.prof"))
+        with open(os.path.join(self.directory, "f64render_pstats.txt"), "w", encoding="utf-8") as f:
+            f.write(f"{self.frames_done} frames\n")
+            stats = pstats.Stats(self.profile, stream=f).strip_dirs()
+            stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats()
+
+
+SAMPLING_PROFILER = SamplingProfiler()
+
+
+class F64RENDER_OT_toggle_sampling_profiler(bpy.types.Operator):
+    bl_idname = "f64render.toggle_sampling_profiler"
+    bl_label = "Toggle Code Profiler"
+    bl_description = "Starts profiling the drawn frames, or stops and writes the results to the output directory"
+
+    def execute(self, context):
+        if SAMPLING_PROFILER.running:
+            SAMPLING_PROFILER.stop()
+            self.report({"INFO"}, f"Profile written to {SAMPLING_PROFILER.directory}")
+            return {"FINISHED"}
+
+        f64render_rs = context.scene.f64render.render_settings
+        directory = bpy.path.abspath(f64render_rs.code_profile_dir)
+        if not directory:
+            self.report({"ERROR"}, "No output directory set")
+            return {"CANCELLED"}
+        SAMPLING_PROFILER.start(directory, f64render_rs.code_profile_mode, f64render_rs.code_profile_frames)
+        return {"FINISHED"}
+
+
+def unregister():
+    SAMPLING_PROFILER.stop()
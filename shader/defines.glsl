@@ -145,6 +145,11 @@
 #define DRAW_FLAG_DECAL        (1 << 0)
 #define DRAW_FLAG_ALPHA_BLEND  (1 << 1) // temporary, @TODO: proper blending emulation
 
+// CC flags (set when simplifying the combiner, see cc.py)
+#define CC_FLAG_TEX0_UNUSED        (1 << 0)
+#define CC_FLAG_TEX1_UNUSED        (1 << 1)
+#define CC_FLAG_CYCLE2_PASSTHROUGH (1 << 2)
+
 // Tex flags
 #define TEX_FLAG_MONO          (1 << 0)
 #define TEX_FLAG_4BIT          (1 << 1)
@@ -6,6 +6,17 @@
 
 #define DECAL_DEPTH_DELTA 100
 
+// Specialized shader variants bake the combiner and blender inputs in as constants (see shader_variants.py),
+// the uber-shader reads them from the material
+#ifndef CC_SPECIALIZED
+  #define CC0_COLOR material.cc0Color
+  #define CC0_ALPHA material.cc0Alpha
+  #define CC1_COLOR material.cc1Color
+  #define CC1_ALPHA material.cc1Alpha
+  #define BLENDER_CYCLE0 material.blender[0]
+  #define BLENDER_CYCLE1 material.blender[1]
+#endif
+
 vec3 cc_fetchColor(in int val, in vec4 shade, in vec4 comb, in float lodFraction, in vec4 texData0, in vec4 texData1)
 {
        if(val == CC_C_COMB       ) return comb.rgb;
@@ -84,18 +95,18 @@ vec4 blendColor(in vec4 oldColor, vec4 newColor)
   vec4 colorBlend = vec4(0.0); // @TODO
   vec4 colorFog = vec4(1.0, 0.0, 0.0, 1.0); // @TODO
 
-  vec4 P = blender_fetch(material.blender[0][0], colorBlend, colorFog, oldColor, newColor, vec4(0.0));
-  vec4 A = blender_fetch(material.blender[0][1], colorBlend, colorFog, oldColor, newColor, vec4(0.0));
-  vec4 M = blender_fetch(material.blender[0][2], colorBlend, colorFog, oldColor, newColor, A);
-  vec4 B = blender_fetch(material.blender[0][3], colorBlend, colorFog, oldColor, newColor, A);
+  vec4 P = blender_fetch(BLENDER_CYCLE0[0], colorBlend, colorFog, oldColor, newColor, vec4(0.0));
+  vec4 A = blender_fetch(BLENDER_CYCLE0[1], colorBlend, colorFog, oldColor, newColor, vec4(0.0));
+  vec4 M = blender_fetch(BLENDER_CYCLE0[2], colorBlend, colorFog, oldColor, newColor, A);
+  vec4 B = blender_fetch(BLENDER_CYCLE0[3], colorBlend, colorFog, oldColor, newColor, A);
 
   vec4 res = ((P * A) + (M * B)) / (A + B);
   res.a = gammaToLinear(newColor.aaa).r; // preserve for 'A_IN'
 
-  P = blender_fetch(material.blender[1][0], colorBlend, colorFog, oldColor, res, vec4(0.0));
-  A = blender_fetch(material.blender[1][1], colorBlend, colorFog, oldColor, res, vec4(0.0));
-  M = blender_fetch(material.blender[1][2], colorBlend, colorFog, oldColor, res, A);
-  B = blender_fetch(material.blender[1][3], colorBlend, colorFog, oldColor, res, A);
+  P = blender_fetch(BLENDER_CYCLE1[0], colorBlend, colorFog, oldColor, res, vec4(0.0));
+  A = blender_fetch(BLENDER_CYCLE1[1], colorBlend, colorFog, oldColor, res, vec4(0.0));
+  M = blender_fetch(BLENDER_CYCLE1[2], colorBlend, colorFog, oldColor, res, A);
+  B = blender_fetch(BLENDER_CYCLE1[3], colorBlend, colorFog, oldColor, res, A);
 
   return ((P * A) + (M * B)) / (A + B);
 }
@@ -157,33 +168,36 @@ void main()
   float lodFraction = 0.0;
   computeLOD(tex0Index, tex1Index, textLOD(), textDetail(), material.primLod.y, dx, dy, false, lodFraction);
 
-  vec4 texData0 = sampleIndex(tex0Index, inputUV, texFilter);
-  vec4 texData1 = sampleIndex(tex1Index, inputUV, texFilter);
+  // skip sampling textures the (simplified) combiner never reads
+  vec4 texData0 = vec4(0.0);
+  vec4 texData1 = vec4(0.0);
+  if ((material.ccFlags & CC_FLAG_TEX0_UNUSED) == 0) texData0 = sampleIndex(tex0Index, inputUV, texFilter);
+  if ((material.ccFlags & CC_FLAG_TEX1_UNUSED) == 0) texData1 = sampleIndex(tex1Index, inputUV, texFilter);
 
   // @TODO: emulate other formats, e.g. quantization?
 
-  cc0[0].rgb = cc_fetchColor(material.cc0Color.x, ccShade, ccValue, lodFraction, texData0, texData1);
-  cc0[1].rgb = cc_fetchColor(material.cc0Color.y, ccShade, ccValue, lodFraction, texData0, texData1);
-  cc0[2].rgb = cc_fetchColor(material.cc0Color.z, ccShade, ccValue, lodFraction, texData0, texData1);
-  cc0[3].rgb = cc_fetchColor(material.cc0Color.w, ccShade, ccValue, lodFraction, texData0, texData1);
+  cc0[0].rgb = cc_fetchColor(CC0_COLOR.x, ccShade, ccValue, lodFraction, texData0, texData1);
+  cc0[1].rgb = cc_fetchColor(CC0_COLOR.y, ccShade, ccValue, lodFraction, texData0, texData1);
+  cc0[2].rgb = cc_fetchColor(CC0_COLOR.z, ccShade, ccValue, lodFraction, texData0, texData1);
+  cc0[3].rgb = cc_fetchColor(CC0_COLOR.w, ccShade, ccValue, lodFraction, texData0, texData1);
 
-  cc0[0].a = cc_fetchAlpha(material.cc0Alpha.x, ccShade, ccValue, lodFraction, texData0, texData1);
-  cc0[1].a = cc_fetchAlpha(material.cc0Alpha.y, ccShade, ccValue, lodFraction, texData0, texData1);
-  cc0[2].a = cc_fetchAlpha(material.cc0Alpha.z, ccShade, ccValue, lodFraction, texData0, texData1);
-  cc0[3].a = cc_fetchAlpha(material.cc0Alpha.w, ccShade, ccValue, lodFraction, texData0, texData1);
+  cc0[0].a = cc_fetchAlpha(CC0_ALPHA.x, ccShade, ccValue, lodFraction, texData0, texData1);
+  cc0[1].a = cc_fetchAlpha(CC0_ALPHA.y, ccShade, ccValue, lodFraction, texData0, texData1);
+  cc0[2].a = cc_fetchAlpha(CC0_ALPHA.z, ccShade, ccValue, lodFraction, texData0, texData1);
+  cc0[3].a = cc_fetchAlpha(CC0_ALPHA.w, ccShade, ccValue, lodFraction, texData0, texData1);
 
   ccValue = cc_overflowValue((cc0[0] - cc0[1]) * cc0[2] + cc0[3]);
 
-  if (cycleType == G_CYC_2CYCLE) {
-    cc1[0].rgb = cc_fetchColor(material.cc1Color.x, ccShade, ccValue, lodFraction, texData0, texData1);
-    cc1[1].rgb = cc_fetchColor(material.cc1Color.y, ccShade, ccValue, lodFraction, texData0, texData1);
-    cc1[2].rgb = cc_fetchColor(material.cc1Color.z, ccShade, ccValue, lodFraction, texData0, texData1);
-    cc1[3].rgb = cc_fetchColor(material.cc1Color.w, ccShade, ccValue, lodFraction, texData0, texData1);
+  if (cycleType == G_CYC_2CYCLE && (material.ccFlags & CC_FLAG_CYCLE2_PASSTHROUGH) == 0) {
+    cc1[0].rgb = cc_fetchColor(CC1_COLOR.x, ccShade, ccValue, lodFraction, texData0, texData1);
+    cc1[1].rgb = cc_fetchColor(CC1_COLOR.y, ccShade, ccValue, lodFraction, texData0, texData1);
+    cc1[2].rgb = cc_fetchColor(CC1_COLOR.z, ccShade, ccValue, lodFraction, texData0, texData1);
+    cc1[3].rgb = cc_fetchColor(CC1_COLOR.w, ccShade, ccValue, lodFraction, texData0, texData1);
     
-    cc1[0].a = cc_fetchAlpha(material.cc1Alpha.x, ccShade, ccValue, lodFraction, texData0, texData1);
-    cc1[1].a = cc_fetchAlpha(material.cc1Alpha.y, ccShade, ccValue, lodFraction, texData0, texData1);
-    cc1[2].a = cc_fetchAlpha(material.cc1Alpha.z, ccShade, ccValue, lodFraction, texData0, texData1);
-    cc1[3].a = cc_fetchAlpha(material.cc1Alpha.w, ccShade, ccValue, lodFraction, texData0, texData1);
+    cc1[0].a = cc_fetchAlpha(CC1_ALPHA.x, ccShade, ccValue, lodFraction, texData0, texData1);
+    cc1[1].a = cc_fetchAlpha(CC1_ALPHA.y, ccShade, ccValue, lodFraction, texData0, texData1);
+    cc1[2].a = cc_fetchAlpha(CC1_ALPHA.z, ccShade, ccValue, lodFraction, texData0, texData1);
+    cc1[3].a = cc_fetchAlpha(CC1_ALPHA.w, ccShade, ccValue, lodFraction, texData0, texData1);
 
     ccValue = (cc1[0] - cc1[1]) * cc1[2] + cc1[3];
   }
@@ -204,6 +218,14 @@ void main()
   ivec2 screenPosPixel = ivec2(trunc(gl_FragCoord.xy));
 
   int currDepth = int(mixSelect(zSource() == G_ZS_PRIM, gl_FragCoord.w * 0xFFFFF, material.primDepth.x));
+
+#ifdef HARDWARE_DEPTH_PASS
+  // Hybrid rendering: opaque materials rely on the regular depth test and write their color directly,
+  // the depth image is still updated so that decals and blended materials drawn afterwards can test against it.
+  if(alphaTestFailed)discard;
+  imageAtomicMax(depth_texture, screenPosPixel, currDepth);
+  FragColorPacked = packUnorm4x8(vec4(ccValue.rgb, 1.0));
+#else
   int writeDepth = int(drawFlagSelect(DRAW_FLAG_DECAL, currDepth, -0xFFFFFF));
 
   if((DRAW_FLAGS & DRAW_FLAG_ALPHA_BLEND) != 0) {
@@ -247,6 +269,7 @@ void main()
   // but it will result in incoherent results (e.g. blocky artifacts due to depth related race-conditions)
   // This is most prominent on decals.
   discard;
+#endif
 #else
   if (alphaTestFailed) discard;
   if((DRAW_FLAGS & DRAW_FLAG_ALPHA_BLEND) == 0) {
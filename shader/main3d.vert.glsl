@@ -1,8 +1,30 @@
 
+#ifdef GPU_SKINNING
+mat4 boneMatrix(int slot) {
+  return mat4(
+    texelFetch(boneMatrices, ivec2(0, slot), 0),
+    texelFetch(boneMatrices, ivec2(1, slot), 0),
+    texelFetch(boneMatrices, ivec2(2, slot), 0),
+    texelFetch(boneMatrices, ivec2(3, slot), 0)
+  );
+}
+#endif
+
 void main() 
 {
-  // Directional light
+#ifdef GPU_SKINNING
+  mat4 skinMatrix = boneMatrix(inBoneIndices.x) * inBoneWeights.x
+                  + boneMatrix(inBoneIndices.y) * inBoneWeights.y
+                  + boneMatrix(inBoneIndices.z) * inBoneWeights.z
+                  + boneMatrix(inBoneIndices.w) * inBoneWeights.w;
+  vec3 posIn = (skinMatrix * vec4(pos, 1.0)).xyz;
+  vec3 norm = normalize(mat3(skinMatrix) * inNormal);
+#else
+  vec3 posIn = pos;
   vec3 norm = inNormal;
+#endif
+
+  // Directional light
   vec3 normScreen = normalize(matNorm * norm);
 
 #if VIEWSPACE_LIGHTING
@@ -35,7 +57,7 @@ void main()
   // @TODO: uvgen (f3d + t3d)
   // forward CC (@TODO: do part of this here? e.g. prim/env/shade etc.)
 
-  vec3 posQuant = pos;
+  vec3 posQuant = posIn;
   //posQuant = round(posQuant * 10) * 0.1;
   
   gl_Position = matMVP * vec4(posQuant, 1.0);
@@ -43,6 +43,7 @@ struct UBO_Material
   vec4 k0123;
   vec2 k45;
   uvec2 texSize;
+  int ccFlags; // padded to 16 bytes, see UNIFORM_BUFFER_STRUCT
 };
 
 #define GEO_MODE     material.modes.x
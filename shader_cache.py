@@ -0,0 +1,136 @@
+import functools
+import pathlib
+from io import StringIO
+
+import gpu
+
+ShaderKey = tuple[tuple[str, str], ...]  # sorted defines
+
+SHADER_PATH = (pathlib.Path(__file__).parent / "shader").resolve()
+
+
+def get_shader_key(defines: dict[str, str]) -> ShaderKey:
+    return tuple(sorted(defines.items()))
+
+
+@functools.cache
+def get_shader_sources() -> tuple[str, str, str]:  # vertex, fragment, structs
+    shaderVert = StringIO()
+    shaderFrag = StringIO()
+
+    general_shaders = ("utils.glsl", "defines.glsl")
+    vertex_shaders = ("main3d.vert.glsl",)
+    frag_shaders = (
+        "textures.glsl",
+        "main3d.frag.glsl",
+    )
+
+    for shader in general_shaders + vertex_shaders:
+        with open(SHADER_PATH / shader, "r", encoding="utf-8") as f:
+            shaderVert.write(f.read())
+            shaderVert.write("\n")
+    for shader in general_shaders + frag_shaders:
+        with open(SHADER_PATH / shader, "r", encoding="utf-8") as f:
+            shaderFrag.write(f.read())
+            shaderFrag.write("\n")
+
+    with open(SHADER_PATH / "structs.glsl", "r", encoding="utf-8") as f:
+        structs = f.read()
+
+    return shaderVert.getvalue(), shaderFrag.getvalue(), structs
+
+
+def create_shader(key: ShaderKey) -> gpu.types.GPUShader:
+    print("Compiling shader", key)
+    defines = dict(key)
+    use_atomic_rendering = "BLEND_EMULATION" in defines
+    vert_source, frag_source, structs = get_shader_sources()
+
+    shader_info = gpu.types.GPUShaderCreateInfo()
+    shader_info.typedef_source(structs)
+
+    # vertex -> fragment
+    vert_out = gpu.types.GPUStageInterfaceInfo("vert_interface")
+    vert_out.no_perspective("VEC4", "cc_shade")
+    vert_out.flat("VEC4", "cc_shade_flat")
+    vert_out.smooth("VEC2", "inputUV")
+    vert_out.no_perspective("VEC2", "posScreen")
+
+    for name, value in key:
+        shader_info.define(name, value)
+
+    shader_info.push_constant("MAT4", "matMVP")
+    shader_info.push_constant("MAT3", "matNorm")
+
+    shader_info.uniform_buf(0, "UBO_Material", "material")
+
+    shader_info.vertex_in(0, "VEC3", "pos")  # keep blenders name keep for better compat.
+    shader_info.vertex_in(1, "VEC3", "inNormal")
+    shader_info.vertex_in(2, "VEC4", "inColor")
+    shader_info.vertex_in(3, "VEC2", "inUV")
+    if "GPU_SKINNING" in defines:  # see mesh/skinning.py
+        shader_info.vertex_in(4, "IVEC4", "inBoneIndices")
+        shader_info.vertex_in(5, "VEC4", "inBoneWeights")
+    shader_info.vertex_out(vert_out)
+
+    for i in range(8):
+        shader_info.sampler(i, "FLOAT_2D", f"tex{i}")
+    if "GPU_SKINNING" in defines:
+        shader_info.sampler(8, "FLOAT_2D", "boneMatrices")
+
+    if use_atomic_rendering:
+        shader_info.image(2, "R32UI", "UINT_2D_ATOMIC", "color_texture", qualifiers={"READ", "WRITE"})
+        shader_info.image(3, "R32I", "INT_2D_ATOMIC", "depth_texture", qualifiers={"READ", "WRITE"})
+        if "HARDWARE_DEPTH_PASS" in defines:  # writes the packed color directly, see RenderTarget
+            shader_info.fragment_out(0, "UINT", "FragColorPacked")
+    else:
+        shader_info.fragment_out(0, "VEC4", "FragColor")
+
+    shader_info.vertex_source(vert_source)
+    shader_info.fragment_source(frag_source)
+
+    return gpu.shader.create_from_info(shader_info)
+
+
+# Process-wide cache of compiled shaders, keyed by their define set.
+# Blender can only compile shaders synchronously on the draw thread, so missing shaders are queued and
+# compiled after a frame was drawn (one per frame), while engines keep drawing with their previous shader.
+class ShaderCache:
+    def __init__(self):
+        self.shaders: dict[ShaderKey, gpu.types.GPUShader] = {}
+        self.queue: list[ShaderKey] = []
+        self.failed: set[ShaderKey] = set()  # don't retry broken shaders every frame
+
+    def get(self, key: ShaderKey) -> gpu.types.GPUShader | None:
+        shader = self.shaders.get(key)
+        if shader is None and key not in self.queue and key not in self.failed:
+            self.queue.append(key)
+        return shader
+
+    def get_or_compile(self, key: ShaderKey) -> gpu.types.GPUShader:
+        shader = self.shaders.get(key)
+        if shader is None:
+            shader = self.shaders[key] = create_shader(key)
+            if key in self.queue:
+                self.queue.remove(key)
+        return shader
+
+    def compile_queued(self) -> bool:
+        if not self.queue:
+            return False
+        key = self.queue.pop(0)
+        try:
+            self.shaders[key] = create_shader(key)
+        except Exception as e:
+            print(f"Error compiling shader: {e}")
+            self.failed.add(key)
+            return False
+        return True
+
+    def clear(self):
+        self.shaders.clear()
+        self.queue.clear()
+        self.failed.clear()
+
+
+SHADER_CACHE = ShaderCache()
@@ -0,0 +1,76 @@
+import numpy as np
+import gpu
+
+from .material.parser import BLENDER_CC_OFFSET, BLENDER_CC_SIZE, F64RenderState
+from .shader_cache import SHADER_CACHE, ShaderKey, get_shader_key
+
+VARIANT_USE_THRESHOLD = 32  # recent draws with the same combiner/blender before a variant is requested
+USE_COUNT_DECAY = 0.5  # use counts are scaled by this every frame, ~16 draws per frame keep a state above threshold
+MAX_VARIANTS = 64
+COMPILES_PER_FRAME = 1  # compiling is synchronous, spread the cost over multiple frames
+
+
+def get_variant_key(render_state: F64RenderState) -> bytes:
+    return render_state.cached_values.view(np.int32)[BLENDER_CC_OFFSET : BLENDER_CC_OFFSET + BLENDER_CC_SIZE].tobytes()
+
+
+def get_variant_defines(key: bytes) -> dict[str, str]:
+    values = np.frombuffer(key, dtype=np.int32)
+
+    def ivec4(start: int):
+        return f"ivec4({', '.join(str(x) for x in values[start : start + 4])})"
+
+    return {
+        "CC_SPECIALIZED": "1",
+        "BLENDER_CYCLE0": ivec4(0),
+        "BLENDER_CYCLE1": ivec4(4),
+        "CC0_COLOR": ivec4(8),
+        "CC0_ALPHA": ivec4(12),
+        "CC1_COLOR": ivec4(16),
+        "CC1_ALPHA": ivec4(20),
+    }
+
+
+# Fragment shader variants with the combiner and blender inputs baked in as defines.
+# Variants are only requested for states drawn frequently in recent frames and compiled lazily at the end of a frame,
+# until then the uber-shader is used.
+class ShaderVariants:
+    def __init__(self):
+        self.base_key: ShaderKey | None = None  # defines of the uber-shader the variants are based on
+        self.clear()
+
+    def clear(self):
+        self.variants: dict[bytes, gpu.types.GPUShader] = {}
+        self.use_counts: dict[bytes, float] = {}  # decayed draw counts, see end_frame
+        self.queue: list[bytes] = []
+
+    def set_base_key(self, base_key: ShaderKey):
+        if base_key != self.base_key:
+            self.base_key = base_key
+            self.clear()
+
+    def get(self, render_state: F64RenderState, fallback: gpu.types.GPUShader) -> gpu.types.GPUShader:
+        key = get_variant_key(render_state)
+        shader = self.variants.get(key)
+        if shader is not None:
+            return shader
+        self.use_counts[key] = self.use_counts.get(key, 0) + 1
+        return fallback
+
+    # requests variants for the most used states of the recent frames, then decays all counts
+    def end_frame(self):
+        free_slots = MAX_VARIANTS - len(self.variants) - len(self.queue)
+        frequent = [key for key, count in self.use_counts.items() if count >= VARIANT_USE_THRESHOLD]
+        frequent = [key for key in frequent if key not in self.variants and key not in self.queue]
+        frequent.sort(key=self.use_counts.get, reverse=True)
+        self.queue.extend(frequent[: max(free_slots, 0)])
+        self.use_counts = {key: count * USE_COUNT_DECAY for key, count in self.use_counts.items() if count >= 1}
+
+    def compile_queued(self):
+        for key in self.queue[:COMPILES_PER_FRAME]:
+            try:
+                shader_key = get_shader_key(dict(self.base_key) | get_variant_defines(key))
+                self.variants[key] = SHADER_CACHE.get_or_compile(shader_key)
+            except Exception as e:
+                print(f"Error compiling shader variant: {e}")
+        del self.queue[:COMPILES_PER_FRAME]
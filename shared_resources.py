@@ -0,0 +1,50 @@
+import typing
+
+import bpy
+
+
+# GPU resources and app handlers shared by all engine instances.
+# Blender creates engines per viewport and on every shading mode switch, so resources are created once on first use
+# and kept until the addon is unregistered (see free). Only the handlers are reference counted: they are added by the
+# first engine and removed with the last one.
+# Survives F64_GLOBALS.clear() on file load, the handlers stay registered while engines are alive.
+class SharedResources:
+    def __init__(self):
+        self.resources: dict[typing.Hashable, typing.Any] = {}
+        self.engine_count = 0
+        self.handlers: tuple[tuple[str, typing.Callable], ...] = ()  # bpy.app.handlers list name, function
+
+    def get(self, name: typing.Hashable, create: typing.Callable[[], typing.Any]):
+        resource = self.resources.get(name)
+        if resource is None:
+            resource = self.resources[name] = create()
+        return resource
+
+    def acquire(self, handlers: tuple[tuple[str, typing.Callable], ...]):
+        self.engine_count += 1
+        if self.engine_count == 1:
+            self.handlers = handlers
+            self.add_handlers()
+
+    def release(self):
+        self.engine_count = max(0, self.engine_count - 1)
+        if self.engine_count == 0:
+            self.remove_handlers()
+
+    def add_handlers(self):  # also used to restore them, in case they were dropped
+        for handler_name, func in self.handlers:
+            handler_list = getattr(bpy.app.handlers, handler_name)
+            if func not in handler_list:
+                handler_list.append(func)
+
+    def remove_handlers(self):
+        for handler_name, func in self.handlers:
+            handler_list = getattr(bpy.app.handlers, handler_name)
+            while func in handler_list:
+                handler_list.remove(func)
+        self.handlers = ()
+
+    def free(self):
+        self.remove_handlers()
+        self.resources.clear()
+        self.engine_count = 0
@@ -3,67 +3,84 @@ from typing import NamedTuple
 
 import bpy
 import mathutils
+import numpy as np
 
 from .material.parser import parse_f3d_rendermode_preset, F64RenderState
-from .common import ObjRenderInfo, draw_f64_obj, collect_obj_info, get_scene_render_state
+from .common import ObjRenderInfo, draw_f64_obj, collect_obj_info, get_cached_scene_render_state
+from .utils.hierarchy import get_children_map, get_hierarchy_signature
+from .utils.matrix import matrix_to_np
+from .residency import get_bounds_distance
+from .profiler import PROFILER
 from .properties import F64RenderSettings
 from .globals import F64_GLOBALS
 
 
 class AreaRenderInfo(NamedTuple):  # areas, etc
-    render_state: F64RenderState
     name: str
 
-    def __hash__(self):
-        return hash(self.name)
 
-
-def get_sm64_area_childrens(scene: bpy.types.Scene):
+def get_sm64_area_childrens():
     if F64_GLOBALS.sm64_area_lookup is not None:
         return F64_GLOBALS.sm64_area_lookup
 
     sm64_area_lookup = {}
-    render_state = get_scene_render_state(scene)
+    children = get_children_map(bpy.data.objects)
     level_objs: list[bpy.types.Object] = []
-    area_objs: list[bpy.types.Object] = []
+    area_names: set[str] = set()
 
     def get_area_children(obj: bpy.types.Object, name: str = ""):
-        for child in sorted(obj.children, key=lambda item: item.name):
-            if child not in area_objs:
-                sm64_area_lookup[child.name] = AreaRenderInfo(render_state, name)
+        for child in children.get(obj.name, ()):
+            if child.name not in area_names:
+                sm64_area_lookup[child.name] = AreaRenderInfo(name)
                 get_area_children(child, name)
             else:
                 get_area_children(child, child.name)
 
     def get_level_children(obj: bpy.types.Object, name: str):
-        for child in sorted(obj.children, key=lambda item: item.name):
-            if child in area_objs:
+        for child in children.get(obj.name, ()):
+            if child.name in area_names:
                 get_area_children(child, child.name)
             else:
-                sm64_area_lookup[child.name] = AreaRenderInfo(render_state, name)
+                sm64_area_lookup[child.name] = AreaRenderInfo(name)
                 get_level_children(child, name)
 
     for obj in bpy.data.objects:  # find all area type objects
-        if obj.type == "EMPTY" and obj.sm64_obj_type == "Area Root":
-            area_objs.append(obj)
         if obj.type == "EMPTY":
             if obj.sm64_obj_type == "Level Root":
                 level_objs.append(obj)
             if obj.sm64_obj_type == "Area Root":
-                area_objs.append(obj)
+                area_names.add(obj.name)
 
     for level_obj in level_objs:
         get_level_children(level_obj, level_obj.name)
 
-    fake_area = AreaRenderInfo(render_state, "")
+    fake_area = AreaRenderInfo("")
     for obj in bpy.data.objects:
         if obj.name not in sm64_area_lookup:
             sm64_area_lookup[obj.name] = fake_area
 
     F64_GLOBALS.sm64_area_lookup = sm64_area_lookup
+    F64_GLOBALS.sm64_area_bounds.clear_groups()  # area members may have changed
+    F64_GLOBALS.obj_hierarchy = {obj.name: get_hierarchy_signature(obj) for obj in bpy.data.objects}
     return sm64_area_lookup
 
 
+def get_resident_areas(
+    area_objs: dict[AreaRenderInfo, list[bpy.types.Object]],
+    view_matrix: mathutils.Matrix,
+    specific_area: str | None,
+    budget_mb: int,
+) -> set[str]:
+    camera_pos = np.linalg.inv(matrix_to_np(view_matrix))[:3, 3]
+    distances, protected = {}, {specific_area} if specific_area else set()
+    for area, objs in area_objs.items():
+        corners = F64_GLOBALS.sm64_area_bounds.get(area.name, objs)
+        distance = distances[area.name] = 0.0 if corners is None else get_bounds_distance(corners, camera_pos)
+        if distance == 0.0:  # area under the camera
+            protected.add(area.name)
+    return F64_GLOBALS.area_residency.update(distances, protected, budget_mb * 1024 * 1024, F64_GLOBALS.meshCache)
+
+
 # TODO if porting to fast64, reuse existing default layer dict
 DEFAULT_LAYERS = (
     ("G_RM_ZB_OPA_SURF", "G_RM_ZB_OPA_SURF2"),
@@ -77,6 +94,26 @@ DEFAULT_LAYERS = (
 )
 
 
+# cached until the world changes, see mesh_change_listener
+def get_sm64_layer_rendermodes(world: bpy.types.World | None) -> dict[int, F64RenderState]:
+    key = ("SM64", world.name if world else None)
+    if F64_GLOBALS.layer_rendermodes is not None and F64_GLOBALS.layer_rendermodes_key == key:
+        return F64_GLOBALS.layer_rendermodes
+
+    layer_rendermodes = {}
+    for layer, (cycle1, cycle2) in enumerate(DEFAULT_LAYERS):
+        if world:
+            cycle1, cycle2 = (getattr(world, f"draw_layer_{layer}_cycle_{cycle}") for cycle in (1, 2))
+        rm_state = F64RenderState()
+        rm_state.set_from_rendermode(parse_f3d_rendermode_preset(cycle1, cycle2))
+        rm_state.save_cache()
+        layer_rendermodes[layer] = rm_state
+
+    F64_GLOBALS.layer_rendermodes, F64_GLOBALS.layer_rendermodes_key = layer_rendermodes, key
+    F64_GLOBALS.layer_base_states = None
+    return layer_rendermodes
+
+
 def draw_sm64_scene(
     render_engine: "Fast64RenderEngine",
     depsgraph: bpy.types.Depsgraph,
@@ -85,39 +122,49 @@ def draw_sm64_scene(
     projection_matrix: mathutils.Matrix,
     view_matrix: mathutils.Matrix,
     always_set: bool,
+    final_render=False,
 ):
     f64render_rs: F64RenderSettings = depsgraph.scene.f64render.render_settings
 
-    layer_rendermodes = {}  # TODO: should this be cached globally?
-    world = depsgraph.scene.world
-    for layer, (cycle1, cycle2) in enumerate(DEFAULT_LAYERS):
-        if world:
-            cycle1, cycle2 = (getattr(world, f"draw_layer_{layer}_cycle_{cycle}") for cycle in (1, 2))
-        rm_state = F64RenderState()
-        rm_state.set_from_rendermode(parse_f3d_rendermode_preset(cycle1, cycle2))
-        rm_state.save_cache()
-        layer_rendermodes[layer] = rm_state
-
+    layer_rendermodes = get_sm64_layer_rendermodes(depsgraph.scene.world)
     ignore, collision = f64render_rs.render_type == "IGNORE", f64render_rs.render_type == "COLLISION"
     specific_area = f64render_rs.sm64_specific_area.name if f64render_rs.sm64_specific_area else None
-    area_lookup = get_sm64_area_childrens(depsgraph.scene)
+    with PROFILER.stage("area lookup"):
+        area_lookup = get_sm64_area_childrens()
     area_queue: dict[AreaRenderInfo, dict[int, dict[str, ObjRenderInfo]]] = {}
+    area_objs: dict[AreaRenderInfo, list[bpy.types.Object]] = {}
+    obj_infos: list[tuple[AreaRenderInfo, ObjRenderInfo]] = []
 
     for obj in depsgraph.objects:
         obj_name = obj.name
-        area = area_lookup[obj_name]
-        if (
-            (ignore and obj.ignore_render)
-            or (collision and obj.ignore_collision)
-            or (specific_area and area.name != specific_area)
-        ):
-            continue
-        obj_info = collect_obj_info(
-            render_engine, obj, depsgraph, hidden_objs_names, space_view_3d, projection_matrix, view_matrix, always_set
-        )
-        if obj_info is None:
-            continue
-
+        area = area_lookup.get(obj_name)
+        if area is None:  # added without an update we could track
+            F64_GLOBALS.clear_areas()
+            area_lookup = get_sm64_area_childrens()
+            area = area_lookup[obj_name]
+        area_objs.setdefault(area, []).append(obj)
+
+    use_residency = f64render_rs.use_area_residency and not final_render  # final renders show every area
+    if use_residency:
+        with PROFILER.stage("residency"):
+            resident_areas = get_resident_areas(area_objs, view_matrix, specific_area, f64render_rs.residency_budget)
+
+    with PROFILER.stage("collect"):
+        for area, objs in area_objs.items():
+            if (specific_area and area.name != specific_area) or (use_residency and area.name not in resident_areas):
+                continue
+            for obj in objs:
+                if (ignore and obj.ignore_render) or (collision and obj.ignore_collision):
+                    continue
+                obj_info = collect_obj_info(render_engine, obj, depsgraph, hidden_objs_names, space_view_3d, always_set)
+                if obj_info is not None:
+                    obj_infos.append((area, obj_info))
+                    if use_residency:
+                        F64_GLOBALS.area_residency.track(area.name, f"{obj.name}#{obj.data.name}")
+    render_engine.obj_matrices.apply([info for _, info in obj_infos], projection_matrix, view_matrix)
+
+    for area, obj_info in obj_infos:
+        obj_name = obj_info.obj.name
         layer_queue = area_queue.setdefault(area, {})  # if area has no queue, create it
         for mat_info in obj_info.mats:
             mat = mat_info[2]
@@ -127,9 +174,11 @@ def draw_sm64_scene(
                 obj_info.mats = []
             obj_queue[obj_name].mats.append(mat_info)
 
-    for area, layer_queue in area_queue.items():
-        render_state = area.render_state.copy()
-        for layer, obj_queue in sorted(layer_queue.items(), key=lambda item: item[0]):  # sort by layer
-            render_state.set_values_from_cache(layer_rendermodes[layer])
-            for info in dict(sorted(obj_queue.items(), key=lambda item: item[0])):  # sort by obj name
-                draw_f64_obj(render_engine, render_state, obj_queue[info])
+    scene_render_state = get_cached_scene_render_state(depsgraph.scene)
+    with PROFILER.stage("record"):
+        for area, layer_queue in area_queue.items():
+            render_state = scene_render_state.copy()
+            for layer, obj_queue in sorted(layer_queue.items(), key=lambda item: item[0]):  # sort by layer
+                render_state.set_values_from_cache(layer_rendermodes[layer])
+                for info in dict(sorted(obj_queue.items(), key=lambda item: item[0])):  # sort by obj name
+                    draw_f64_obj(render_engine, render_state, obj_queue[info])
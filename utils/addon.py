@@ -1,14 +1,20 @@
+import functools
 import sys
 import pathlib
 import addon_utils
 
 
-# Searches for fast64 and appends it to sys.path to allow importing functions
-def addon_set_fast64_path():
+@functools.cache
+def find_fast64_path() -> str:  # addon_utils.modules() scans the addon directories, only do it once per session
     for mod in addon_utils.modules():
         if mod.bl_info.get("name") == "Fast64":
-            f64_path = pathlib.Path(mod.__file__).parent
-            sys.path.append(str(f64_path))
-            return
+            return str(pathlib.Path(mod.__file__).parent)
 
     raise RuntimeError("Fast64 not found")
+
+
+# Searches for fast64 and appends it to sys.path to allow importing functions
+def addon_set_fast64_path():
+    f64_path = find_fast64_path()
+    if f64_path not in sys.path:
+        sys.path.append(f64_path)
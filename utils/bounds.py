@@ -0,0 +1,66 @@
+import numpy as np
+
+import bpy
+
+from .matrix import matrix_to_np
+
+BOX_CORNERS = np.array([(x, y, z) for x in (0, 1) for y in (0, 1) for z in (0, 1)], dtype=bool)
+
+
+def get_world_bounds(obj: bpy.types.Object) -> np.ndarray | None:  # (min, max)
+    if obj.type not in {"MESH", "CURVE", "SURFACE", "FONT"} or obj.data is None:
+        return None
+    corners = np.array([(*corner, 1) for corner in obj.bound_box], dtype=np.float32)
+    corners = (corners @ matrix_to_np(obj.matrix_world).T)[:, :3]
+    return np.array((corners.min(axis=0), corners.max(axis=0)))
+
+
+def bounds_to_corners(bounds: np.ndarray) -> np.ndarray:
+    corners = np.where(BOX_CORNERS, bounds[1], bounds[0])
+    return np.hstack((corners, np.ones((8, 1), dtype=np.float32))).astype(np.float32)
+
+
+# A box is only outside if all corners lie outside the same frustum plane,
+# unlike a min/max test in NDC this stays correct for boxes containing the camera
+def is_box_visible(corners: np.ndarray, mvp: np.ndarray) -> bool:
+    clip = corners @ mvp.T
+    w = clip[:, 3:]
+    return not (np.all(clip[:, :3] < -w, axis=0).any() or np.all(clip[:, :3] > w, axis=0).any())
+
+
+# World space bounds of groups of objects (e.g. OOT rooms), kept between frames.
+# Updating an object only recomputes its own bounds and the bounds of the group it was last seen in.
+class GroupBoundsCache:
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self.obj_bounds: dict[str, np.ndarray | None] = {}
+        self.clear_groups()
+
+    def clear_groups(self):
+        self.obj_groups: dict[str, str] = {}
+        self.group_corners: dict[str, np.ndarray | None] = {}
+
+    def invalidate(self, obj_name: str):
+        self.obj_bounds.pop(obj_name, None)
+        group = self.obj_groups.get(obj_name)
+        if group is not None:
+            self.group_corners.pop(group, None)
+
+    def get(self, group: str, objs: list[bpy.types.Object]) -> np.ndarray | None:
+        if group in self.group_corners:
+            return self.group_corners[group]
+        obj_bounds = []
+        for obj in objs:
+            self.obj_groups[obj.name] = group
+            if obj.name not in self.obj_bounds:
+                self.obj_bounds[obj.name] = get_world_bounds(obj)
+            if self.obj_bounds[obj.name] is not None:
+                obj_bounds.append(self.obj_bounds[obj.name])
+        corners = None
+        if obj_bounds:
+            obj_bounds = np.array(obj_bounds)
+            corners = bounds_to_corners(np.array((obj_bounds[:, 0].min(axis=0), obj_bounds[:, 1].max(axis=0))))
+        self.group_corners[group] = corners
+        return corners
@@ -0,0 +1,21 @@
+import bpy
+
+
+# Only parents and root types affect the SM64 area / OOT room lookups,
+# transform and mesh edits keep the signature and don't require a rebuild
+def get_hierarchy_signature(obj: bpy.types.Object) -> tuple:
+    parent_name = obj.parent.name if obj.parent is not None else None
+    if obj.type == "EMPTY":
+        return (parent_name, obj.sm64_obj_type, obj.ootEmptyType)
+    return (parent_name,)
+
+
+# 'Object.children' iterates all objects of the file on every access, gather them in a single pass instead
+def get_children_map(objs) -> dict[str, list[bpy.types.Object]]:
+    children: dict[str, list[bpy.types.Object]] = {}
+    for obj in objs:
+        if obj.parent is not None:
+            children.setdefault(obj.parent.name, []).append(obj)
+    for child_objs in children.values():
+        child_objs.sort(key=lambda item: item.name)
+    return children
@@ -0,0 +1,77 @@
+import typing
+import numpy as np
+
+if typing.TYPE_CHECKING:
+    from ..common import ObjRenderInfo
+
+STALE_ROW_LIMIT = 256  # rows of objects that are no longer drawn, compacted once exceeded
+
+
+def matrix_to_np(matrix) -> np.ndarray:
+    return np.array(matrix, dtype=np.float32)
+
+
+# Computes the MVP and normal matrices of all drawn objects in a single vectorized pass
+# Results are kept between frames in a row per object, rows are only recomputed if the object is new,
+# its world matrix changed or the view changed. Changing the set of drawn objects keeps all other rows,
+# a view change invalidates all of them so objects that weren't drawn meanwhile don't reuse an old view.
+class ObjMatrixCache:
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self.rows: dict[str, int] = {}  # object name -> row
+        self.world = np.empty((0, 4, 4), dtype=np.float32)
+        self.mvp = np.empty((0, 4, 4), dtype=np.float32)
+        self.normal = np.empty((0, 3, 3), dtype=np.float32)
+        self.projection: np.ndarray | None = None
+        self.view: np.ndarray | None = None
+
+    def grow(self, row_count: int):
+        added = row_count - len(self.world)
+        if added <= 0:
+            return
+        # NaN never compares equal, new rows are always recomputed
+        self.world = np.concatenate((self.world, np.full((added, 4, 4), np.nan, dtype=np.float32)))
+        self.mvp = np.concatenate((self.mvp, np.empty((added, 4, 4), dtype=np.float32)))
+        self.normal = np.concatenate((self.normal, np.empty((added, 3, 3), dtype=np.float32)))
+
+    # returns the row of each object
+    def update(self, objs: list, projection_matrix, view_matrix) -> np.ndarray:
+        if len(self.rows) > len(objs) + STALE_ROW_LIMIT:
+            self.clear()
+        projection, view = matrix_to_np(projection_matrix), matrix_to_np(view_matrix)
+        view_changed = (
+            self.projection is None
+            or not np.array_equal(projection, self.projection)
+            or not np.array_equal(view, self.view)
+        )
+        self.projection, self.view = projection, view
+        if view_changed:
+            self.world[:] = np.nan
+
+        # new objects get the next free row, the default is evaluated before the insertion
+        rows = np.fromiter((self.rows.setdefault(obj.name, len(self.rows)) for obj in objs), np.intp, len(objs))
+        self.grow(len(self.rows))
+
+        # all world matrices in a single array build, compared against the cached rows at once
+        world = np.array([obj.matrix_world for obj in objs], dtype=np.float32).reshape(-1, 4, 4)
+        dirty = np.flatnonzero(np.any(world != self.world[rows], axis=(1, 2)))
+        if len(dirty) == 0:
+            return rows
+
+        dirty_rows, dirty_world = rows[dirty], world[dirty]
+        self.world[dirty_rows] = dirty_world
+        self.mvp[dirty_rows] = projection @ dirty_world
+        modelview = (view @ dirty_world)[:, :3, :3]
+        try:
+            normal = np.linalg.inv(modelview)
+        except np.linalg.LinAlgError:  # zero-scaled objects, fall back to the pseudo-inverse
+            normal = np.linalg.pinv(modelview)
+        self.normal[dirty_rows] = normal.transpose(0, 2, 1)
+        return rows
+
+    def apply(self, infos: list["ObjRenderInfo"], projection_matrix, view_matrix):
+        rows = self.update([info.obj for info in infos], projection_matrix, view_matrix)
+        for info, row in zip(infos, rows):
+            info.mvp_matrix, info.normal_matrix = self.mvp[row], self.normal[row]